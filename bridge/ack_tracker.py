@@ -0,0 +1,206 @@
+"""
+ACK correlation for MeshCore Bridge
+Matches incoming ACK packets to recent messages by checksum and writes the
+acknowledgements back to the database in batches
+
+Only messages that some writer has stored in meshcore_message with their
+checksum can be matched. The bridge itself does not write messages (text
+messages are encrypted, so it can't compute their ACK checksums), so until
+a message writer exists every ACK is unmatched and unmatched_rate is
+reported as None while no message has been tracked. Correlation is
+therefore off by default (ACK_CORRELATION in the bridge): a disabled
+tracker never queries meshcore_message and only counts the ACKs it sees.
+"""
+import time
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AckTracker:
+    """
+    In-memory index of recent messages keyed by checksum
+
+    Messages are picked up from the meshcore_message table incrementally (by
+    id) and kept for `window` seconds. An ACK whose checksum matches a
+    tracked message marks it acknowledged; matches are written back in one
+    UPDATE per flush instead of one query per ACK.
+    """
+
+    def __init__(self, pool, window: int = 600, latency_samples: int = 1000, enabled: bool = True):
+        self.pool = pool
+        self.window = window
+        self.enabled = enabled
+
+        # checksum -> (message timestamp as epoch seconds, time tracked)
+        self._pending: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        # checksum -> time acknowledged, kept so flood copies of an ACK are not counted as unmatched
+        self._acked: 'OrderedDict[str, float]' = OrderedDict()
+        # checksum -> (acked_at, latency_ms) waiting to be written
+        self._to_write: Dict[str, Tuple[datetime, int]] = {}
+
+        self._last_message_id = 0
+        self._latencies = deque(maxlen=latency_samples)
+
+        self.stats_counters = {
+            'acks_received': 0,
+            'acks_matched': 0,
+            'acks_duplicate': 0,
+            'acks_unmatched': 0,
+            'messages_tracked': 0,
+            'db_updates': 0,
+            'flush_errors': 0,
+        }
+
+        if not enabled:
+            return
+        pool.prepare('ack_recent_messages', """(bigint, timestamptz) AS
+            SELECT id, checksum, timestamp
+            FROM meshcore_message
+            WHERE id > $1 AND timestamp >= $2
+              AND NOT is_acknowledged AND checksum <> ''
+            ORDER BY id
+            LIMIT 5000
+        """)
+        pool.prepare('ack_mark_messages', """(varchar[], timestamptz[], integer[], timestamptz) AS
+            UPDATE meshcore_message AS m
+            SET is_acknowledged = TRUE,
+                acked_at = a.acked_at,
+                ack_latency_ms = a.latency_ms
+            FROM unnest($1, $2, $3) AS a(checksum, acked_at, latency_ms)
+            WHERE m.checksum = a.checksum
+              AND m.timestamp >= $4
+              AND NOT m.is_acknowledged
+        """)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def register(self, checksum: str, timestamp: float, now: Optional[float] = None):
+        """Track a message so a later ACK can be matched to it"""
+        if not checksum or checksum in self._acked:
+            return
+        if checksum not in self._pending:
+            self.stats_counters['messages_tracked'] += 1
+        self._pending[checksum] = (timestamp, now or time.time())
+        self._pending.move_to_end(checksum)
+
+    def observe_ack(self, checksum: str, now: Optional[float] = None) -> bool:
+        """Match an incoming ACK; returns True if it acknowledged a tracked message"""
+        now = now or time.time()
+        self.stats_counters['acks_received'] += 1
+
+        entry = self._pending.pop(checksum, None)
+        if entry is None:
+            if checksum in self._acked:
+                self.stats_counters['acks_duplicate'] += 1
+            else:
+                self.stats_counters['acks_unmatched'] += 1
+            return False
+
+        sent_at, _ = entry
+        latency_ms = max(0, int((now - sent_at) * 1000))
+        self._latencies.append(latency_ms)
+        self._acked[checksum] = now
+        self._to_write[checksum] = (datetime.fromtimestamp(now, tz=timezone.utc), latency_ms)
+        self.stats_counters['acks_matched'] += 1
+        return True
+
+    def expire(self, now: Optional[float] = None):
+        """Drop entries older than the correlation window"""
+        cutoff = (now or time.time()) - self.window
+
+        # Both dicts are in insertion order, so stop at the first live entry
+        while self._pending:
+            checksum, (_, tracked_at) = next(iter(self._pending.items()))
+            if tracked_at >= cutoff:
+                break
+            self._pending.popitem(last=False)
+
+        while self._acked:
+            checksum, acked_at = next(iter(self._acked.items()))
+            if acked_at >= cutoff:
+                break
+            self._acked.popitem(last=False)
+
+    def refresh(self, now: Optional[float] = None):
+        """Pick up messages stored since the last refresh"""
+        if not self.enabled:
+            return 0
+        now = now or time.time()
+        since = datetime.fromtimestamp(now - self.window, tz=timezone.utc)
+
+        def query(conn):
+            cursor = conn.cursor()
+            self.pool.execute_prepared(cursor, 'ack_recent_messages', (self._last_message_id, since))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        try:
+            rows = self.pool.run(query)
+        except Exception as e:
+            logger.error(f"Error loading recent messages for ACK correlation: {e}")
+            return 0
+
+        for message_id, checksum, timestamp in rows:
+            self.register(checksum, timestamp.timestamp(), now)
+            self._last_message_id = max(self._last_message_id, message_id)
+        return len(rows)
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Write pending acknowledgements in a single UPDATE"""
+        if not self._to_write:
+            return 0
+
+        pending = self._to_write
+        self._to_write = {}
+
+        checksums = list(pending.keys())
+        acked_at = [value[0] for value in pending.values()]
+        latencies = [value[1] for value in pending.values()]
+        # ACKs older than the window can't match, so bound the scan
+        since = datetime.fromtimestamp((now or time.time()) - 2 * self.window, tz=timezone.utc)
+
+        def query(conn):
+            cursor = conn.cursor()
+            self.pool.execute_prepared(cursor, 'ack_mark_messages', (checksums, acked_at, latencies, since))
+            updated = cursor.rowcount
+            cursor.close()
+            return updated
+
+        try:
+            updated = self.pool.run(query)
+        except Exception as e:
+            logger.error(f"Error writing acknowledgements: {e}")
+            self.stats_counters['flush_errors'] += 1
+            for checksum, value in pending.items():
+                self._to_write.setdefault(checksum, value)
+            return 0
+
+        self.stats_counters['db_updates'] += 1
+        return updated
+
+    def stats(self) -> dict:
+        """ACK statistics for the bridge stats message"""
+        received = self.stats_counters['acks_received']
+        # With nothing to match against the rate says nothing about the network
+        measurable = received and self.stats_counters['messages_tracked']
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+        return {
+            **self.stats_counters,
+            'tracked_messages': len(self._pending),
+            'unmatched_rate': round(self.stats_counters['acks_unmatched'] / received, 4) if measurable else None,
+            'latency_ms_p50': percentile(50),
+            'latency_ms_p90': percentile(90),
+            'latency_ms_p99': percentile(99),
+        }
@@ -0,0 +1,93 @@
+"""
+Configuration change listener for MeshCore Bridge
+Waits on PostgreSQL LISTEN/NOTIFY so configuration changes apply immediately
+"""
+import time
+import select
+import logging
+import threading
+from typing import Callable
+
+import psycopg2
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+# Channel notified by the web application whenever BridgeConfiguration is saved
+CONFIG_CHANNEL = 'meshcore_config'
+
+
+class ConfigListener(threading.Thread):
+    """
+    Background thread holding a dedicated LISTEN connection
+
+    Calls `on_notify(payload)` for every notification received. The
+    connection is re-established with a growing back-off if it drops, and
+    `is_listening` tells the bridge whether it can rely on notifications or
+    must fall back to polling.
+    """
+
+    def __init__(self, db_config: dict, on_notify: Callable[[str], None], channel: str = CONFIG_CHANNEL):
+        super().__init__(daemon=True, name='config-listener')
+        self.db_config = db_config
+        self.on_notify = on_notify
+        self.channel = channel
+        self.is_listening = False
+        self.running = False
+        self.stats = {
+            'notifications': 0,
+            'reconnects': 0,
+        }
+
+    def _listen(self):
+        """Open the LISTEN connection"""
+        conn = psycopg2.connect(**self.db_config)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {self.channel}")
+        cursor.close()
+        return conn
+
+    def run(self):
+        self.running = True
+        backoff = 1
+
+        while self.running:
+            conn = None
+            try:
+                conn = self._listen()
+                self.is_listening = True
+                backoff = 1
+                logger.info(f"Listening for configuration changes on '{self.channel}'")
+
+                while self.running:
+                    # Wake up periodically so shutdown is noticed
+                    readable, _, _ = select.select([conn], [], [], 5)
+                    if not readable:
+                        continue
+
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.stats['notifications'] += 1
+                        self.on_notify(notify.payload)
+
+            except Exception as e:
+                if self.running:
+                    logger.warning(f"Configuration listener disconnected: {e}")
+            finally:
+                self.is_listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+            if self.running:
+                self.stats['reconnects'] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def stop(self):
+        """Stop listening"""
+        self.running = False
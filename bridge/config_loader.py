@@ -4,9 +4,10 @@ Reads configuration from PostgreSQL database
 """
 import os
 import logging
-import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from db_pool import DatabasePool
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,6 +16,12 @@ class ConfigLoader:
     
     def __init__(self):
         self.db_config = self._get_db_config()
+        # Persistent connections shared with the rest of the bridge
+        self.pool = DatabasePool(
+            self.db_config,
+            max_size=int(os.getenv('DB_POOL_SIZE', '4'))
+        )
+        self._prepare_statements()
         self.last_config_id = None
         self.last_updated = None
     
@@ -47,27 +54,42 @@ class ConfigLoader:
                 'port': os.getenv('DB_PORT', '5432')
             }
     
+    def _prepare_statements(self):
+        """Register the fixed configuration queries as prepared statements"""
+        self.pool.prepare('config_load', """AS
+            SELECT id, mqtt_broker, mqtt_port, mqtt_username, mqtt_password,
+                   mqtt_topic_prefix, mqtt_enabled, mqtt_connected,
+                   serial_port, serial_baud, serial_enabled, serial_connected,
+                   auto_acknowledge, store_packets, forward_to_mqtt,
+                   updated_at
+            FROM meshcore_bridgeconfiguration
+            ORDER BY id ASC
+            LIMIT 1
+        """)
+        self.pool.prepare('config_updated_at', """(bigint) AS
+            SELECT updated_at
+            FROM meshcore_bridgeconfiguration
+            WHERE id = $1
+        """)
+        self.pool.prepare('config_connection_status', """(boolean, boolean, bigint) AS
+            UPDATE meshcore_bridgeconfiguration
+            SET mqtt_connected = COALESCE($1, mqtt_connected),
+                serial_connected = COALESCE($2, serial_connected)
+            WHERE id = $3
+        """)
+    
     def load_config(self):
         """Load configuration from database"""
-        try:
-            conn = psycopg2.connect(**self.db_config)
+        def query(conn):
             cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
             # Get the first (and should be only) configuration record
-            cursor.execute("""
-                SELECT id, mqtt_broker, mqtt_port, mqtt_username, mqtt_password,
-                       mqtt_topic_prefix, mqtt_enabled, mqtt_connected,
-                       serial_port, serial_baud, serial_enabled, serial_connected,
-                       auto_acknowledge, store_packets, forward_to_mqtt,
-                       updated_at
-                FROM meshcore_bridgeconfiguration
-                ORDER BY id ASC
-                LIMIT 1
-            """)
-            
+            self.pool.execute_prepared(cursor, 'config_load')
             row = cursor.fetchone()
             cursor.close()
-            conn.close()
+            return row
+        
+        try:
+            row = self.pool.run(query)
             
             if row:
                 config = dict(row)
@@ -85,19 +107,15 @@ class ConfigLoader:
     
     def has_config_changed(self):
         """Check if configuration has been updated in database"""
-        try:
-            conn = psycopg2.connect(**self.db_config)
+        def query(conn):
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT updated_at
-                FROM meshcore_bridgeconfiguration
-                WHERE id = %s
-            """, (self.last_config_id,))
-            
+            self.pool.execute_prepared(cursor, 'config_updated_at', (self.last_config_id,))
             row = cursor.fetchone()
             cursor.close()
-            conn.close()
+            return row
+        
+        try:
+            row = self.pool.run(query)
             
             if row and row[0] != self.last_updated:
                 return True
@@ -130,30 +148,19 @@ class ConfigLoader:
     
     def update_connection_status(self, mqtt_connected=None, serial_connected=None):
         """Update connection status in database"""
-        try:
-            conn = psycopg2.connect(**self.db_config)
+        if (mqtt_connected is None and serial_connected is None) or not self.last_config_id:
+            return
+        
+        def query(conn):
             cursor = conn.cursor()
-            
-            updates = []
-            params = []
-            
-            if mqtt_connected is not None:
-                updates.append("mqtt_connected = %s")
-                params.append(mqtt_connected)
-            
-            if serial_connected is not None:
-                updates.append("serial_connected = %s")
-                params.append(serial_connected)
-            
-            if updates and self.last_config_id:
-                query = f"UPDATE meshcore_bridgeconfiguration SET {', '.join(updates)} WHERE id = %s"
-                params.append(self.last_config_id)
-                
-                cursor.execute(query, params)
-                conn.commit()
-            
+            self.pool.execute_prepared(
+                cursor, 'config_connection_status',
+                (mqtt_connected, serial_connected, self.last_config_id)
+            )
             cursor.close()
-            conn.close()
+        
+        try:
+            self.pool.run(query)
         
         except Exception as e:
             logger.error(f"Error updating connection status: {e}")
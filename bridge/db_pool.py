@@ -0,0 +1,205 @@
+"""
+Database connection pool for MeshCore Bridge
+Keeps a few persistent PostgreSQL connections open and shares them between
+the configuration loader and the bridge persistence code
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+
+class DatabasePool:
+    """
+    Small persistent connection pool with health checks and automatic reconnect
+
+    Connections that have been idle longer than `health_check_interval`
+    seconds are checked with a cheap `SELECT 1` before being handed out.
+    Connections that fail are discarded and replaced on the next checkout.
+    Fixed queries can be registered with prepare() and are then PREPAREd
+    once per connection and run with execute_prepared().
+    """
+
+    def __init__(self, db_config: dict, max_size: int = 4, health_check_interval: int = 30):
+        self.db_config = db_config
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = []  # (connection, last_used) pairs
+        self._prepared_on: Dict[int, set] = {}  # id(connection) -> prepared statement names
+        self._statements: Dict[str, str] = {}
+
+        self._stats = {
+            'handshakes': 0,
+            'reconnects': 0,
+            'health_checks': 0,
+            'queries': 0,
+            'query_errors': 0,
+            'query_time_ms_total': 0.0,
+            'query_time_ms_max': 0.0,
+        }
+
+    def prepare(self, name: str, sql: str):
+        """Register a fixed statement, e.g. prepare('get_row', '(bigint) AS SELECT ... WHERE id = $1')"""
+        self._statements[name] = sql
+
+    def _connect(self):
+        """Open a new connection (a full TCP and auth handshake)"""
+        conn = psycopg2.connect(**self.db_config)
+        self._stats['handshakes'] += 1
+        self._prepared_on[id(conn)] = set()
+        return conn
+
+    def _discard(self, conn):
+        """Close and forget a connection"""
+        self._prepared_on.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        """Check a pooled connection before reuse"""
+        if conn.closed:
+            return False
+        if time.time() - last_used < self.health_check_interval:
+            return True
+
+        self._stats['health_checks'] += 1
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self):
+        """Get a healthy connection, reusing an idle one when possible"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, last_used = self._idle.pop()
+                if self._is_healthy(conn, last_used):
+                    return conn
+                logger.info("Discarding stale database connection")
+                self._stats['reconnects'] += 1
+                self._discard(conn)
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn):
+        """Return a connection to the pool"""
+        with self._lock:
+            self._idle.append((conn, time.time()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with-block
+
+        The transaction is committed when the block succeeds and rolled back
+        when it raises. Broken connections are dropped instead of returned.
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._discard(conn)
+            self._slots.release()
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                self._slots.release()
+                raise
+            self._checkin(conn)
+            raise
+        else:
+            self._checkin(conn)
+
+    def run(self, func: Callable, retries: int = 1):
+        """
+        Run func(connection) inside a pooled transaction and time it
+
+        Connection-level failures (e.g. Postgres restarted) are retried on a
+        fresh connection, so callers never see a single dropped socket.
+        """
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with self.connection() as conn:
+                    result = func(conn)
+                self._record(started)
+                return result
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._stats['query_errors'] += 1
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                self._stats['reconnects'] += 1
+                logger.warning("Database connection lost, reconnecting...")
+            except Exception:
+                self._stats['query_errors'] += 1
+                raise
+
+    def execute_prepared(self, cursor, name: str, params: Optional[tuple] = None):
+        """Execute a registered statement, preparing it on this connection first if needed"""
+        conn = cursor.connection
+        prepared = self._prepared_on.setdefault(id(conn), set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} {self._statements[name]}")
+            prepared.add(name)
+
+        if params:
+            placeholders = ', '.join(['%s'] * len(params))
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def _record(self, started: float):
+        """Record query latency"""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats['queries'] += 1
+        self._stats['query_time_ms_total'] += elapsed_ms
+        self._stats['query_time_ms_max'] = max(self._stats['query_time_ms_max'], elapsed_ms)
+
+    def stats(self) -> dict:
+        """Pool statistics for the bridge stats message"""
+        queries = self._stats['queries']
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            **self._stats,
+            'query_time_ms_total': round(self._stats['query_time_ms_total'], 2),
+            'query_time_ms_max': round(self._stats['query_time_ms_max'], 2),
+            'query_time_ms_avg': round(self._stats['query_time_ms_total'] / queries, 2) if queries else 0.0,
+            'open_connections': len(self._prepared_on),
+            'idle_connections': idle,
+        }
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
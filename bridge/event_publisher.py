@@ -0,0 +1,83 @@
+"""
+Live event publisher for MeshCore Bridge
+Pushes status, packet and node events to Redis for the web app's live feed
+"""
+import time
+import json
+import logging
+from typing import Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Shared with the web app (apps/meshcore/live.py)
+EVENTS_CHANNEL = 'meshcore:events'
+EVENTS_STREAM = 'meshcore:events:log'
+
+# Appends the event to a capped stream (for Last-Event-ID resume) and
+# publishes it with the stream id in one round trip, so ids are assigned by
+# Redis and increase monotonically across every publisher
+PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[3], '*', 'event', ARGV[1], 'data', ARGV[2])
+redis.call('PUBLISH', KEYS[2], '{"id":"' .. id .. '","event":"' .. ARGV[1] .. '","data":' .. ARGV[2] .. '}')
+return id
+"""
+
+
+class EventPublisher:
+    """
+    Fire-and-forget publisher for the live feed
+
+    Publishing never blocks packet processing for long: commands use a short
+    socket timeout, and after a failure publishing is suspended for
+    `retry_interval` seconds and the events in between are dropped.
+    """
+
+    def __init__(self, url: Optional[str], stream_length: int = 1000, retry_interval: float = 30):
+        self.url = url
+        self.stream_length = stream_length
+        self.retry_interval = retry_interval
+        self._suspended_until = 0.0
+
+        self.stats = {
+            'published': 0,
+            'dropped': 0,
+            'errors': 0,
+        }
+
+        # The client is thread-safe and connects lazily
+        if url:
+            self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            self._script = self._client.register_script(PUBLISH_SCRIPT)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    def publish(self, event: str, data: dict) -> Optional[str]:
+        """Publish one event; returns its id, or None if it was dropped"""
+        if not self.url:
+            return None
+        if time.time() < self._suspended_until:
+            self.stats['dropped'] += 1
+            return None
+
+        try:
+            event_id = self._script(
+                keys=[EVENTS_STREAM, EVENTS_CHANNEL],
+                args=[event, json.dumps(data, separators=(',', ':'), default=str), self.stream_length],
+            )
+        except (redis.RedisError, OSError) as e:
+            logger.warning(f"Live event publishing suspended for {self.retry_interval}s: {e}")
+            self.stats['errors'] += 1
+            self.stats['dropped'] += 1
+            self._suspended_until = time.time() + self.retry_interval
+            return None
+
+        self.stats['published'] += 1
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+    def close(self):
+        if self.url:
+            self._client.close()
@@ -0,0 +1,138 @@
+"""
+Log ring buffer for MeshCore Bridge
+Keeps recent log records in memory and mirrors them to a Redis stream,
+where the web app tails them incrementally by sequence number
+"""
+import time
+import json
+import logging
+import threading
+from collections import deque
+from typing import List, Optional
+
+import redis
+
+# Shared with the web app (apps/meshcore/bridge_logs.py)
+LOGS_STREAM = 'meshcore:logs'
+LOGS_SEQUENCE = 'meshcore:logs:seq'
+
+# Numbers each record from a counter kept next to the stream and adds it
+# with stream id '<seq>-0', so sequence numbers keep increasing across
+# bridge restarts and a reader resumes with XRANGE from '(<seq>-0'
+APPEND_SCRIPT = """
+local seq = 0
+for i = 2, #ARGV do
+    seq = redis.call('INCR', KEYS[2])
+    redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], seq .. '-0', 'data', ARGV[i])
+end
+return seq
+"""
+
+
+class LogBuffer(logging.Handler):
+    """
+    Logging handler that keeps the last `capacity` records
+
+    emit() only appends to a bounded deque; a background thread writes new
+    records to Redis in batches every `flush_interval` seconds. While Redis
+    is unreachable records keep accumulating in the ring, so only the
+    oldest are lost if the outage outlasts the buffer.
+    """
+
+    def __init__(self, url: Optional[str], capacity: int = 2000, stream_length: int = 5000,
+                 flush_interval: float = 1.0, retry_interval: float = 30):
+        super().__init__()
+        self.url = url
+        self.stream_length = stream_length
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.setFormatter(logging.Formatter())
+
+        self._records = deque(maxlen=capacity)
+        self._seq = 0  # Local sequence of the last record emitted
+        self._mirrored = 0  # Local sequence of the last record written to Redis
+        self._running = False
+        self._thread = None
+        self._wakeup = threading.Event()
+
+        self.stats = {
+            'records': 0,
+            'mirrored': 0,
+            'dropped': 0,
+            'errors': 0,
+        }
+
+        if url:
+            self._client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+            self._script = self._client.register_script(APPEND_SCRIPT)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            message = record.getMessage()
+            if record.exc_info:
+                message = f"{message}\n{self.formatter.formatException(record.exc_info)}"
+            self._seq += 1
+            self._records.append((self._seq, {
+                'time': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'message': message,
+            }))
+            self.stats['records'] += 1
+        except Exception:
+            self.handleError(record)
+
+    def records(self, since: int = 0) -> List[dict]:
+        """Buffered records after local sequence number `since`"""
+        with self.lock:
+            return [{'seq': seq, **entry} for seq, entry in self._records if seq > since]
+
+    def install(self, logger: Optional[logging.Logger] = None):
+        """Attach to `logger` (the root logger by default)"""
+        (logger or logging.getLogger()).addHandler(self)
+
+    def start(self):
+        if not self.url or self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._mirror_loop, name='log-mirror', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._running:
+            self._running = False
+            self._wakeup.set()
+            self._thread.join(timeout=5)
+        if self.url:
+            self.mirror()
+            self._client.close()
+        super().close()
+
+    def mirror(self) -> bool:
+        """Write records not yet in Redis; returns False if Redis is unreachable"""
+        with self.lock:
+            pending = [(seq, entry) for seq, entry in self._records if seq > self._mirrored]
+            if pending and pending[0][0] > self._mirrored + 1:
+                # Rotated out of the ring before they could be written
+                self.stats['dropped'] += pending[0][0] - self._mirrored - 1
+        if not pending:
+            return True
+
+        try:
+            self._script(
+                keys=[LOGS_STREAM, LOGS_SEQUENCE],
+                args=[self.stream_length] + [json.dumps(entry, separators=(',', ':')) for _, entry in pending],
+            )
+        except (redis.RedisError, OSError):
+            # Not logged: that would only add another record to mirror
+            self.stats['errors'] += 1
+            return False
+
+        self._mirrored = pending[-1][0]
+        self.stats['mirrored'] += len(pending)
+        return True
+
+    def _mirror_loop(self):
+        while self._running:
+            delay = self.flush_interval if self.mirror() else self.retry_interval
+            self._wakeup.wait(delay)
@@ -10,7 +10,7 @@ import json
 import logging
 import serial
 import paho.mqtt.client as mqtt
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 import threading
 import queue
@@ -20,6 +20,12 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from meshcore_parser import MeshCoreParser, PayloadType, RouteType
 from config_loader import ConfigLoader
+from node_registry import NodeRegistry
+from ack_tracker import AckTracker
+from packet_store import PacketStore
+from config_listener import ConfigListener
+from event_publisher import EventPublisher
+from log_buffer import LogBuffer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,7 +37,8 @@ logger = logging.getLogger(__name__)
 class MeshCoreBridge:
     """Bridge between MeshCore (serial) and MQTT"""
     
-    def __init__(self):
+    def __init__(self, log_buffer: Optional[LogBuffer] = None):
+        self.log_buffer = log_buffer
         self.parser = MeshCoreParser()
         self.config_loader = ConfigLoader()
         self.config = None
@@ -64,11 +71,38 @@ class MeshCoreBridge:
             'started_at': None
         }
         
-        # Known nodes (cache)
-        self.known_nodes = {}
+        # Live feed for the web app (Redis pub/sub); disabled when REDIS_URL is unset
+        self.events = EventPublisher(os.getenv('REDIS_URL'))
+        self.status_interval = 10  # Seconds between status events
+        
+        # Known nodes (warm-loaded from the database, written back only on change)
+        self.node_registry = NodeRegistry(
+            self.config_loader.pool,
+            last_seen_granularity=int(os.getenv('NODE_LAST_SEEN_GRANULARITY', '300')),
+            max_nodes=int(os.getenv('NODE_REGISTRY_MAX_NODES', '0')),
+            on_write=self._publish_node_changes
+        )
+        
+        # Recent messages by checksum, for matching incoming ACKs. Off by default:
+        # nothing stores messages with checksums yet, so there is nothing to match
+        self.ack_tracker = AckTracker(
+            self.config_loader.pool,
+            window=int(os.getenv('ACK_WINDOW_SECONDS', '600')),
+            enabled=os.getenv('ACK_CORRELATION', 'false').lower() in ('1', 'true', 'yes')
+        )
+        
+        # Raw packets, written in batches when packet storage is enabled
+        self.packet_store = PacketStore(self.config_loader.pool)
+        
+        self.flush_interval = 5  # Write pending node, packet and ACK changes every 5 seconds
+        self.last_flush = time.time()
         
         # Configuration reload
-        self.config_check_interval = 10  # Check for config changes every 10 seconds
+        # Changes are pushed via LISTEN/NOTIFY; polling is only a fallback
+        self.config_changed = threading.Event()
+        self.config_listener = ConfigListener(self.config_loader.db_config, self._on_config_notify)
+        self.config_check_interval = 10  # Poll every 10 seconds while the listener is down
+        self.config_fallback_interval = 300  # Safety-net poll while the listener is up
         self.last_config_check = time.time()
     
     def load_configuration(self):
@@ -93,14 +127,25 @@ class MeshCoreBridge:
         else:
             logger.warning("No configuration loaded, using defaults")
     
+    def _on_config_notify(self, payload):
+        """Called from the listener thread when the web app saves the configuration"""
+        logger.info(f"Configuration change notification received ({payload or 'no payload'})")
+        self.config_changed.set()
+    
     def check_config_changes(self):
         """Check if configuration has changed and reload if needed"""
-        if time.time() - self.last_config_check < self.config_check_interval:
-            return False
+        notified = self.config_changed.is_set()
+        
+        if not notified:
+            interval = self.config_fallback_interval if self.config_listener.is_listening else self.config_check_interval
+            if time.time() - self.last_config_check < interval:
+                return False
         
+        self.config_changed.clear()
         self.last_config_check = time.time()
         
-        if self.config_loader.has_config_changed():
+        # A notification is an explicit reload request, so skip the updated_at check
+        if notified or self.config_loader.has_config_changed():
             logger.info("Configuration changed, reloading...")
             old_config = self.config
             self.load_configuration()
@@ -285,9 +330,22 @@ class MeshCoreBridge:
             if packet.parsed_payload:
                 self._handle_parsed_payload(packet)
             
+            received_at = time.time()
+            # Multipart chunks are always stored: the web app reassembles transfers from them
+            if (self.config and self.config.get('store_packets', True)) or \
+                    packet.header.payload_type == PayloadType.MULTIPART:
+                self.packet_store.add(packet, received_at=received_at)
+            
             # Publish to MQTT
             self._publish_to_mqtt(packet)
             
+            # Push to the web app's live feed
+            if self.events.enabled:
+                self.events.publish('packet', {
+                    **self._packet_summary(packet),
+                    'received_at': datetime.fromtimestamp(received_at, tz=timezone.utc).isoformat(),
+                })
+            
         except Exception as e:
             logger.error(f"Error processing packet: {e}", exc_info=True)
             self.stats['errors'] += 1
@@ -299,19 +357,29 @@ class MeshCoreBridge:
         if payload.get('type') == 'advertisement':
             # Update known nodes
             node_hash = payload['node_hash']
-            self.known_nodes[node_hash] = {
-                'public_key': payload['public_key'],
-                'node_hash': node_hash,
-                'last_seen': datetime.now().isoformat(),
-                'appdata': payload.get('appdata', {})
-            }
-            logger.info(f"Node advertisement: {node_hash} - {payload.get('appdata', {}).get('name', 'Unknown')}")
+            self.node_registry.observe_advertisement(
+                bytes.fromhex(payload['public_key']),
+                node_hash,
+                payload.get('appdata') or {}
+            )
+            logger.info(f"Node advertisement: {node_hash} - {(payload.get('appdata') or {}).get('name', 'Unknown')}")
         
         elif payload.get('type') == 'text_message':
+            self.node_registry.touch(payload['source_hash'])
             logger.info(f"Text message: {payload['source_hash']} → {payload['destination_hash']}")
         
         elif payload.get('type') == 'group_text':
             logger.info(f"Group message on channel {payload['channel_hash']}")
+        
+        elif payload.get('type') == 'multipart':
+            logger.debug(f"Multipart chunk {payload['index'] + 1}/{payload['total']} of session {payload['session_id']}")
+        
+        elif payload.get('type') == 'multipart_nack':
+            logger.debug(f"Multipart NACK for session {payload['session_id']} from chunk {payload['base']}")
+        
+        elif payload.get('type') == 'acknowledgment':
+            if self.ack_tracker.observe_ack(payload['checksum']):
+                logger.info(f"ACK {payload['checksum']} matched a tracked message")
     
     def _publish_to_mqtt(self, packet):
         """Publish packet to MQTT"""
@@ -322,11 +390,7 @@ class MeshCoreBridge:
             # Create MQTT message
             message = {
                 'timestamp': datetime.now().isoformat(),
-                'route_type': packet.header.route_type.name,
-                'payload_type': packet.header.payload_type.name,
-                'path': [p.hex() for p in packet.path],
-                'hop_count': len(packet.path),
-                'parsed': packet.parsed_payload
+                **self._packet_summary(packet)
             }
             
             # Publish to different topics based on payload type
@@ -347,6 +411,36 @@ class MeshCoreBridge:
             logger.error(f"Error publishing to MQTT: {e}")
             self.stats['errors'] += 1
     
+    def _packet_summary(self, packet) -> dict:
+        """JSON-friendly description of a packet for MQTT and the live feed"""
+        return {
+            'route_type': packet.header.route_type.name,
+            'payload_type': packet.header.payload_type.name,
+            'path': [p.hex() for p in packet.path],
+            'hop_count': len(packet.path),
+            'parsed': packet.parsed_payload
+        }
+    
+    def _publish_node_changes(self, records):
+        """Push nodes written by the node registry to the live feed"""
+        if not self.events.enabled:
+            return
+        for record in records:
+            self.events.publish('node', {**record.to_dict(), 'is_online': True})
+    
+    def publish_status(self):
+        """Push the bridge status to the live feed"""
+        self.events.publish('status', {
+            'status': 'running' if self.running else 'stopped',
+            'serial_connected': bool(self.serial_conn and self.serial_conn.is_open),
+            'mqtt_connected': bool(self.mqtt_client and self.mqtt_client.is_connected()),
+            'packets_received': self.stats['packets_received'],
+            'packets_published': self.stats['packets_published'],
+            'errors': self.stats['errors'],
+            'known_nodes': len(self.node_registry),
+            'started_at': self.stats['started_at'],
+        })
+    
     def publish_stats(self):
         """Publish bridge statistics to MQTT"""
         try:
@@ -356,7 +450,17 @@ class MeshCoreBridge:
             stats = {
                 **self.stats,
                 'timestamp': datetime.now().isoformat(),
-                'known_nodes': len(self.known_nodes),
+                'known_nodes': len(self.node_registry),
+                'node_registry': self.node_registry.stats,
+                'database': self.config_loader.pool.stats(),
+                'packet_store': self.packet_store.stats,
+                'live_events': self.events.stats,
+                'log_buffer': self.log_buffer.stats if self.log_buffer else None,
+                'acks': self.ack_tracker.stats(),
+                'config_listener': {
+                    **self.config_listener.stats,
+                    'listening': self.config_listener.is_listening,
+                },
                 'serial_connected': self.serial_conn and self.serial_conn.is_open,
                 'mqtt_connected': self.mqtt_client and self.mqtt_client.is_connected()
             }
@@ -378,6 +482,13 @@ class MeshCoreBridge:
         # Load configuration from database
         self.load_configuration()
         
+        # Load known nodes and recent messages from database
+        self.node_registry.warm_load()
+        self.ack_tracker.refresh()
+        
+        # Start listening for configuration changes
+        self.config_listener.start()
+        
         # Connect to serial (only if enabled)
         if self.serial_enabled:
             if not self.connect_serial():
@@ -405,7 +516,7 @@ class MeshCoreBridge:
         stats_thread.start()
         
         logger.info("Bridge running, waiting for packets...")
-        logger.info("Configuration will be checked every 10 seconds for changes")
+        logger.info("Configuration changes are applied as soon as they are saved")
         
         try:
             while self.running:
@@ -428,7 +539,8 @@ class MeshCoreBridge:
                         time.sleep(0.01)
                 else:
                     # If no serial connection, just keep the service alive
-                    time.sleep(5)
+                    # (a configuration change wakes us up immediately)
+                    self.config_changed.wait(5)
                     
                     # Try to reconnect if enabled but not connected
                     if self.serial_enabled and not self.serial_connected:
@@ -436,9 +548,12 @@ class MeshCoreBridge:
                             logger.debug("Attempting to reconnect to serial port...")
                             self.connect_serial()
                 
+                # Write pending node and ACK changes
+                self.flush_pending_writes()
+                
                 # Periodically try to reconnect MQTT if enabled but not connected
                 if self.mqtt_enabled and not self.mqtt_connected:
-                    time.sleep(10)  # Check less frequently for MQTT
+                    self.config_changed.wait(10)  # Check less frequently for MQTT
                     self.connect_mqtt()
                     
         except KeyboardInterrupt:
@@ -448,16 +563,43 @@ class MeshCoreBridge:
         finally:
             self.shutdown()
     
+    def flush_pending_writes(self, force: bool = False):
+        """Write pending node registry, packet and ACK changes to the database"""
+        if not force and time.time() - self.last_flush < self.flush_interval:
+            return
+        
+        self.last_flush = time.time()
+        self.node_registry.flush()
+        self.packet_store.flush()
+        
+        self.ack_tracker.expire()
+        self.ack_tracker.flush()
+        if not force:
+            self.ack_tracker.refresh()
+    
     def _stats_loop(self):
-        """Periodically publish statistics"""
+        """Periodically publish statistics (MQTT) and status (live feed)"""
+        last_stats = time.time()
         while self.running:
-            time.sleep(30)  # Publish every 30 seconds
-            self.publish_stats()
+            if self.events.enabled:
+                self.publish_status()
+            time.sleep(self.status_interval)
+            
+            if time.time() - last_stats >= 30:  # Publish MQTT stats every 30 seconds
+                last_stats = time.time()
+                self.publish_stats()
     
     def shutdown(self):
         """Shutdown the bridge"""
         logger.info("Shutting down bridge...")
         self.running = False
+        self.config_listener.stop()
+        
+        self.flush_pending_writes(force=True)
+        
+        if self.events.enabled:
+            self.publish_status()
+            self.events.close()
         
         if self.serial_conn and self.serial_conn.is_open:
             self.serial_conn.close()
@@ -468,15 +610,24 @@ class MeshCoreBridge:
             self.mqtt_client.disconnect()
             logger.info("MQTT connection closed")
         
+        self.config_loader.pool.close()
+        
         logger.info("Bridge shutdown complete")
+        if self.log_buffer:
+            self.log_buffer.close()
 
 
 def main():
     """Main entry point"""
+    # Recent log records for the web app's log viewer (mirrored to Redis)
+    log_buffer = LogBuffer(os.getenv('REDIS_URL'))
+    log_buffer.install()
+    log_buffer.start()
+    
     logger.info("MeshCore Bridge - Configuration from Database")
     logger.info("Settings are managed through the web interface at /meshcore/configuration/")
     
-    bridge = MeshCoreBridge()
+    bridge = MeshCoreBridge(log_buffer)
     bridge.run()
 
 
@@ -111,6 +111,8 @@ class MeshCoreParser:
     
     MAX_PATH_SIZE = 64
     MAX_PACKET_PAYLOAD = 184
+    # Multipart chunk header: session ID (4 bytes), chunk index and chunk count (2 bytes each)
+    MULTIPART_HEADER_SIZE = 8
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
@@ -199,6 +201,8 @@ class MeshCoreParser:
                 return self._parse_group_text(payload)
             elif payload_type == PayloadType.ACK:
                 return self._parse_acknowledgment(payload)
+            elif payload_type == PayloadType.MULTIPART:
+                return self._parse_multipart(payload)
             else:
                 return {'raw': payload.hex()}
                 
@@ -359,6 +363,31 @@ class MeshCoreParser:
             'checksum': format(checksum, '08x')
         }
     
+    def _parse_multipart(self, payload: bytes) -> dict:
+        """Parse a multipart chunk (reassembled by the web app, see apps/meshcore/multipart.py)"""
+        if len(payload) < self.MULTIPART_HEADER_SIZE:
+            return {'error': 'Multipart chunk too short'}
+        
+        session_id, index, total = struct.unpack('<IHH', payload[0:self.MULTIPART_HEADER_SIZE])
+        
+        if total == 0:
+            # Selective NACK from a receiver: first missing chunk and a bitmap of the gaps
+            missing = payload[self.MULTIPART_HEADER_SIZE:]
+            return {
+                'type': 'multipart_nack',
+                'session_id': session_id,
+                'base': index,
+                'missing': missing.hex()
+            }
+        
+        return {
+            'type': 'multipart',
+            'session_id': session_id,
+            'index': index,
+            'total': total,
+            'size': len(payload) - self.MULTIPART_HEADER_SIZE
+        }
+    
     @staticmethod
     def calculate_node_hash(public_key: bytes) -> str:
         """Calculate node hash from public key (first byte)"""
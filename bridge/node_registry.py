@@ -0,0 +1,330 @@
+"""
+Node registry for MeshCore Bridge
+Keeps known nodes in memory and only writes to the database when something changed
+"""
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Node types understood by the web application (see Node.NODE_TYPE_CHOICES)
+KNOWN_NODE_TYPES = ('chat', 'repeater', 'room_server', 'sensor', 'companion')
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(latitude: float, longitude: float, precision: int = 9) -> str:
+    """Geohash of a point (same encoding as the web app's geo.encode, used for map clustering)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    value = 0
+    bits = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            value = 0
+            bits = 0
+    return ''.join(chars)
+
+
+class NodeRecord:
+    """Compact in-memory record for a single node"""
+    __slots__ = (
+        'public_key', 'node_hash', 'node_type', 'name',
+        'latitude', 'longitude', 'last_seen', 'last_advertisement',
+        'persisted_last_seen',
+    )
+
+    def __init__(self, public_key: bytes, node_hash: str):
+        self.public_key = public_key
+        self.node_hash = node_hash
+        self.node_type = None  # Unknown until an advert says; never overwrites a stored type
+        self.name = ''
+        self.latitude = None
+        self.longitude = None
+        # Timestamps are epoch seconds (floats are far smaller than datetimes)
+        self.last_seen = 0.0
+        self.last_advertisement = 0.0
+        self.persisted_last_seen = 0.0
+
+    def to_dict(self) -> dict:
+        """Return a JSON-friendly view of the record"""
+        data = {
+            'public_key': self.public_key.hex(),
+            'node_hash': self.node_hash,
+            'name': self.name,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'last_seen': _to_datetime(self.last_seen).isoformat() if self.last_seen else None,
+        }
+        if self.node_type:
+            data['node_type'] = self.node_type
+        return data
+
+
+def _to_datetime(ts: float) -> Optional[datetime]:
+    """Convert epoch seconds to an aware UTC datetime"""
+    if not ts:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+class NodeRegistry:
+    """
+    In-memory registry of mesh nodes keyed by public key
+
+    Nodes are warm-loaded from the meshcore_node table at startup. Observations
+    only mark a record dirty when its identity or location changes, or when
+    last_seen has moved on by more than `last_seen_granularity` seconds since
+    the value that was last written. Dirty records are written in one batched
+    upsert by flush(), after which `on_write` (if given) is called with the
+    written records.
+    """
+
+    def __init__(self, pool, last_seen_granularity: int = 300, max_nodes: int = 0,
+                 on_write: Optional[Callable[[List[NodeRecord]], None]] = None):
+        self.pool = pool
+        self.last_seen_granularity = last_seen_granularity
+        self.max_nodes = max_nodes
+        self.on_write = on_write
+
+        self._nodes: 'OrderedDict[bytes, NodeRecord]' = OrderedDict()
+        self._by_hash: Dict[str, set] = {}
+        self._dirty: Dict[bytes, NodeRecord] = {}
+
+        self.stats = {
+            'observations': 0,
+            'db_writes': 0,
+            'writes_skipped': 0,
+            'evictions': 0,
+            'flush_errors': 0,
+        }
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def get(self, public_key: bytes) -> Optional[NodeRecord]:
+        """Get a node by public key"""
+        return self._nodes.get(public_key)
+
+    def find_by_hash(self, node_hash: str) -> list:
+        """Get all nodes sharing a node hash (the hash is only one byte, so collisions happen)"""
+        return [self._nodes[key] for key in self._by_hash.get(node_hash, ()) if key in self._nodes]
+
+    def warm_load(self):
+        """Load known nodes from the database"""
+        query = """
+            SELECT public_key, node_hash, node_type, name, latitude, longitude,
+                   last_seen, last_advertisement
+            FROM meshcore_node
+            ORDER BY last_seen DESC NULLS LAST
+        """
+        if self.max_nodes:
+            query += " LIMIT %d" % self.max_nodes
+
+        def load(conn):
+            cursor = conn.cursor()
+            cursor.execute(query)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        try:
+            rows = self.pool.run(load)
+        except Exception as e:
+            logger.error(f"Error loading nodes from database: {e}")
+            return 0
+
+        # Rows come newest first; insert oldest first so LRU order matches recency
+        for public_key, node_hash, node_type, name, lat, lon, last_seen, last_advert in reversed(rows):
+            record = NodeRecord(bytes(public_key), node_hash)
+            record.node_type = node_type
+            record.name = name or ''
+            record.latitude = lat
+            record.longitude = lon
+            record.last_seen = last_seen.timestamp() if last_seen else 0.0
+            record.last_advertisement = last_advert.timestamp() if last_advert else 0.0
+            record.persisted_last_seen = record.last_seen
+            self._insert(record)
+
+        logger.info(f"Loaded {len(self._nodes)} known nodes from database")
+        return len(self._nodes)
+
+    def observe_advertisement(self, public_key: bytes, node_hash: str, appdata: Optional[dict] = None,
+                              now: Optional[float] = None) -> NodeRecord:
+        """Record a node advertisement"""
+        now = now or time.time()
+        appdata = appdata or {}
+        self.stats['observations'] += 1
+
+        record = self._nodes.get(public_key)
+        changed = False
+        if record is None:
+            record = NodeRecord(public_key, node_hash)
+            self._insert(record)
+            changed = True
+        else:
+            self._nodes.move_to_end(public_key)
+
+        node_type = appdata.get('node_type')
+        if node_type in KNOWN_NODE_TYPES and node_type != record.node_type:
+            record.node_type = node_type
+            changed = True
+
+        name = appdata.get('name')
+        if name and name != record.name:
+            record.name = name
+            changed = True
+
+        if 'latitude' in appdata and 'longitude' in appdata:
+            if (appdata['latitude'], appdata['longitude']) != (record.latitude, record.longitude):
+                record.latitude = appdata['latitude']
+                record.longitude = appdata['longitude']
+                changed = True
+
+        record.last_advertisement = now
+        self._seen(record, now, changed)
+        return record
+
+    def touch(self, node_hash: str, now: Optional[float] = None) -> Optional[NodeRecord]:
+        """
+        Record activity from a node identified only by its hash
+
+        Ignored when the hash is unknown or ambiguous.
+        """
+        candidates = self._by_hash.get(node_hash)
+        if not candidates or len(candidates) != 1:
+            return None
+
+        now = now or time.time()
+        self.stats['observations'] += 1
+
+        record = self._nodes[next(iter(candidates))]
+        self._nodes.move_to_end(record.public_key)
+        self._seen(record, now, False)
+        return record
+
+    def _seen(self, record: NodeRecord, now: float, changed: bool):
+        """Update last_seen and decide whether the record needs writing"""
+        record.last_seen = max(record.last_seen, now)
+
+        if changed or record.last_seen - record.persisted_last_seen >= self.last_seen_granularity:
+            self._dirty[record.public_key] = record
+        else:
+            self.stats['writes_skipped'] += 1
+
+    def _insert(self, record: NodeRecord):
+        """Add a record to both indexes, evicting the least recently used if full"""
+        self._nodes[record.public_key] = record
+        self._by_hash.setdefault(record.node_hash, set()).add(record.public_key)
+
+        while self.max_nodes and len(self._nodes) > self.max_nodes:
+            old_key, old_record = self._nodes.popitem(last=False)
+            keys = self._by_hash.get(old_record.node_hash)
+            if keys:
+                keys.discard(old_key)
+                if not keys:
+                    del self._by_hash[old_record.node_hash]
+            self.stats['evictions'] += 1
+
+    @property
+    def pending_writes(self) -> int:
+        return len(self._dirty)
+
+    def flush(self) -> int:
+        """Write all dirty records to the database in a single upsert"""
+        if not self._dirty:
+            return 0
+
+        pending = self._dirty
+        self._dirty = {}
+
+        def row(record):
+            return (
+                psycopg2.Binary(record.public_key),
+                record.node_hash,
+                record.node_type or 'chat',
+                record.name,
+                record.latitude,
+                record.longitude,
+                geohash(record.latitude, record.longitude) if record.latitude is not None and record.longitude is not None else '',
+                _to_datetime(record.last_seen),
+                _to_datetime(record.last_advertisement),
+            )
+
+        # A record created after a restart or an LRU eviction doesn't know the stored
+        # type, so only rows with a type from an advert may overwrite it
+        typed = [row(record) for record in pending.values() if record.node_type]
+        untyped = [row(record) for record in pending.values() if not record.node_type]
+
+        def write(conn):
+            cursor = conn.cursor()
+            for rows, set_type in ((typed, 'node_type = EXCLUDED.node_type,'), (untyped, '')):
+                if not rows:
+                    continue
+                execute_values(cursor, """
+                    INSERT INTO meshcore_node (
+                        public_key, node_hash, node_type, name, latitude, longitude, geohash,
+                        last_seen, last_advertisement,
+                        short_name, is_online, is_favorite, is_ignored, notes,
+                        hardware_model, firmware_version, created_at, updated_at
+                    ) VALUES %s
+                    ON CONFLICT (public_key) DO UPDATE SET
+                        node_hash = EXCLUDED.node_hash,
+                        """ + set_type + """
+                        name = COALESCE(NULLIF(EXCLUDED.name, ''), meshcore_node.name),
+                        latitude = COALESCE(EXCLUDED.latitude, meshcore_node.latitude),
+                        longitude = COALESCE(EXCLUDED.longitude, meshcore_node.longitude),
+                        geohash = COALESCE(NULLIF(EXCLUDED.geohash, ''), meshcore_node.geohash),
+                        last_seen = GREATEST(meshcore_node.last_seen, EXCLUDED.last_seen),
+                        last_advertisement = COALESCE(EXCLUDED.last_advertisement, meshcore_node.last_advertisement),
+                        is_online = TRUE,
+                        updated_at = now()
+                """, rows, template="""(
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                    '', TRUE, FALSE, FALSE, '', '', '', now(), now()
+                )""")
+            # Change counter behind the web API's node ETags
+            cursor.execute("""
+                INSERT INTO meshcore_countertotal (name, value, updated_at)
+                VALUES ('nodes_version', 1, now())
+                ON CONFLICT (name) DO UPDATE
+                SET value = meshcore_countertotal.value + 1, updated_at = now()
+            """)
+            cursor.close()
+
+        try:
+            self.pool.run(write)
+        except Exception as e:
+            logger.error(f"Error writing nodes to database: {e}")
+            self.stats['flush_errors'] += 1
+            # Keep the records pending so the next flush retries them
+            for key, record in pending.items():
+                self._dirty.setdefault(key, record)
+            return 0
+
+        for record in pending.values():
+            record.persisted_last_seen = record.last_seen
+
+        self.stats['db_writes'] += len(pending)
+        if self.on_write:
+            self.on_write(list(pending.values()))
+        return len(pending)
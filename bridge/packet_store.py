@@ -0,0 +1,115 @@
+"""
+Packet store for MeshCore Bridge
+Buffers received packets and writes them to the database in batches
+"""
+import time
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+
+class PacketStore:
+    """
+    Batched writer for meshcore_packet
+
+    The path is stored as raw bytes, one byte per hop, and the payload as
+    raw bytes in the packet row.
+    """
+
+    def __init__(self, pool, max_buffer: int = 10000):
+        self.pool = pool
+        self.max_buffer = max_buffer
+        self._rows: List[tuple] = []
+
+        self.stats = {
+            'packets_buffered': 0,
+            'packets_written': 0,
+            'packets_dropped': 0,
+            'flush_errors': 0,
+            'flush_time_ms_max': 0.0,
+        }
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, packet, rssi: Optional[int] = None, snr: Optional[float] = None,
+            received_at: Optional[float] = None):
+        """Buffer a parsed packet for the next flush"""
+        if len(self._rows) >= self.max_buffer:
+            # Database unavailable for a long time; drop rather than grow without bound
+            self.stats['packets_dropped'] += 1
+            return
+
+        transport_1, transport_2 = packet.transport_codes or (None, None)
+        self._rows.append((
+            packet.header.route_type.name.lower(),
+            packet.header.payload_type.name.lower(),
+            packet.header.payload_version,
+            transport_1,
+            transport_2,
+            psycopg2.Binary(b''.join(packet.path)),
+            psycopg2.Binary(packet.payload),
+            datetime.fromtimestamp(received_at or time.time(), tz=timezone.utc),
+            rssi,
+            snr,
+        ))
+        self.stats['packets_buffered'] += 1
+
+    def flush(self) -> int:
+        """Write buffered packets in one transaction"""
+        if not self._rows:
+            return 0
+
+        rows = self._rows
+        self._rows = []
+
+        # Dashboard counters (meshcore_trafficcounter), per hour and payload type
+        counts = Counter(
+            (row[7].replace(minute=0, second=0, microsecond=0), row[1]) for row in rows
+        )
+        counter_rows = [(hour, payload_type, count) for (hour, payload_type), count in counts.items()]
+
+        def write(conn):
+            cursor = conn.cursor()
+            execute_values(cursor, """
+                INSERT INTO meshcore_packet (
+                    route_type, payload_type, payload_version,
+                    transport_code_1, transport_code_2,
+                    path, payload_data, received_at, rssi, snr
+                ) VALUES %s
+            """, rows, page_size=1000)
+            # Counted in the same transaction so counter reconciliation sees a consistent state
+            execute_values(cursor, """
+                INSERT INTO meshcore_trafficcounter (hour, kind, type, count)
+                VALUES %s
+                ON CONFLICT (hour, kind, type) DO UPDATE
+                SET count = meshcore_trafficcounter.count + EXCLUDED.count
+            """, counter_rows, template="(%s, 'packet', %s, %s)")
+            cursor.execute("""
+                INSERT INTO meshcore_countertotal (name, value, updated_at)
+                VALUES ('packets', %s, now())
+                ON CONFLICT (name) DO UPDATE
+                SET value = meshcore_countertotal.value + EXCLUDED.value, updated_at = now()
+            """, (len(rows),))
+            cursor.close()
+
+        started = time.perf_counter()
+        try:
+            self.pool.run(write)
+        except Exception as e:
+            logger.error(f"Error writing packets to database: {e}")
+            self.stats['flush_errors'] += 1
+            # Put the batch back in front of anything buffered meanwhile
+            self._rows = (rows + self._rows)[:self.max_buffer]
+            return 0
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats['flush_time_ms_max'] = round(max(self.stats['flush_time_ms_max'], elapsed_ms), 2)
+        self.stats['packets_written'] += len(rows)
+        return len(rows)
@@ -1,9 +1,13 @@
+import re
 from django.contrib import admin
+from django.db.models import Q
 from .models import (
     Node, Channel, Message, Packet, NodeStats,
     BridgeConfiguration, BridgeStatus, DeviceConnection
 )
 from .models_multimedia import MediaFile, MultiPartPacket, MediaGallery
+from .models_rollups import NodeStatsHourly, NodeStatsDaily, RollupWatermark
+from . import search
 
 
 @admin.register(Node)
@@ -11,7 +15,10 @@ class NodeAdmin(admin.ModelAdmin):
     list_display = ['node_hash', 'name', 'node_type', 'is_online', 'last_seen']
     list_filter = ['node_type', 'is_online', 'is_favorite']
     search_fields = ['name', 'node_hash', 'short_name']
-    readonly_fields = ['public_key_hex', 'created_at', 'updated_at']
+    readonly_fields = [
+        'public_key_hex', 'created_at', 'updated_at',
+        'latest_battery_mv', 'latest_rssi', 'latest_snr', 'latest_stats_at',
+    ]
     fieldsets = (
         ('Identity', {
             'fields': ('public_key', 'public_key_hex', 'node_hash', 'node_type')
@@ -22,6 +29,9 @@ class NodeAdmin(admin.ModelAdmin):
         ('Status', {
             'fields': ('is_online', 'last_seen', 'last_advertisement')
         }),
+        ('Latest Telemetry', {
+            'fields': ('latest_battery_mv', 'latest_rssi', 'latest_snr', 'latest_stats_at')
+        }),
         ('Metadata', {
             'fields': ('is_favorite', 'is_ignored', 'notes', 'created_at', 'updated_at')
         }),
@@ -39,9 +49,21 @@ class ChannelAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ['sender_hash', 'recipient_hash', 'message_type', 'timestamp', 'is_acknowledged']
     list_filter = ['message_type', 'txt_type', 'is_encrypted', 'is_acknowledged']
-    search_fields = ['content', 'sender_hash', 'recipient_hash']
-    readonly_fields = ['message_id', 'checksum', 'received_at']
+    search_fields = ['content']  # Enables the search box; see get_search_results
+    search_help_text = 'Words in the content ("phrase", or, -word), or a sender/recipient hash'
+    readonly_fields = ['message_id', 'checksum', 'received_at', 'acked_at', 'ack_latency_ms']
     date_hierarchy = 'timestamp'
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Indexed full-text match on the content, or a sender/recipient hash"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        
+        matches = search.text_match(search_term)
+        if re.fullmatch(r'[0-9a-fA-F]{2}', search_term):
+            matches = Q(matches) | Q(sender_hash=search_term.lower()) | Q(recipient_hash=search_term.lower())
+        return queryset.filter(matches), False
 
 
 @admin.register(Packet)
@@ -60,6 +82,19 @@ class NodeStatsAdmin(admin.ModelAdmin):
     date_hierarchy = 'collected_at'
 
 
+@admin.register(NodeStatsHourly, NodeStatsDaily)
+class NodeStatsRollupAdmin(admin.ModelAdmin):
+    list_display = ['node', 'bucket', 'sample_count', 'battery_min_mv', 'battery_max_mv', 'packets_received', 'packets_sent']
+    list_filter = ['node']
+    date_hierarchy = 'bucket'
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['name', 'last_id', 'updated_at']
+    readonly_fields = ['updated_at']
+
+
 @admin.register(BridgeConfiguration)
 class BridgeConfigurationAdmin(admin.ModelAdmin):
     list_display = ['mqtt_broker', 'mqtt_port', 'serial_port', 'forward_to_mqtt']
@@ -8,3 +8,6 @@ class MeshcoreConfig(AppConfig):
     
     def ready(self):
         import apps.meshcore.signals
+        from django.db.backends.signals import connection_created
+        from .metrics import install_wrapper
+        connection_created.connect(install_wrapper, dispatch_uid='meshcore_request_metrics')
@@ -0,0 +1,97 @@
+"""
+Bridge log tail
+
+The bridge keeps its recent log records in a ring buffer and mirrors them
+to a capped Redis stream (bridge/log_buffer.py), numbering them with a
+sequence that increases across bridge restarts. Readers pass the last
+sequence they have and get only newer records, so following the log costs
+one small Redis read per poll, or one blocking XREAD per SSE client.
+"""
+import asyncio
+import json
+import logging
+from django.conf import settings
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+# Shared with the bridge (bridge/log_buffer.py)
+LOGS_STREAM = 'meshcore:logs'
+
+_client = None
+
+
+def enabled():
+    return bool(settings.MESHCORE_LIVE_REDIS_URL)
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.MESHCORE_LIVE_REDIS_URL, socket_timeout=2, socket_connect_timeout=2
+        )
+    return _client
+
+
+def _record(entry_id, fields):
+    seq = int(entry_id.decode().split('-')[0])
+    return {'seq': seq, **json.loads(fields[b'data'])}
+
+
+def read(since=None, limit=None):
+    """
+    Records after sequence `since` (oldest first), or the last `limit`
+    records when `since` is None. Raises redis.RedisError.
+    """
+    limit = min(limit or settings.MESHCORE_BRIDGE_LOGS_TAIL, settings.MESHCORE_BRIDGE_LOGS_MAX)
+    client = _get_client()
+    if since is None:
+        entries = client.xrevrange(LOGS_STREAM, count=limit)[::-1]
+    else:
+        entries = client.xrange(LOGS_STREAM, min=f'({since}-0', count=limit)
+    return [_record(entry_id, fields) for entry_id, fields in entries]
+
+
+async def tail(since=None):
+    """
+    Yield SSE frames with new records as the bridge writes them
+
+    Starts after sequence `since`, or with the last few records. Each
+    client blocks on its own XREAD; ends after MESHCORE_LIVE_MAX_SECONDS
+    like the live feed, and the browser resumes with Last-Event-ID.
+    """
+    client = aioredis.from_url(settings.MESHCORE_LIVE_REDIS_URL)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.MESHCORE_LIVE_MAX_SECONDS
+    block_ms = settings.MESHCORE_LIVE_HEARTBEAT_SECONDS * 1000
+
+    try:
+        yield f"retry: {settings.MESHCORE_LIVE_RETRY_MS}\n\n"
+
+        if since is None:
+            entries = (await client.xrevrange(LOGS_STREAM, count=settings.MESHCORE_BRIDGE_LOGS_TAIL))[::-1]
+            last_id = entries[-1][0].decode() if entries else '$'
+        else:
+            entries = []
+            last_id = f'{since}-0'
+
+        while True:
+            for entry_id, fields in entries:
+                record = _record(entry_id, fields)
+                yield f"id: {record['seq']}\nevent: log\ndata: {json.dumps(record, separators=(',', ':'))}\n\n"
+                last_id = entry_id.decode()
+
+            if loop.time() >= deadline:
+                break
+            response = await client.xread(
+                {LOGS_STREAM: last_id}, count=settings.MESHCORE_BRIDGE_LOGS_MAX, block=block_ms
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                yield ": keepalive\n\n"
+    except redis.RedisError as e:
+        logger.warning(f"Bridge log stream ended: {e}")
+    finally:
+        await client.aclose()
@@ -0,0 +1,110 @@
+"""
+Conditional GET (ETag / Last-Modified) for the read APIs
+
+A view decorated with @conditional declares a cheap version marker (a
+change counter, max(updated_at), ...). The marker is read before the view
+runs; when the client's cached copy is still current the view is skipped
+and a bodiless 304 is returned. Requests and 304s per view are counted in
+the cache (shared by all workers when it is Redis) for api_conditional_stats.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'meshcore:conditional:{name}:{field}'
+STATS_FIELDS = ('requests', 'conditional', 'not_modified')
+FLUSH_INTERVAL = 5  # Seconds between writing buffered counts to the cache
+
+_views = set()
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = 0.0
+
+
+def _record(name, *fields):
+    """Count a request; counts are buffered and written to the cache every few seconds"""
+    global _pending, _last_flush
+    with _lock:
+        for field in fields:
+            _pending[(name, field)] += 1
+        now = time.monotonic()
+        if now - _last_flush < FLUSH_INTERVAL:
+            return
+        pending, _pending, _last_flush = _pending, Counter(), now
+
+    try:
+        for (view_name, field), count in pending.items():
+            key = STATS_KEY.format(name=view_name, field=field)
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, count)
+    except Exception as e:
+        logger.warning(f"Could not store conditional GET stats: {e}")
+
+
+def get_stats():
+    """Per-view request, conditional request and 304 counts, with the hit ratio"""
+    keys = {
+        STATS_KEY.format(name=name, field=field): (name, field)
+        for name in _views for field in STATS_FIELDS
+    }
+    values = cache.get_many(list(keys))
+    with _lock:
+        pending = dict(_pending)
+
+    stats = {}
+    for key, (name, field) in keys.items():
+        view_stats = stats.setdefault(name, dict.fromkeys(STATS_FIELDS, 0))
+        view_stats[field] += values.get(key, 0) + pending.get((name, field), 0)
+    for view_stats in stats.values():
+        requests = view_stats['requests']
+        view_stats['hit_ratio'] = round(view_stats['not_modified'] / requests, 3) if requests else None
+    return stats
+
+
+def conditional(name, version):
+    """
+    Answer GET/HEAD with 304 Not Modified when nothing changed
+
+    `version(request)` returns (marker, last_modified): any value that
+    changes whenever the response would, and an optional datetime. The
+    ETag is derived from the marker and the full request path. The marker
+    is read before the view runs, so a change racing with the request at
+    worst costs one extra full response later, never a stale 304.
+    """
+    _views.add(name)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            marker, last_modified = version(request)
+            etag = '"%s"' % hashlib.md5(f'{marker}|{request.get_full_path()}'.encode()).hexdigest()
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            is_conditional = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                _record(name, 'requests', 'conditional', 'not_modified')
+            else:
+                _record(name, 'requests', *(['conditional'] if is_conditional else []))
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response.setdefault('Cache-Control', 'no-cache')
+
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,193 @@
+"""
+Dashboard traffic counters
+
+Messages and packets are counted per hour and type as they are ingested
+(upserts into TrafficCounter), with all-time totals in CounterTotal.
+Messages are counted by record_messages(); packets by the bridge's
+PacketStore, in the same transaction as its insert. The
+dashboard sums at most 24 hourly buckets instead of counting the source
+tables. reconcile() recounts recent buckets and the totals from the source
+tables to correct any drift, without blocking ingestion.
+
+CounterTotal also holds change counters (e.g. NODES_VERSION) that are
+bumped whenever a table changes; the read APIs derive their ETags from
+them (see conditional.py).
+"""
+import logging
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import Message, Packet
+from .models_counters import TrafficCounter, CounterTotal
+
+logger = logging.getLogger(__name__)
+
+# kind -> (source model, time field, type field, total name)
+SOURCES = {
+    'message': (Message, 'timestamp', 'message_type', 'messages'),
+    'packet': (Packet, 'received_at', 'payload_type', 'packets'),
+}
+
+RECONCILE_HOURS = 48
+
+# Change counter for meshcore_node (also bumped by the bridge's node upsert)
+NODES_VERSION = 'nodes_version'
+
+# Change counter for meshcore_message, bumped by a trigger on PostgreSQL
+# (migration 0015) and by messages_changed() elsewhere
+MESSAGES_VERSION = 'messages_version'
+
+
+def truncate_hour(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(kind, counts, total=None):
+    """
+    Add `counts` ({(hour, type): n}) to the hourly buckets and `total`
+    (default their sum) to the kind's total; negative counts subtract
+    """
+    if total is None:
+        total = sum(counts.values())
+    if not counts and not total:
+        return
+
+    total_name = SOURCES[kind][3]
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            if counts:
+                values = ', '.join(['(%s, %s, %s, %s)'] * len(counts))
+                params = []
+                for (hour, type_), count in counts.items():
+                    params += [hour, kind, type_, count]
+                cursor.execute(f"""
+                    INSERT INTO meshcore_trafficcounter (hour, kind, type, count)
+                    VALUES {values}
+                    ON CONFLICT (hour, kind, type) DO UPDATE
+                    SET count = meshcore_trafficcounter.count + EXCLUDED.count
+                """, params)
+            if total:
+                cursor.execute("""
+                    INSERT INTO meshcore_countertotal (name, value, updated_at)
+                    VALUES (%s, %s, now())
+                    ON CONFLICT (name) DO UPDATE
+                    SET value = meshcore_countertotal.value + EXCLUDED.value, updated_at = now()
+                """, [total_name, total])
+        return
+
+    for (hour, type_), count in counts.items():
+        counter, _ = TrafficCounter.objects.get_or_create(hour=hour, kind=kind, type=type_)
+        TrafficCounter.objects.filter(pk=counter.pk).update(count=F('count') + count)
+    if total:
+        CounterTotal.objects.get_or_create(name=total_name)
+        CounterTotal.objects.filter(name=total_name).update(value=F('value') + total, updated_at=timezone.now())
+
+
+def record_messages(messages):
+    """Count newly stored messages"""
+    _upsert('message', Counter(
+        (truncate_hour(message.timestamp), message.message_type) for message in messages
+    ))
+
+
+def bump_version(name):
+    """Advance a change counter"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO meshcore_countertotal (name, value, updated_at)
+                VALUES (%s, 1, now())
+                ON CONFLICT (name) DO UPDATE
+                SET value = meshcore_countertotal.value + 1, updated_at = now()
+            """, [name])
+        return
+
+    CounterTotal.objects.get_or_create(name=name)
+    CounterTotal.objects.filter(name=name).update(value=F('value') + 1, updated_at=timezone.now())
+
+
+def messages_changed():
+    """Advance MESSAGES_VERSION where no trigger does (databases other than PostgreSQL)"""
+    if connection.vendor != 'postgresql':
+        bump_version(MESSAGES_VERSION)
+
+
+def get_version(name):
+    """(value, updated_at) of a change counter or total; (0, None) if it doesn't exist yet"""
+    return CounterTotal.objects.filter(name=name).values_list('value', 'updated_at').first() or (0, None)
+
+
+def get_total(kind):
+    """All-time total for a kind"""
+    total = CounterTotal.objects.filter(name=SOURCES[kind][3]).values_list('value', flat=True).first()
+    return total or 0
+
+
+def window_counts(kind, hours=24, now=None):
+    """Per-type counts over the last `hours` hourly buckets, largest first"""
+    since = truncate_hour(now or timezone.now()) - timedelta(hours=hours - 1)
+    return TrafficCounter.objects.filter(kind=kind, hour__gte=since).values('type').annotate(
+        count=Sum('count')
+    ).order_by('-count')
+
+
+def window_total(kind, hours=24, now=None):
+    """Total count over the last `hours` hourly buckets"""
+    return sum(row['count'] for row in window_counts(kind, hours, now))
+
+
+def _drift(kind, since):
+    """(per-bucket drift since `since`, drift of the total) of a kind, counted against its source table"""
+    model, time_field, type_field, total_name = SOURCES[kind]
+    actual = Counter({
+        (row['bucket'], row[type_field]): row['count']
+        for row in model.objects.filter(**{f'{time_field}__gte': since}).annotate(
+            bucket=TruncHour(time_field, tzinfo=dt_timezone.utc)
+        ).values('bucket', type_field).annotate(count=Count('id'))
+    })
+    counted = Counter({
+        (row['hour'], row['type']): row['count']
+        for row in TrafficCounter.objects.filter(kind=kind, hour__gte=since).values('hour', 'type', 'count')
+    })
+    buckets = {key: actual[key] - counted[key] for key in actual.keys() | counted.keys() if actual[key] != counted[key]}
+
+    total = CounterTotal.objects.filter(name=total_name).values_list('value', flat=True).first() or 0
+    return buckets, model.objects.count() - total
+
+
+def reconcile(hours=RECONCILE_HOURS, now=None):
+    """
+    Recount the last `hours` hourly buckets and the all-time totals
+
+    Ingestion updates the counters in the same transaction as the rows it
+    inserts, so source tables and counters agree within any one snapshot.
+    The drift is measured in a single REPEATABLE READ snapshot without
+    locking anything, then applied as increments, which commute with the
+    increments of ingests that ran meanwhile. Ingestion never waits for
+    the recount. Returns the per-kind drift of the totals.
+    """
+    since = truncate_hour(now or timezone.now()) - timedelta(hours=hours - 1)
+
+    snapshot = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        drift = {kind: _drift(kind, since) for kind in SOURCES}
+
+    with transaction.atomic():
+        for kind, (buckets, total) in drift.items():
+            _upsert(kind, buckets, total)
+            if buckets:
+                TrafficCounter.objects.filter(kind=kind, hour__gte=since, count=0).delete()
+
+    corrected = {
+        kind: {'buckets': len(buckets), 'total': total} for kind, (buckets, total) in drift.items() if buckets or total
+    }
+    if corrected:
+        logger.warning(f"Corrected counter drift: {corrected}")
+    return {kind: total for kind, (_, total) in drift.items()}
@@ -0,0 +1,381 @@
+"""
+Bulk export of messages and packets (NDJSON, CSV, Parquet)
+
+Exports are produced incrementally and never hold the result in memory. On
+PostgreSQL, CSV and NDJSON are rendered by the database with
+COPY (<query>) TO STDOUT, the fastest way to get rows out of it; elsewhere,
+and for Parquet, rows are read through a server-side cursor. Parquet is
+written one row group at a time with pyarrow, which is optional.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import queue
+import threading
+from django.db import connection
+from django.db.models import F, Func
+from django.db.models.functions import Length
+from .models import Message, Packet
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Rows per server-side cursor round trip and per Parquet row group
+CHUNK_SIZE = 5000
+ROW_GROUP_SIZE = 65536
+# Chunks (of about STREAM_CHUNK_BYTES) buffered between the export thread
+# and a slow client
+QUEUE_SIZE = 16
+STREAM_CHUNK_BYTES = 65536
+
+
+class Hex(Func):
+    """Lowercase hex of a binary column"""
+    template = "encode(%(expressions)s, 'hex')"
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='lower(hex(%(expressions)s))', **extra_context)
+
+
+# Column name -> (source, Arrow type). Binary columns are exported as hex.
+DATASETS = {
+    'messages': {
+        'model': Message,
+        'time_field': 'timestamp',
+        'columns': {
+            'id': ('id', 'int64'),
+            'message_id': ('message_id', 'string'),
+            'sender_hash': ('sender_hash', 'string'),
+            'recipient_hash': ('recipient_hash', 'string'),
+            'channel_id': ('channel_id', 'int64'),
+            'message_type': ('message_type', 'string'),
+            'txt_type': ('txt_type', 'string'),
+            'content': ('content', 'string'),
+            'timestamp': ('timestamp', 'timestamp'),
+            'rssi': ('rssi', 'int32'),
+            'snr': ('snr', 'float64'),
+            'is_acknowledged': ('is_acknowledged', 'bool'),
+            'ack_latency_ms': ('ack_latency_ms', 'int32'),
+        },
+        # Query parameter -> lookup
+        'filters': {
+            'sender_hash': 'sender_hash',
+            'recipient_hash': 'recipient_hash',
+            'channel': 'channel_id',
+            'type': 'message_type',
+        },
+    },
+    'packets': {
+        'model': Packet,
+        'time_field': 'received_at',
+        'columns': {
+            'id': ('id', 'int64'),
+            'received_at': ('received_at', 'timestamp'),
+            'route_type': ('route_type', 'string'),
+            'payload_type': ('payload_type', 'string'),
+            'payload_version': ('payload_version', 'int32'),
+            'hop_count': (Length('path'), 'int32'),
+            'path_hex': (Hex('path'), 'string'),
+            'payload_hex': (Hex('payload_data'), 'string'),
+            'rssi': ('rssi', 'int32'),
+            'snr': ('snr', 'float64'),
+            'message_id': ('message_id', 'int64'),
+        },
+        'filters': {
+            'type': 'payload_type',
+            'route_type': 'route_type',
+        },
+    },
+}
+
+
+def export_queryset(dataset, since=None, until=None, filters=None):
+    """
+    values() queryset of the export columns for a time range, oldest first
+
+    `filters` maps the dataset's filter names to values; raises ValueError
+    for unknown names.
+    """
+    spec = DATASETS[dataset]
+    time_field = spec['time_field']
+    queryset = spec['model'].objects.all()
+
+    if since:
+        queryset = queryset.filter(**{f'{time_field}__gte': since})
+    if until:
+        queryset = queryset.filter(**{f'{time_field}__lt': until})
+    for name, value in (filters or {}).items():
+        if name not in spec['filters']:
+            raise ValueError(f"Unknown {dataset} filter: {name}")
+        if name.endswith('_hash'):
+            value = value.lower()
+        queryset = queryset.filter(**{spec['filters'][name]: value})
+
+    fields = []
+    expressions = {}
+    for name, (source, _) in spec['columns'].items():
+        if source == name:
+            fields.append(name)
+        else:
+            expressions[name] = F(source) if isinstance(source, str) else source
+    return queryset.order_by(time_field, 'id').values(*fields, **expressions)
+
+
+def _columns(queryset):
+    """Output column names in SELECT order"""
+    query = queryset.query
+    return list(query.values_select) + list(query.annotation_select)
+
+
+def _copy_sql(cursor, queryset, fmt):
+    sql, params = queryset.query.sql_with_params()
+    select = cursor.mogrify(sql, params).decode()
+    if fmt == 'csv':
+        return f'COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)'
+    # One JSON document per line; quote and delimiter characters that never
+    # appear in JSON text keep COPY from escaping anything
+    return (
+        f'COPY (SELECT row_to_json(e) FROM ({select}) AS e) TO STDOUT '
+        f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+    )
+
+
+def copy_available(fmt):
+    return fmt in ('csv', 'ndjson') and connection.vendor == 'postgresql'
+
+
+def _copy_to(queryset, fmt, file):
+    """COPY the export into a binary file object; returns the row count"""
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        raw.copy_expert(_copy_sql(raw, queryset, fmt), file)
+        return raw.rowcount
+
+
+def _iter_text(queryset, fmt, stats):
+    """CSV or NDJSON from a server-side cursor, one encoded chunk per fetch"""
+    columns = _columns(queryset)
+    rows = queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+
+    count = 0
+    for row in rows:
+        row = [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row)), separators=(',', ':')))
+            buffer.write('\n')
+        count += 1
+        if count % CHUNK_SIZE == 0:
+            stats['rows'] = count
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    stats['rows'] = count
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """Write-only file object collecting what pyarrow writes"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_schema(pa, dataset, columns):
+    types = {
+        'int32': pa.int32(),
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'bool': pa.bool_(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    spec = DATASETS[dataset]['columns']
+    return pa.schema([(name, types[spec[name][1]]) for name in columns])
+
+
+def _iter_parquet(queryset, dataset, stats):
+    """Parquet file bytes, one row group at a time"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = _columns(queryset)
+    schema = _arrow_schema(pa, dataset, columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    count = 0
+    batch = [[] for _ in columns]
+    for row in queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE):
+        for column, value in zip(batch, row):
+            column.append(value)
+        count += 1
+        if count % ROW_GROUP_SIZE == 0:
+            writer.write_table(pa.Table.from_arrays(batch, schema=schema))
+            batch = [[] for _ in columns]
+            stats['rows'] = count
+            yield sink.take()
+
+    if batch[0]:
+        writer.write_table(pa.Table.from_arrays(batch, schema=schema))
+    writer.close()
+    stats['rows'] = count
+    yield sink.take()
+
+
+def check_format(fmt):
+    """Raise ValueError unless `fmt` can be exported here"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError('Parquet export needs the pyarrow package')
+
+
+def write_export(dataset, queryset, fmt, file, stats=None):
+    """
+    Write the export to a binary file object; returns the row count
+
+    `stats['rows']` follows the progress (for COPY exports it is only set
+    once the COPY completes).
+    """
+    check_format(fmt)
+    stats = stats if stats is not None else {}
+    stats['rows'] = 0
+
+    if copy_available(fmt):
+        stats['rows'] = _copy_to(queryset, fmt, file)
+    else:
+        chunks = _iter_parquet(queryset, dataset, stats) if fmt == 'parquet' else _iter_text(queryset, fmt, stats)
+        for chunk in chunks:
+            file.write(chunk)
+    return stats['rows']
+
+
+class ExportStream:
+    """
+    Export produced by a worker thread, iterable with `for` or `async for`
+
+    The worker has its own database connection and hands chunks over
+    through a bounded queue, so a slow client holds back the export instead
+    of buffering it. Stopping the iteration (client gone) aborts the export.
+    """
+    _DONE = object()
+
+    def __init__(self, dataset, queryset, fmt, stats=None):
+        check_format(fmt)
+        self.chunks = queue.Queue(QUEUE_SIZE)
+        self.cancelled = threading.Event()
+        self.error = None
+        self.buffer = bytearray()
+        self.worker = threading.Thread(
+            target=self._run, args=(dataset, queryset, fmt, stats), name='export', daemon=True
+        )
+
+    def write(self, data):
+        # COPY writes row by row; hand over chunks of a useful size
+        self.buffer += data
+        if len(self.buffer) >= STREAM_CHUNK_BYTES:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def _put(self, item):
+        while True:
+            if self.cancelled.is_set():
+                raise IOError('Export cancelled')
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self):
+        """Next chunk, or _DONE once the iteration is cancelled (the worker then stops without one)"""
+        while True:
+            try:
+                return self.chunks.get(timeout=1)
+            except queue.Empty:
+                if self.cancelled.is_set():
+                    return self._DONE
+
+    def _run(self, dataset, queryset, fmt, stats):
+        try:
+            write_export(dataset, queryset, fmt, self, stats)
+            if self.buffer:
+                self._put(bytes(self.buffer))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                logger.error(f"Export failed: {e}")
+                self.error = e
+        finally:
+            connection.close()
+            try:
+                self._put(self._DONE)
+            except IOError:
+                pass
+
+    def __iter__(self):
+        self.worker.start()
+        try:
+            while True:
+                chunk = self._get()
+                if chunk is self._DONE:
+                    break
+                yield chunk
+            if self.error:
+                raise self.error
+        finally:
+            self.cancelled.set()
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        self.worker.start()
+        try:
+            while True:
+                # Polls, so a client that goes away while the queue is empty doesn't strand the executor thread
+                chunk = await loop.run_in_executor(None, self._get)
+                if chunk is self._DONE:
+                    break
+                yield chunk
+            if self.error:
+                raise self.error
+        finally:
+            self.cancelled.set()
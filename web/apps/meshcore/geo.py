@@ -0,0 +1,116 @@
+"""
+Geohash spatial index for node locations
+
+Every node with coordinates stores its geohash (Node.geohash). A geohash
+prefix is a grid cell, so nodes are clustered for the map by grouping on a
+prefix whose length follows the zoom level, and cells covering a bounding
+box become indexed prefix scans.
+"""
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # ~5 m cells, finer than advertised positions
+
+# Cluster cell size per zoom: about 8 cells across a 256 px map tile
+ZOOM_PRECISION = [1, 1, 2, 2, 2, 3, 3, 4, 4, 4, 5, 5, 6, 6, 6, 7, 7, 8, 8, 8]
+# From this zoom on nodes are returned individually
+UNCLUSTERED_ZOOM = 17
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Geohash of a point"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            rng, coord = lon_range, longitude
+        else:
+            rng, coord = lat_range, latitude
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_bounds(geohash):
+    """(south, west, north, east) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def covering_cells(south, west, north, east, max_cells=32):
+    """
+    Geohash prefixes whose cells together cover the bounding box
+
+    Uses the longest prefix length that needs at most `max_cells` cells.
+    Returns [''] (everything) for boxes too large to cover that way.
+    """
+    best = ['']
+    for precision in range(1, PRECISION + 1):
+        cells = _cells_at(south, west, north, east, precision, max_cells)
+        if cells is None:
+            break
+        best = cells
+    return best
+
+
+def _cells_at(south, west, north, east, precision, max_cells):
+    s, w, n, e = cell_bounds(encode(south, west, precision))
+    cell_height, cell_width = n - s, e - w
+
+    rows = int((north - s) // cell_height) + 1
+    cols = int((east - w) // cell_width) + 1
+    if rows * cols > max_cells:
+        return None
+
+    cells = set()
+    for row in range(rows):
+        lat = min(s + (row + 0.5) * cell_height, 90.0)
+        for col in range(cols):
+            lon = min(w + (col + 0.5) * cell_width, 180.0)
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+
+def precision_for_zoom(zoom):
+    """Geohash prefix length used to cluster nodes at a map zoom level"""
+    if zoom >= UNCLUSTERED_ZOOM:
+        return PRECISION
+    return ZOOM_PRECISION[max(0, min(zoom, len(ZOOM_PRECISION) - 1))]
+
+
+def parse_bbox(value):
+    """'west,south,east,north' -> (south, west, north, east); raises ValueError"""
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('bbox must be west,south,east,north')
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError('bbox out of range')
+    if west > east:
+        raise ValueError('bbox must not cross the antimeridian')
+    return south, west, north, east
@@ -0,0 +1,177 @@
+"""
+Set-based node presence and telemetry maintenance
+
+Node.last_seen and Node.is_online are updated once per ingested batch
+(max timestamp per sender, one UPDATE ... FROM (VALUES ...)) instead of once
+per message, and stale nodes are flipped offline by a periodic task. The
+latest NodeStats values are copied onto Node the same way so list pages
+never need a stats query per node.
+"""
+import logging
+from django.db import connection, transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+from .models import Message, Node, NodeStats
+from . import counters, live
+
+logger = logging.getLogger(__name__)
+
+
+def latest_by_sender(messages):
+    """Max message timestamp per sender node id"""
+    latest = {}
+    for message in messages:
+        if message.sender_id is None or message.timestamp is None:
+            continue
+        current = latest.get(message.sender_id)
+        if current is None or message.timestamp > current:
+            latest[message.sender_id] = message.timestamp
+    return latest
+
+
+def update_last_seen(latest):
+    """
+    Advance last_seen (never backwards) and set is_online for many nodes at once
+
+    `latest` maps node id to the newest time the node was heard.
+    Returns the number of nodes updated.
+    """
+    if not latest:
+        return 0
+
+    online_since = timezone.now() - Node.ONLINE_WINDOW
+
+    if connection.vendor == 'postgresql':
+        values = ', '.join(['(%s, %s::timestamptz)'] * len(latest))
+        params = [value for item in latest.items() for value in item]
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE meshcore_node AS n SET
+                    last_seen = GREATEST(n.last_seen, v.seen),
+                    is_online = GREATEST(n.last_seen, v.seen) >= %s
+                FROM (VALUES {values}) AS v(id, seen)
+                WHERE n.id = v.id
+                  AND (n.last_seen IS NULL OR n.last_seen < v.seen OR NOT n.is_online)
+            """, [online_since] + params)
+            updated = cursor.rowcount
+    else:
+        updated = 0
+        for node_id, seen in latest.items():
+            node = Node.objects.filter(pk=node_id)
+            advanced = node.filter(Q(last_seen__isnull=True) | Q(last_seen__lt=seen)).update(
+                last_seen=seen, is_online=seen >= online_since
+            )
+            if not advanced:
+                # Offline node heard again with an older timestamp: recheck its stored last_seen
+                advanced = node.filter(is_online=False).update(is_online=Case(
+                    When(last_seen__gte=online_since, then=Value(True)), default=Value(False)
+                ))
+            updated += advanced
+
+    if updated:
+        counters.bump_version(counters.NODES_VERSION)
+    return updated
+
+
+def publish_messages(messages):
+    """Push newly stored messages to the live feed"""
+    node_ids = {message.sender_id for message in messages} | {message.recipient_id for message in messages}
+    names = dict(Node.objects.filter(pk__in=node_ids - {None}).values_list('id', 'name'))
+    for message in messages:
+        live.publish('message', {
+            'id': message.pk,
+            'message_type': message.message_type,
+            'sender_hash': message.sender_hash,
+            'sender_name': names.get(message.sender_id) or '',
+            'recipient_hash': message.recipient_hash,
+            'recipient_name': names.get(message.recipient_id) or '',
+            'channel_id': message.channel_id,
+            'content': message.content,
+            'timestamp': message.timestamp,
+            'rssi': message.rssi,
+            'snr': message.snr,
+        })
+
+
+def ingest_messages(messages):
+    """Insert a batch of messages, count them and update their senders' presence"""
+    with transaction.atomic():
+        created = Message.objects.bulk_create(messages)
+        counters.record_messages(created)
+        counters.messages_changed()
+    update_last_seen(latest_by_sender(created))
+    if live.enabled():
+        publish_messages(created)
+    return created
+
+
+def latest_stats_by_node(stats):
+    """Newest NodeStats per node from an iterable of NodeStats"""
+    latest = {}
+    for row in stats:
+        current = latest.get(row.node_id)
+        if current is None or row.collected_at >= current.collected_at:
+            latest[row.node_id] = row
+    return latest
+
+
+def update_latest_telemetry(latest):
+    """
+    Copy the newest battery, RSSI and SNR readings onto Node
+
+    `latest` maps node id to a NodeStats row. Older readings than the one
+    already on the node are ignored. Returns the number of nodes updated.
+    """
+    if not latest:
+        return 0
+
+    if connection.vendor == 'postgresql':
+        values = ', '.join(['(%s, %s::integer, %s::integer, %s::double precision, %s::timestamptz)'] * len(latest))
+        params = []
+        for node_id, row in latest.items():
+            params += [node_id, row.battery_mv, row.rssi, row.snr, row.collected_at]
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE meshcore_node AS n SET
+                    latest_battery_mv = v.battery_mv,
+                    latest_rssi = v.rssi,
+                    latest_snr = v.snr,
+                    latest_stats_at = v.collected_at
+                FROM (VALUES {values}) AS v(id, battery_mv, rssi, snr, collected_at)
+                WHERE n.id = v.id
+                  AND (n.latest_stats_at IS NULL OR n.latest_stats_at <= v.collected_at)
+            """, params)
+            return cursor.rowcount
+
+    updated = 0
+    for node_id, row in latest.items():
+        updated += Node.objects.filter(pk=node_id).filter(
+            Q(latest_stats_at__isnull=True) | Q(latest_stats_at__lte=row.collected_at)
+        ).update(
+            latest_battery_mv=row.battery_mv,
+            latest_rssi=row.rssi,
+            latest_snr=row.snr,
+            latest_stats_at=row.collected_at,
+        )
+    return updated
+
+
+def ingest_node_stats(stats):
+    """Insert a batch of NodeStats and refresh the latest telemetry on their nodes"""
+    created = NodeStats.objects.bulk_create(stats)
+    update_latest_telemetry(latest_stats_by_node(created))
+    return created
+
+
+def mark_stale_nodes_offline():
+    """Flip is_online off for every node not heard within Node.ONLINE_WINDOW"""
+    cutoff = timezone.now() - Node.ONLINE_WINDOW
+    stale = Node.objects.filter(is_online=True, last_seen__lt=cutoff)
+    changed = list(stale.values_list('public_key', 'node_hash')) if live.enabled() else []
+    updated = stale.update(is_online=False)
+    if updated:
+        counters.bump_version(counters.NODES_VERSION)
+        logger.info(f"Marked {updated} stale nodes offline")
+    for public_key, node_hash in changed:
+        live.publish('node', {'public_key': bytes(public_key).hex(), 'node_hash': node_hash, 'is_online': False})
+    return updated
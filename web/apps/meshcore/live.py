@@ -0,0 +1,219 @@
+"""
+Live feed (Server-Sent Events)
+
+The bridge, and the web app itself, publish events (status, packet, node,
+message) to a Redis pub/sub channel. Each web worker holds one subscription
+and fans the events out to its connected browsers, so open tabs cost no
+database queries at all. Every event is also appended to a capped Redis
+stream whose ids double as SSE event ids: a reconnecting EventSource sends
+Last-Event-ID and gets the events it missed replayed from the stream.
+"""
+import asyncio
+import json
+import logging
+import weakref
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+# Shared with the bridge (bridge/event_publisher.py)
+EVENTS_CHANNEL = 'meshcore:events'
+EVENTS_STREAM = 'meshcore:events:log'
+EVENT_TYPES = ('status', 'packet', 'node', 'message')
+
+PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[3], '*', 'event', ARGV[1], 'data', ARGV[2])
+redis.call('PUBLISH', KEYS[2], '{"id":"' .. id .. '","event":"' .. ARGV[1] .. '","data":' .. ARGV[2] .. '}')
+return id
+"""
+
+_client = None
+_script = None
+
+
+def enabled():
+    return bool(settings.MESHCORE_LIVE_REDIS_URL)
+
+
+def publish(event, data):
+    """Publish an event to the live feed; failures are logged, never raised"""
+    global _client, _script
+    if not enabled():
+        return None
+
+    try:
+        if _client is None:
+            _client = redis.Redis.from_url(
+                settings.MESHCORE_LIVE_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+            _script = _client.register_script(PUBLISH_SCRIPT)
+        return _script(
+            keys=[EVENTS_STREAM, EVENTS_CHANNEL],
+            args=[event, json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')),
+                  settings.MESHCORE_LIVE_STREAM_LENGTH],
+        )
+    except (redis.RedisError, OSError) as e:
+        logger.warning(f"Could not publish live {event} event: {e}")
+        return None
+
+
+def parse_event_id(value):
+    """Stream id ('<ms>-<seq>') as a comparable tuple, or None"""
+    try:
+        ms, seq = value.split('-')
+        return int(ms), int(seq)
+    except (AttributeError, ValueError):
+        return None
+
+
+class EventHub:
+    """One Redis subscription per worker, fanned out to per-client queues"""
+
+    def __init__(self, url, queue_size):
+        self.url = url
+        self.queue_size = queue_size
+        self.redis = aioredis.from_url(url)
+        self._queues = set()
+        self._task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(self.queue_size)
+        self._queues.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._queues.discard(queue)
+        if not self._queues and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _dispatch(self, event):
+        for queue in list(self._queues):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow to keep up: end its stream, the browser reconnects
+                # and catches up from the stream with Last-Event-ID
+                self._queues.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(EVENTS_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._dispatch(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Live feed subscription lost, retrying: {e}")
+                await asyncio.sleep(2)
+
+    async def replay(self, after, limit):
+        """
+        Events after stream id `after`, and whether the stream still covers
+        everything since then (it is capped, so old ids get trimmed)
+        """
+        oldest = await self.redis.xrange(EVENTS_STREAM, count=1)
+        complete = not oldest or parse_event_id(oldest[0][0].decode()) <= parse_event_id(after)
+        entries = await self.redis.xrange(EVENTS_STREAM, min=f'({after}', count=limit)
+
+        events = []
+        for entry_id, fields in entries:
+            events.append({
+                'id': entry_id.decode(),
+                'event': fields[b'event'].decode(),
+                'data': json.loads(fields[b'data']),
+            })
+        return events, complete and len(entries) < limit
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """The EventHub for the running event loop"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = EventHub(settings.MESHCORE_LIVE_REDIS_URL, settings.MESHCORE_LIVE_QUEUE_SIZE)
+    return hub
+
+
+def format_event(event):
+    data = json.dumps(event['data'], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+def event_filter(events=None, packet_types=None):
+    """Predicate for the events a client asked for (?events=, ?packet_types=)"""
+    events = set(events or EVENT_TYPES)
+    packet_types = {value.upper() for value in packet_types or ()}
+
+    def wanted(event):
+        if event['event'] not in events:
+            return False
+        if packet_types and event['event'] == 'packet':
+            return event['data'].get('payload_type') in packet_types
+        return True
+
+    return wanted
+
+
+async def event_stream(wanted, last_event_id=None):
+    """
+    Yield SSE frames: missed events (from `last_event_id`), then live ones
+
+    A comment line is sent as a heartbeat when the feed is quiet. Streams end
+    after MESHCORE_LIVE_MAX_SECONDS and the browser reconnects; this bounds
+    the lifetime of streams whose client went away without us noticing.
+    """
+    hub = get_hub()
+    queue = hub.subscribe()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.MESHCORE_LIVE_MAX_SECONDS
+    heartbeat = settings.MESHCORE_LIVE_HEARTBEAT_SECONDS
+
+    try:
+        yield f"retry: {settings.MESHCORE_LIVE_RETRY_MS}\n\n"
+
+        last = parse_event_id(last_event_id)
+        if last:
+            missed, complete = await hub.replay('%d-%d' % last, settings.MESHCORE_LIVE_STREAM_LENGTH)
+            if not complete:
+                # Too far behind to replay; the page should reload its data
+                yield "event: resync\ndata: {}\n\n"
+            for event in missed:
+                last = parse_event_id(event['id'])
+                if wanted(event):
+                    yield format_event(event)
+
+        while True:
+            timeout = min(heartbeat, deadline - loop.time())
+            if timeout <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            if event is None:
+                break
+            event_id = parse_event_id(event['id'])
+            if last and event_id <= last:
+                continue  # Already sent during replay
+            last = event_id
+            if wanted(event):
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(queue)
@@ -0,0 +1,140 @@
+"""
+Compare receive throughput of the sparse-file chunk store with one row per chunk
+"""
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from apps.meshcore import multipart
+from apps.meshcore.models import Node
+from apps.meshcore.models_multimedia import MediaFile, MultiPartPacket
+
+MODES = ('rows', 'rows-batched', 'store')
+
+
+class Command(BaseCommand):
+    help = (
+        'Receive the same chunks as MultiPartPacket rows (per chunk, and in batches) and through '
+        'the chunk store, and report chunks/s, queries per chunk and read-back time for each'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=50000, help='Bytes per transfer')
+        parser.add_argument('--transfers', type=int, default=10)
+        parser.add_argument('--batch', type=int, default=50, help='Chunks per ingest batch')
+        parser.add_argument('--mode', action='append', choices=MODES, dest='modes', help='Mode to run (repeatable, default all)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        sender = Node.objects.order_by('id').first()
+        if sender is None:
+            raise CommandError('No nodes found. Run create_demo_data first.')
+
+        rng = random.Random(options['seed'])
+        files = [rng.randbytes(options['size']) for _ in range(options['transfers'])]
+        chunks = []
+        for number, data in enumerate(files):
+            parts = multipart.split(data)
+            chunks += [(number, index, len(parts), part) for index, part in enumerate(parts)]
+        rng.shuffle(chunks)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== {len(files)} transfers of {options['size']} bytes, {len(chunks)} chunks "
+            f"in batches of {options['batch']} ===\n"
+        ))
+        for mode in options['modes'] or MODES:
+            media_files = [
+                MediaFile.objects.create(
+                    file_id=f'bench_{mode}_{number}',
+                    session_id=2**31 - 1 - number,
+                    media_type='file',
+                    filename=f'bench_{number}.bin',
+                    original_size=0,
+                    sender=sender,
+                    recipient=sender,
+                    status='receiving',
+                )
+                for number in range(len(files))
+            ]
+            try:
+                self.run(mode, media_files, files, chunks, options['batch'])
+            finally:
+                for media_file in media_files:
+                    media_file.refresh_from_db()
+                    if media_file.original_file:
+                        media_file.original_file.delete(save=False)
+                    multipart.discard_transfer(media_file)
+                    media_file.delete()
+
+    def run(self, mode, media_files, files, chunks, batch_size):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            for offset in range(0, len(chunks), batch_size):
+                batch = chunks[offset:offset + batch_size]
+                if mode == 'store':
+                    multipart.receive_chunks([
+                        (media_files[number].session_id, index, total, data)
+                        for number, index, total, data in batch
+                    ])
+                elif mode == 'rows':
+                    self.receive_rows(media_files, batch)
+                else:
+                    self.receive_rows_batched(media_files, batch)
+            receive_time = time.perf_counter() - started
+            receive_queries = queries[0]
+
+            started = time.perf_counter()
+            for media_file, data in zip(media_files, files):
+                if self.reassemble(mode, media_file) != data:
+                    raise CommandError(f'{mode}: reassembled file does not match')
+            reassemble_time = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{mode:>12}: {len(chunks) / receive_time:9,.0f} chunks/s '
+            f'({sum(map(len, files)) / receive_time / 1e6:6.2f} MB/s), '
+            f'{receive_queries / len(chunks):5.2f} queries/chunk, '
+            f'read back {reassemble_time / len(files) * 1000:6.1f} ms/transfer'
+        )
+
+    def receive_rows(self, media_files, batch):
+        """One row per chunk, with the progress saves the model implies"""
+        for number, index, total, data in batch:
+            media_file = media_files[number]
+            with transaction.atomic():
+                MultiPartPacket.objects.create(media_file=media_file, packet_index=index, data=data, size=len(data))
+                media_file.total_packets = total
+                media_file.received_packets += 1
+                media_file.save(update_fields=['total_packets', 'received_packets'])
+                media_file.update_progress()
+
+    def receive_rows_batched(self, media_files, batch):
+        """One row per chunk, inserted and counted once per batch and transfer"""
+        by_file = {}
+        for number, index, total, data in batch:
+            by_file.setdefault(number, []).append((index, total, data))
+        for number, file_chunks in by_file.items():
+            media_file = media_files[number]
+            with transaction.atomic():
+                MultiPartPacket.objects.bulk_create([
+                    MultiPartPacket(media_file=media_file, packet_index=index, data=data, size=len(data))
+                    for index, total, data in file_chunks
+                ], ignore_conflicts=True)
+                media_file.total_packets = file_chunks[0][1]
+                media_file.received_packets = media_file.packets.count()
+                media_file.progress = int(media_file.received_packets / media_file.total_packets * 100)
+                media_file.save(update_fields=['total_packets', 'received_packets', 'progress'])
+
+    def reassemble(self, mode, media_file):
+        if mode == 'store':
+            media_file.refresh_from_db()
+            with media_file.original_file.open('rb') as f:
+                return f.read()
+        return b''.join(
+            bytes(data) for data in media_file.packets.order_by('packet_index').values_list('data', flat=True)
+        )
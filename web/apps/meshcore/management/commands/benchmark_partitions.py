@@ -0,0 +1,118 @@
+"""
+Compare a day-partitioned packet table with a plain one: inserts, time-window queries and retention
+"""
+import statistics
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from psycopg2.extras import execute_values
+
+COLUMNS = """
+    id bigserial,
+    received_at timestamptz NOT NULL,
+    payload_type varchar(20) NOT NULL,
+    rssi integer
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Build a plain and a day-partitioned copy of a packet-like table in temporary tables and '
+        'time bulk loading, bridge-sized insert batches, 24h dashboard queries and retention'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000)
+        parser.add_argument('--days', type=int, default=30, help='Days of history to spread the rows over')
+        parser.add_argument('--retention', type=int, default=14, help='Days kept by the retention step')
+        parser.add_argument('--batches', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL')
+
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== {options['rows']:,} rows over {options['days']} days, "
+            f"retention {options['retention']} days ===\n"
+        ))
+        for layout in ('plain', 'partitioned'):
+            with transaction.atomic(), connection.cursor() as cursor:
+                self.run(cursor, layout, now, options)
+                # Temporary tables go with the transaction
+                transaction.set_rollback(True)
+
+    def run(self, cursor, layout, now, options):
+        table = f'bench_packet_{layout}'
+        if layout == 'plain':
+            cursor.execute(f'CREATE TEMP TABLE {table} ({COLUMNS}, PRIMARY KEY (id))')
+        else:
+            cursor.execute(
+                f'CREATE TEMP TABLE {table} ({COLUMNS}, PRIMARY KEY (id, received_at)) '
+                f'PARTITION BY RANGE (received_at)'
+            )
+            day = (now - timedelta(days=options['days'])).replace(hour=0)
+            while day <= now + timedelta(days=1):
+                cursor.execute(
+                    f'CREATE TEMP TABLE {table}_p{day:%Y%m%d} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                    [day, day + timedelta(days=1)]
+                )
+                day += timedelta(days=1)
+        cursor.execute(f'CREATE INDEX ON {table} (received_at)')
+        cursor.execute(f'CREATE INDEX ON {table} (payload_type, received_at)')
+
+        started = time.perf_counter()
+        cursor.execute(f"""
+            INSERT INTO {table} (received_at, payload_type, rssi)
+            SELECT %s - (random() * %s) * interval '1 day',
+                   (ARRAY['advert', 'txt_msg', 'ack', 'path', 'grp_txt'])[1 + (g %% 5)],
+                   -120 + (g %% 80)
+            FROM generate_series(1, %s) AS g
+        """, [now, options['days'], options['rows']])
+        load = time.perf_counter() - started
+        cursor.execute(f'ANALYZE {table}')
+
+        # Batches as the bridge's PacketStore writes them
+        timings = []
+        for _ in range(options['batches']):
+            rows = [(now, 'advert', -90)] * options['batch_size']
+            started = time.perf_counter()
+            execute_values(cursor, f'INSERT INTO {table} (received_at, payload_type, rssi) VALUES %s', rows)
+            timings.append(time.perf_counter() - started)
+        batch_ms = statistics.median(timings) * 1000
+
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            cursor.execute(
+                f'SELECT payload_type, count(*), avg(rssi) FROM {table} '
+                f'WHERE received_at >= %s AND received_at < %s GROUP BY payload_type',
+                [now - timedelta(hours=24), now + timedelta(hours=1)]
+            )
+            cursor.fetchall()
+            timings.append(time.perf_counter() - started)
+        query_ms = statistics.median(timings) * 1000
+
+        cutoff = (now - timedelta(days=options['retention'])).replace(hour=0)
+        started = time.perf_counter()
+        if layout == 'plain':
+            cursor.execute(f'DELETE FROM {table} WHERE received_at < %s', [cutoff])
+            removed = cursor.rowcount
+        else:
+            cursor.execute(f'SELECT count(*) FROM {table} WHERE received_at < %s', [cutoff])
+            removed = cursor.fetchone()[0]
+            day = (now - timedelta(days=options['days'])).replace(hour=0)
+            while day < cutoff:
+                cursor.execute(f'DROP TABLE {table}_p{day:%Y%m%d}')
+                day += timedelta(days=1)
+        retention = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{layout:>12}: load {options['rows'] / load:9,.0f} rows/s, "
+            f"{options['batch_size']}-row batch {batch_ms:5.1f} ms, "
+            f"24h query {query_ms:6.1f} ms, "
+            f"retention {retention * 1000:8.1f} ms ({removed:,} rows)"
+        )
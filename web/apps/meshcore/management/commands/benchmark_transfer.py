@@ -0,0 +1,223 @@
+"""
+Compare windowed NACK transfers with stop-and-wait over a simulated lossy mesh path
+"""
+import heapq
+import itertools
+import random
+import statistics
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.meshcore import multipart, transfer
+
+
+class Link:
+    """
+    A multi-hop path on one shared channel
+
+    Every packet is repeated by each hop, so it occupies the channel for
+    hops x airtime, is lost with probability 1 - (1 - loss)^hops and arrives
+    after each hop's airtime plus a random forwarding delay.
+    """
+
+    def __init__(self, rng, hops, loss, hop_delay):
+        self.rng = rng
+        self.hops = hops
+        self.loss = loss
+        self.hop_delay = hop_delay
+        self.busy_until = 0.0
+        self.packets = 0
+        self.channel_time = 0.0
+
+    def transmit(self, airtime, now):
+        """(start, arrival time or None if lost) of a packet queued at `now`"""
+        start = max(now, self.busy_until)
+        self.busy_until = start + airtime * self.hops
+        self.packets += 1
+        self.channel_time += airtime * self.hops
+        arrival = start
+        for _ in range(self.hops):
+            if self.rng.random() < self.loss:
+                return start, None
+            arrival += airtime + self.rng.uniform(0, 2 * self.hop_delay)
+        return start, arrival
+
+
+class Simulation:
+    def __init__(self):
+        self.events = []
+        self.counter = itertools.count()
+        self.now = 0.0
+
+    def at(self, time, kind, *args):
+        heapq.heappush(self.events, (time, next(self.counter), kind, args))
+
+    def run(self, handle, limit):
+        while self.events:
+            self.now, _, kind, args = heapq.heappop(self.events)
+            if self.now > limit:
+                return False
+            if handle(kind, *args):
+                return True
+        return False
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate sending a file over a lossy multi-hop LoRa path with windowed selective-NACK '
+        'transfers and with stop-and-wait, within the airtime budget, and compare completion times'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=7000, help='File size in bytes (default: a compressed image)')
+        parser.add_argument('--hops', type=int, default=3)
+        parser.add_argument('--loss', type=float, default=0.05, help='Loss probability per hop')
+        parser.add_argument('--hop-delay', type=float, default=None, help='Mean forwarding delay per hop (s)')
+        parser.add_argument('--duty-cycle', type=float, default=None, help='Airtime budget, e.g. 0.1 for 10%%')
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--limit', type=float, default=7 * 86400, help='Give up after this much simulated time (s)')
+
+    def handle(self, *args, **options):
+        hop_delay = options['hop_delay'] if options['hop_delay'] is not None else settings.MESHCORE_LORA_HOP_DELAY
+        total = len(multipart.split(bytes(options['size'])))
+        chunk_airtime = transfer.packet_airtime(multipart.MAX_PACKET_PAYLOAD, options['hops'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== {options['size']} bytes ({total} chunks, {chunk_airtime:.2f}s airtime each), "
+            f"{options['hops']} hops, {options['loss']:.0%} loss per hop, "
+            f"{(1 - (1 - options['loss']) ** options['hops']):.0%} end to end, "
+            f"duty cycle {options['duty_cycle'] or settings.MESHCORE_LORA_DUTY_CYCLE:.0%} ===\n"
+        ))
+
+        results = {}
+        for name, protocol in (('windowed', self.windowed), ('stop-and-wait', self.stop_and_wait)):
+            runs = []
+            for run in range(options['runs']):
+                rng = random.Random(options['seed'] * 1000 + run)
+                link = Link(rng, options['hops'], options['loss'], hop_delay)
+                budget = transfer.AirtimeBudget(duty_cycle=options['duty_cycle'])
+                result = protocol(total, options['hops'], link, budget, options['limit'])
+                if result is None:
+                    raise CommandError(f'{name}: transfer did not finish within {options["limit"]}s')
+                result['airtime'] = budget.used
+                runs.append(result)
+            results[name] = runs
+            self.report(name, runs, total)
+
+        windowed = statistics.median(run['time'] for run in results['windowed'])
+        stop_and_wait = statistics.median(run['time'] for run in results['stop-and-wait'])
+        self.stdout.write(self.style.SUCCESS(f'\nWindowed transfers finish {stop_and_wait / windowed:.1f}x faster'))
+
+    def report(self, name, runs, total):
+        times = sorted(run['time'] for run in runs)
+        sent = statistics.mean(run['sent'] for run in runs)
+        self.stdout.write(
+            f"{name:>14}: median {self.duration(statistics.median(times))}, "
+            f"range {self.duration(times[0])}-{self.duration(times[-1])}, "
+            f"{sent:.0f} chunks sent ({sent / total:.2f}x), "
+            f"{statistics.mean(run['control'] for run in runs):.0f} ACK/NACK packets, "
+            f"{statistics.mean(run['airtime'] for run in runs):.0f}s sender airtime"
+        )
+
+    def duration(self, seconds):
+        if seconds >= 3600:
+            return f'{seconds / 3600:.1f}h'
+        if seconds >= 60:
+            return f'{seconds / 60:.1f}m'
+        return f'{seconds:.0f}s'
+
+    def windowed(self, total, hops, link, budget, limit):
+        sender = transfer.WindowedSender(total, hops=hops, budget=budget)
+        receiver = transfer.NackScheduler(total)
+        # The receiver is another node with its own duty cycle limit
+        receiver_budget = transfer.AirtimeBudget(duty_cycle=budget.duty_cycle)
+        sim = Simulation()
+        state = {'sending': False, 'control': 0}
+        tick = max(1.0, sender.chunk_airtime)
+
+        def schedule_send():
+            if state['sending']:
+                return
+            upcoming = sender.next_send(sim.now)
+            if upcoming is not None:
+                state['sending'] = True
+                sim.at(upcoming[1], 'send', upcoming[0])
+
+        def handle(kind, *args):
+            if kind == 'send':
+                state['sending'] = False
+                # NACKs may have changed what to send next while waiting
+                upcoming = sender.next_send(sim.now)
+                if upcoming is not None and upcoming[1] <= sim.now:
+                    index = upcoming[0]
+                    start, arrival = link.transmit(sender.chunk_airtime, sim.now)
+                    sender.sent(index, start)
+                    if arrival is not None:
+                        sim.at(arrival, 'chunk', index)
+                schedule_send()
+            elif kind == 'chunk':
+                receiver.on_chunk(args[0], sim.now)
+                send_nack()
+            elif kind == 'nack':
+                sender.on_nack(args[0], args[1], sim.now)
+                if sender.done:
+                    return True
+                schedule_send()
+            elif kind == 'tick':
+                send_nack()
+                sender.check_timeout(sim.now)
+                schedule_send()
+                sim.at(sim.now + tick, 'tick')
+            return False
+
+        def send_nack():
+            if not receiver.due(sim.now):
+                return
+            base, missing = receiver.nack(sim.now)
+            payload = multipart.encode_nack(0, base, missing)
+            if len(payload) > multipart.MAX_PACKET_PAYLOAD:
+                raise CommandError('NACK does not fit in a packet')
+            cost = transfer.nack_airtime(missing, hops)
+            at = sim.now + receiver_budget.delay(cost, sim.now)
+            receiver_budget.consume(cost, at)
+            start, arrival = link.transmit(cost, at)
+            state['control'] += 1
+            if arrival is not None:
+                sim.at(arrival, 'nack', base, missing)
+
+        schedule_send()
+        sim.at(tick, 'tick')
+        if not sim.run(handle, limit):
+            return None
+        return {'time': sim.now, 'sent': sender.stats['sent'], 'control': state['control']}
+
+    def stop_and_wait(self, total, hops, link, budget, limit):
+        chunk_airtime = transfer.packet_airtime(multipart.MAX_PACKET_PAYLOAD, hops)
+        ack_airtime = transfer.packet_airtime(multipart.HEADER.size, hops)
+        receiver_budget = transfer.AirtimeBudget(duty_cycle=budget.duty_cycle)
+        # Fixed timeout: a chunk and its ACK over every hop, with the worst forwarding delays
+        timeout = hops * (chunk_airtime + ack_airtime + 4 * link.hop_delay)
+        now = 0.0
+        sent = control = 0
+        index = 0
+        while index < total:
+            if now > limit:
+                return None
+            now += budget.delay(chunk_airtime, now)
+            start, arrival = link.transmit(chunk_airtime, now)
+            budget.consume(chunk_airtime, start)
+            sent += 1
+            acked_at = None
+            if arrival is not None:
+                at = arrival + receiver_budget.delay(ack_airtime, arrival)
+                receiver_budget.consume(ack_airtime, at)
+                ack_start, ack_arrival = link.transmit(ack_airtime, at)
+                control += 1
+                if ack_arrival is not None and ack_arrival - start <= timeout:
+                    acked_at = ack_arrival
+            if acked_at is None:
+                now = start + timeout
+            else:
+                now = acked_at
+                index += 1
+        return {'time': now, 'sent': sent, 'control': control}
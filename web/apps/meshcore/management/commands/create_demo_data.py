@@ -9,6 +9,7 @@ import os
 from apps.meshcore.models import (
     Node, Channel, Message, NodeStats, BridgeConfiguration, BridgeStatus
 )
+from apps.meshcore.ingest import ingest_messages, ingest_node_stats
 
 
 class Command(BaseCommand):
@@ -123,11 +124,12 @@ class Command(BaseCommand):
             "All clear here",
         ]
         
+        messages = []
         for i in range(30):
             sender = random.choice(online_nodes)
             recipient = random.choice([n for n in online_nodes if n != sender])
             
-            message = Message.objects.create(
+            messages.append(Message(
                 message_id=f"msg_{i}_{sender.node_hash}_{int(timezone.now().timestamp())}",
                 checksum=format(random.randint(0, 0xFFFFFFFF), '08x'),
                 sender=sender,
@@ -140,16 +142,14 @@ class Command(BaseCommand):
                 timestamp=timezone.now() - timedelta(minutes=random.randint(1, 120)),
                 rssi=random.randint(-120, -40),
                 snr=random.uniform(-10, 10),
-            )
-        
-        self.stdout.write(f"  Created 30 messages")
+            ))
         
         # Create group messages
         for i in range(10):
             sender = random.choice(online_nodes)
             channel = random.choice(channels)
             
-            message = Message.objects.create(
+            messages.append(Message(
                 message_id=f"grp_{i}_{sender.node_hash}_{int(timezone.now().timestamp())}",
                 checksum=format(random.randint(0, 0xFFFFFFFF), '08x'),
                 sender=sender,
@@ -161,13 +161,16 @@ class Command(BaseCommand):
                 timestamp=timezone.now() - timedelta(minutes=random.randint(1, 120)),
                 rssi=random.randint(-120, -40),
                 snr=random.uniform(-10, 10),
-            )
+            ))
         
+        ingest_messages(messages)
+        self.stdout.write(f"  Created 30 messages")
         self.stdout.write(f"  Created 10 group messages")
         
         # Create node stats
+        node_stats = []
         for node in online_nodes:
-            stats = NodeStats.objects.create(
+            node_stats.append(NodeStats(
                 node=node,
                 battery_mv=random.randint(3200, 4200),
                 rssi=random.randint(-120, -40),
@@ -180,8 +183,9 @@ class Command(BaseCommand):
                 uptime_seconds=random.randint(3600, 86400),
                 tx_queue_length=random.randint(0, 10),
                 free_queue_length=random.randint(10, 50),
-            )
+            ))
         
+        ingest_node_stats(node_stats)
         self.stdout.write(f"  Created stats for {len(online_nodes)} nodes")
         
         # Create bridge configuration
@@ -0,0 +1,101 @@
+"""
+Measure API throughput and latency of a running server under concurrency
+"""
+import threading
+import time
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/meshcore/api/status/', '/meshcore/api/nodes/', '/meshcore/api/messages/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Poll API endpoints of a running server from concurrent clients, optionally while other '
+        'clients keep slow requests (e.g. MQTT connection tests) in flight, and report latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Server to test, e.g. http://localhost:8000')
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help=f"Path to poll (repeatable, default {', '.join(DEFAULT_PATHS)})",
+        )
+        parser.add_argument('--concurrency', type=int, default=20, help='Polling clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run')
+        parser.add_argument('--slow-path', help='Path POSTed continuously by the slow clients')
+        parser.add_argument('--slow-body', default='{}', help='JSON body of the slow requests')
+        parser.add_argument('--slow-clients', type=int, default=3)
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        paths = options['paths'] or DEFAULT_PATHS
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        results = {'poll': [], 'slow': []}
+        errors = {'poll': 0, 'slow': 0}
+
+        def client(kind, index):
+            session = requests.Session()
+            n = index
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                try:
+                    if kind == 'slow':
+                        response = session.post(
+                            base_url + options['slow_path'], data=options['slow_body'],
+                            headers={'Content-Type': 'application/json'}, timeout=60,
+                        )
+                    else:
+                        response = session.get(base_url + paths[n % len(paths)], timeout=60)
+                    ok = response.status_code < 400
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.monotonic() - started
+                with lock:
+                    if ok:
+                        results[kind].append(elapsed)
+                    else:
+                        errors[kind] += 1
+                n += 1
+
+        try:
+            requests.get(base_url + paths[0], timeout=10)
+        except requests.RequestException as e:
+            raise CommandError(f'Server not reachable: {e}')
+
+        threads = [threading.Thread(target=client, args=('poll', i)) for i in range(options['concurrency'])]
+        if options['slow_path']:
+            threads += [threading.Thread(target=client, args=('slow', i)) for i in range(options['slow_clients'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== {base_url}: {options['concurrency']} polling clients"
+            + (f", {options['slow_clients']} slow clients" if options['slow_path'] else '')
+            + f', {elapsed:.1f}s ===\n'
+        ))
+        for kind in ('poll', 'slow'):
+            if kind == 'slow' and not options['slow_path']:
+                continue
+            self.report(kind, sorted(results[kind]), errors[kind], elapsed)
+
+    def report(self, kind, latencies, errors, elapsed):
+        if not latencies:
+            self.stdout.write(f'{kind}: no successful requests ({errors} errors)')
+            return
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            f'{kind}: {len(latencies)} ok, {errors} errors, {len(latencies) / elapsed:.1f} req/s, '
+            f'p50 {percentile(0.5):.0f} ms, p95 {percentile(0.95):.0f} ms, '
+            f'p99 {percentile(0.99):.0f} ms, max {latencies[-1] * 1000:.0f} ms'
+        )
@@ -0,0 +1,60 @@
+"""
+Maintain time-partitioned tables
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.meshcore.models import Packet, NodeStats
+from apps.meshcore import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming partitions, drop expired ones and optionally check partition pruning'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-drop',
+            action='store_true',
+            help='Only create partitions, do not drop expired ones',
+        )
+        parser.add_argument(
+            '--check-pruning',
+            action='store_true',
+            help='EXPLAIN the dashboard time-window queries and report partitions scanned',
+        )
+
+    def handle(self, *args, **options):
+        for table in partitions.PARTITIONED_TABLES:
+            if not partitions.is_partitioned(table):
+                self.stdout.write(self.style.WARNING(f'{table} is not partitioned (requires PostgreSQL), skipping'))
+                continue
+            
+            created = partitions.ensure_partitions(table)
+            dropped = [] if options['no_drop'] else partitions.drop_expired_partitions(table)
+            total = len(partitions.list_partitions(table))
+            
+            self.stdout.write(f'{table}: {total} partitions, created {len(created)}, dropped {len(dropped)}')
+            for name in dropped:
+                self.stdout.write(f'  Dropped {name}')
+        
+        if options['check_pruning']:
+            self.check_pruning()
+
+    def check_pruning(self):
+        """Verify that time-window queries only touch the partitions they need"""
+        now = timezone.now()
+        since = now - timedelta(hours=24)
+        queries = [
+            ('meshcore_packet', 'Packets in last 24h',
+             Packet.objects.filter(received_at__range=(since, now)).values('payload_type')),
+            ('meshcore_nodestats', 'Node stats in last 24h',
+             NodeStats.objects.filter(collected_at__range=(since, now)).values('node_id')),
+        ]
+        
+        self.stdout.write(self.style.SUCCESS('\n=== Partition Pruning ===\n'))
+        for table, label, queryset in queries:
+            if not partitions.is_partitioned(table):
+                continue
+            scanned, total = partitions.explain_partitions_scanned(queryset, table)
+            style = self.style.SUCCESS if scanned < total or total <= 1 else self.style.ERROR
+            self.stdout.write(style(f'{label}: scans {scanned} of {total} partitions'))
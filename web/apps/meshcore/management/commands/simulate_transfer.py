@@ -0,0 +1,162 @@
+"""
+Send a file through the multipart engine over a simulated lossy link
+"""
+import hashlib
+import os
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.meshcore import multipart
+from apps.meshcore.models import Node
+from apps.meshcore.models_multimedia import MediaFile
+
+
+class Command(BaseCommand):
+    help = (
+        'Split a file into MULTIPART packets, pass them through a link that drops, duplicates '
+        'and reorders packets, reassemble them (in memory or through the database) and verify the result'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='File to send (default random bytes)')
+        parser.add_argument('--size', type=int, default=20000, help='Size of the random file in bytes')
+        parser.add_argument('--loss', type=float, default=0.2, help='Probability a packet is lost')
+        parser.add_argument('--duplicate', type=float, default=0.05, help='Probability a packet arrives twice')
+        parser.add_argument('--reorder', type=int, default=8, help='Packets may arrive up to this many places late')
+        parser.add_argument('--max-rounds', type=int, default=100, help='Give up after this many rounds')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible run')
+        parser.add_argument(
+            '--database',
+            action='store_true',
+            help='Reassemble through receive_chunks() into a temporary MediaFile instead of in memory',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['file']:
+            with open(options['file'], 'rb') as f:
+                data = f.read()
+            filename = os.path.basename(options['file'])
+        else:
+            data = rng.randbytes(options['size'])
+            filename = 'simulated.bin'
+
+        session_id = rng.randrange(2**31)
+        try:
+            chunks = multipart.split(data)
+        except ValueError as e:
+            raise CommandError(str(e))
+        total = len(chunks)
+        payloads = [multipart.encode_chunk(session_id, index, total, chunk) for index, chunk in enumerate(chunks)]
+
+        if options['database']:
+            receiver = DatabaseReceiver(session_id, total, filename, len(data))
+        else:
+            receiver = MemoryReceiver(session_id, total)
+
+        # Each round the sender sends every chunk the receiver reports missing
+        started = time.monotonic()
+        stats = {'sent': 0, 'lost': 0, 'delivered': 0, 'duplicates': 0}
+        missing = list(range(total))
+        rounds = 0
+        try:
+            while missing:
+                rounds += 1
+                if rounds > options['max_rounds']:
+                    raise CommandError(f'{len(missing)} of {total} chunks still missing after {rounds - 1} rounds')
+                arrivals = self.transmit([payloads[index] for index in missing], rng, options, stats)
+                receiver.receive([multipart.decode_chunk(payload) for payload in arrivals])
+                missing = receiver.missing()
+            elapsed = time.monotonic() - started
+            result = receiver.result()
+        finally:
+            receiver.close()
+
+        if hashlib.sha256(result).digest() != hashlib.sha256(data).digest():
+            raise CommandError('Reassembled file does not match the original')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Transferred {len(data)} bytes in {total} chunks of up to {multipart.CHUNK_SIZE} bytes: '
+            f'{rounds} rounds, {stats["sent"]} packets sent ({stats["sent"] / total:.2f}x), '
+            f'{stats["lost"]} lost, {stats["delivered"]} delivered, {receiver.duplicates} duplicates ignored, '
+            f'{elapsed * 1000:.0f} ms; reassembled file verified'
+        ))
+
+    def transmit(self, payloads, rng, options, stats):
+        """Packets arriving at the receiver, after loss, duplication and reordering"""
+        arrivals = []
+        for position, payload in enumerate(payloads):
+            stats['sent'] += 1
+            if rng.random() < options['loss']:
+                stats['lost'] += 1
+                continue
+            copies = 2 if rng.random() < options['duplicate'] else 1
+            for _ in range(copies):
+                arrivals.append((position + rng.uniform(0, options['reorder']), payload))
+            stats['delivered'] += copies
+        arrivals.sort(key=lambda arrival: arrival[0])
+        return [payload for _, payload in arrivals]
+
+
+class MemoryReceiver:
+    def __init__(self, session_id, total):
+        self.reassembler = multipart.Reassembler(session_id, total)
+
+    @property
+    def duplicates(self):
+        return self.reassembler.duplicates
+
+    def receive(self, chunks):
+        for session_id, index, total, data in chunks:
+            self.reassembler.add(index, total, data)
+
+    def missing(self):
+        return self.reassembler.missing()
+
+    def result(self):
+        return self.reassembler.assemble()
+
+    def close(self):
+        pass
+
+
+class DatabaseReceiver:
+    def __init__(self, session_id, total, filename, size):
+        self.total = total
+        nodes = list(Node.objects.order_by('id')[:2])
+        if not nodes:
+            raise CommandError('No nodes found. Run create_demo_data first.')
+        self.duplicates = 0
+        self.media_file = MediaFile.objects.create(
+            file_id=f'sim_{session_id:x}',
+            session_id=session_id,
+            media_type='file',
+            filename=filename,
+            original_size=size,
+            sender=nodes[0],
+            recipient=nodes[-1],
+            status='receiving',
+        )
+
+    def receive(self, chunks):
+        stats = multipart.receive_chunks(chunks)
+        self.duplicates += stats['duplicate']
+
+    def missing(self):
+        self.media_file.refresh_from_db()
+        bitmap = multipart.received_bitmap(self.media_file)
+        # Until a chunk arrives the receiver doesn't know the chunk count; the sender does
+        return bitmap.missing() if bitmap else list(range(self.total))
+
+    def result(self):
+        self.media_file.refresh_from_db()
+        if self.media_file.status != 'received':
+            raise CommandError(f'Transfer ended in status {self.media_file.status!r}')
+        with self.media_file.original_file.open('rb') as f:
+            return f.read()
+
+    def close(self):
+        if self.media_file.original_file:
+            self.media_file.original_file.delete(save=False)
+        multipart.discard_transfer(self.media_file)
+        self.media_file.delete()
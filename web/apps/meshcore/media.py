@@ -0,0 +1,199 @@
+"""
+Media compression for mesh transfers
+
+Uploaded images and voice messages are far too large to send as 176-byte
+multipart chunks, so process_media() (run by a Celery task on the media
+queue) turns them into a LoRa-sized compressed_file:
+
+- Images are orientation-corrected, downscaled and re-encoded (WebP, or
+  progressive JPEG where Pillow lacks WebP) at the highest quality that
+  fits MESHCORE_MEDIA_IMAGE_BUDGET bytes, found by binary search. If even
+  the lowest quality is too large the image is scaled down further.
+  A small JPEG thumbnail is stored for the gallery.
+- Voice is transcoded with ffmpeg to mono Opus at a very low bitrate
+  (MESHCORE_MEDIA_VOICE_BITRATE).
+
+The result, size and processing time are recorded in metadata and the
+file moves to 'ready'.
+"""
+import io
+import logging
+import subprocess
+import time
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+MIN_QUALITY = 10
+MAX_QUALITY = 90
+MIN_DIMENSION = 48  # Give up shrinking below this many pixels on the long side
+SHRINK_FACTOR = 0.75
+THUMBNAIL_SIZE = 128
+THUMBNAIL_QUALITY = 70
+
+
+class MediaError(Exception):
+    """Media could not be compressed"""
+
+
+def _image_format():
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=quality, method=6)
+    else:
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _best_quality(image, fmt, budget):
+    """Highest quality encoding within the budget, or None; also returns the number of encodes"""
+    low, high = MIN_QUALITY, MAX_QUALITY
+    best = None
+    encodes = 0
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, fmt, quality)
+        encodes += 1
+        if len(data) <= budget:
+            best = (data, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best, encodes
+
+
+def _open_image(data, max_dimension):
+    """Decoded image (at reduced scale where possible) and its original size"""
+    image = Image.open(io.BytesIO(data))
+    size = image.size
+    # JPEG can decode straight to a reduced scale, which is much faster for camera photos
+    image.draft('RGB', (max_dimension, max_dimension))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image, size
+
+
+def compress_image(data, budget=None, max_dimension=None):
+    """
+    Re-encode an image to at most `budget` bytes
+
+    Returns (compressed bytes, thumbnail bytes, metadata).
+    """
+    budget = budget or settings.MESHCORE_MEDIA_IMAGE_BUDGET
+    max_dimension = max_dimension or settings.MESHCORE_MEDIA_IMAGE_MAX_DIMENSION
+    try:
+        source, original_resolution = _open_image(data, max_dimension)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise MediaError(f'Not a readable image: {e}')
+
+    fmt = _image_format()
+    if fmt == 'JPEG' and source.mode != 'RGB':
+        source = source.convert('RGB')
+
+    dimension = max_dimension
+    encodes = 0
+    while True:
+        image = source.copy()
+        image.thumbnail((dimension, dimension), Image.LANCZOS, reducing_gap=3.0)
+        best, count = _best_quality(image, fmt, budget)
+        encodes += count
+        if best is not None:
+            break
+        if dimension <= MIN_DIMENSION:
+            raise MediaError(f'Image does not fit in {budget} bytes even at {image.width}x{image.height}')
+        dimension = max(MIN_DIMENSION, int(dimension * SHRINK_FACTOR))
+    compressed, quality = best
+
+    thumbnail = source.copy()
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    buffer = io.BytesIO()
+    thumbnail.convert('RGB').save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+
+    return compressed, buffer.getvalue(), {
+        'format': fmt,
+        'resolution': f'{image.width}x{image.height}',
+        'original_resolution': f'{original_resolution[0]}x{original_resolution[1]}',
+        'quality': quality,
+        'encodes': encodes,
+    }
+
+
+def transcode_voice(data, bitrate=None):
+    """
+    Transcode audio to mono Opus in Ogg at a very low bitrate
+
+    Returns (compressed bytes, metadata).
+    """
+    bitrate = bitrate or settings.MESHCORE_MEDIA_VOICE_BITRATE
+    command = [
+        settings.MESHCORE_MEDIA_FFMPEG, '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-vn', '-ac', '1', '-ar', '8000',
+        '-c:a', 'libopus', '-b:a', str(bitrate), '-application', 'voip', '-frame_duration', '60',
+        '-f', 'ogg', 'pipe:1',
+    ]
+    try:
+        result = subprocess.run(
+            command, input=data, capture_output=True, timeout=settings.MESHCORE_MEDIA_TIMEOUT
+        )
+    except FileNotFoundError:
+        raise MediaError(f'{settings.MESHCORE_MEDIA_FFMPEG} not found')
+    except subprocess.TimeoutExpired:
+        raise MediaError(f'Transcoding took longer than {settings.MESHCORE_MEDIA_TIMEOUT}s')
+    if result.returncode != 0 or not result.stdout:
+        raise MediaError(f'ffmpeg failed: {result.stderr.decode(errors="replace").strip()[-500:]}')
+    return result.stdout, {'format': 'OGG', 'codec': 'Opus', 'bitrate': bitrate, 'sample_rate': 8000}
+
+
+def process_media(media_file):
+    """Compress an uploaded media file for sending and mark it ready (or failed)"""
+    started = time.perf_counter()
+    media_file.status = 'processing'
+    media_file.save(update_fields=['status'])
+
+    try:
+        with media_file.original_file.open('rb') as f:
+            data = f.read()
+
+        thumbnail = None
+        if media_file.media_type == 'image':
+            compressed, thumbnail, info = compress_image(data)
+            extension = 'webp' if info['format'] == 'WEBP' else 'jpg'
+        elif media_file.media_type == 'voice':
+            compressed, info = transcode_voice(data)
+            extension = 'ogg'
+        else:
+            compressed, info, extension = data, {}, None
+    except (MediaError, OSError, ValueError) as e:
+        logger.warning(f"Could not process media file {media_file.file_id}: {e}")
+        media_file.status = 'failed'
+        media_file.metadata = {**media_file.metadata, 'error': str(e)}
+        media_file.save(update_fields=['status', 'metadata'])
+        return None
+
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    if extension:
+        media_file.compressed_file.save(f'{media_file.file_id}.{extension}', ContentFile(compressed), save=False)
+    if thumbnail:
+        media_file.thumbnail.save(f'{media_file.file_id}.jpg', ContentFile(thumbnail), save=False)
+    media_file.compressed_size = len(compressed)
+    media_file.metadata = {
+        **media_file.metadata,
+        **info,
+        'compressed_size': len(compressed),
+        'compression_ratio': round(len(data) / len(compressed), 1) if compressed else None,
+        'processing_ms': elapsed_ms,
+    }
+    media_file.status = 'ready'
+    media_file.save(update_fields=['compressed_file', 'thumbnail', 'compressed_size', 'metadata', 'status'])
+    logger.info(
+        f"Compressed {media_file.filename}: {len(data)} -> {len(compressed)} bytes in {elapsed_ms} ms"
+    )
+    return media_file
@@ -0,0 +1,225 @@
+"""
+Per-request performance metrics
+
+RequestMetricsMiddleware (middleware.py) times every request and records
+its response size. For a sample of requests (MESHCORE_METRICS_SAMPLE_RATE,
+or any request sent with `X-Request-Metrics: 1`) it also counts the SQL
+queries the request runs and their database time, through an execute
+wrapper installed on every connection. A context variable ties queries to
+their request, including queries of async views run in sync_to_async
+threads.
+
+Figures are aggregated per view into latency histograms, buffered per
+process and added to the cache every few seconds like the conditional GET
+stats, so api_metrics covers all workers when the cache is Redis. Requests
+slower than MESHCORE_SLOW_REQUEST_MS are written to the slow request log
+with their slowest and most repeated statements; a statement repeated many
+times in one request is the signature of an N+1 query.
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('apps.meshcore.slow_requests')
+
+# Upper bounds of the latency histogram buckets (ms); slower requests count as +Inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+STATS_KEY = 'meshcore:metrics:{view}:{field}'
+VIEWS_KEY = 'meshcore:metrics:views'
+FIELDS = ('requests', 'errors', 'time_us', 'bytes', 'sampled', 'queries', 'db_us') + tuple(
+    f'le_{bound}' for bound in LATENCY_BUCKETS_MS
+) + ('le_inf',)
+FLUSH_INTERVAL = 5  # Seconds between writing buffered counts to the cache
+TIMING_HEADER = 'HTTP_X_REQUEST_METRICS'
+
+# Statements kept per request for the slow request log
+SLOW_STATEMENTS = 3
+SQL_PREVIEW = 500
+
+_current = ContextVar('meshcore_request_metrics', default=None)
+_views = set()
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = 0.0
+
+
+class RequestMetrics:
+    """Queries of one sampled request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []  # Min-heap of (seconds, sql)
+        self.statements = Counter()
+
+    def add(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.statements[sql] += 1
+        if len(self.slowest) < SLOW_STATEMENTS:
+            heapq.heappush(self.slowest, (duration, sql))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, sql))
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.add(sql, time.perf_counter() - started)
+
+
+def install_wrapper(sender, connection, **kwargs):
+    """connection_created receiver: time the connection's queries"""
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+def start(request):
+    """Begin measuring a request; returns the state finish() needs"""
+    sampled = TIMING_HEADER in request.META or random.random() < settings.MESHCORE_METRICS_SAMPLE_RATE
+    request_metrics = RequestMetrics() if sampled else None
+    return time.perf_counter(), request_metrics, _current.set(request_metrics)
+
+
+def abandon(state):
+    """Stop measuring a request that raised"""
+    _current.reset(state[2])
+
+
+def finish(request, response, state):
+    """Record the request, log it if slow and add the timing headers if asked for"""
+    started, request_metrics, token = state
+    elapsed = time.perf_counter() - started
+    _current.reset(token)
+
+    match = request.resolver_match
+    view = match.view_name if match else '<unresolved>'
+    size = None if response.streaming else len(response.content)
+    _record(view, response.status_code, elapsed, size, request_metrics)
+
+    if elapsed * 1000 >= settings.MESHCORE_SLOW_REQUEST_MS:
+        _log_slow(request, view, response.status_code, elapsed, request_metrics)
+
+    if request_metrics is not None and TIMING_HEADER in request.META:
+        response['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={request_metrics.db_time * 1000:.1f};desc="{request_metrics.queries} queries"'
+        )
+        response['X-Query-Count'] = str(request_metrics.queries)
+    return response
+
+
+def _record(view, status, elapsed, size, request_metrics):
+    """Count a request; counts are buffered and written to the cache every few seconds"""
+    global _pending, _last_flush
+    elapsed_ms = elapsed * 1000
+    bucket = next((f'le_{bound}' for bound in LATENCY_BUCKETS_MS if elapsed_ms <= bound), 'le_inf')
+
+    with _lock:
+        _views.add(view)
+        _pending[(view, 'requests')] += 1
+        _pending[(view, bucket)] += 1
+        _pending[(view, 'time_us')] += int(elapsed * 1e6)
+        if status >= 500:
+            _pending[(view, 'errors')] += 1
+        if size is not None:
+            _pending[(view, 'bytes')] += size
+        if request_metrics is not None:
+            _pending[(view, 'sampled')] += 1
+            _pending[(view, 'queries')] += request_metrics.queries
+            _pending[(view, 'db_us')] += int(request_metrics.db_time * 1e6)
+
+        now = time.monotonic()
+        if now - _last_flush < FLUSH_INTERVAL:
+            return
+        pending, _pending, _last_flush = _pending, Counter(), now
+        views = set(_views)
+
+    try:
+        known = cache.get(VIEWS_KEY) or []
+        if not views.issubset(known):
+            cache.set(VIEWS_KEY, sorted(views.union(known)), timeout=None)
+        for (view_name, field), count in pending.items():
+            key = STATS_KEY.format(view=view_name, field=field)
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, count)
+    except Exception as e:
+        logger.warning(f"Could not store request metrics: {e}")
+
+
+def _log_slow(request, view, status, elapsed, request_metrics):
+    lines = [f'{request.method} {request.get_full_path()} ({view}) -> {status} in {elapsed * 1000:.0f} ms']
+    if request_metrics is None:
+        lines.append('  queries not sampled')
+    else:
+        lines.append(f'  {request_metrics.queries} queries, {request_metrics.db_time * 1000:.0f} ms in the database')
+        for duration, sql in sorted(request_metrics.slowest, reverse=True):
+            lines.append(f'  {duration * 1000:8.1f} ms  {sql[:SQL_PREVIEW]}')
+        for sql, count in request_metrics.statements.most_common(SLOW_STATEMENTS):
+            if count > 1:
+                lines.append(f'  {count:6d} times  {sql[:SQL_PREVIEW]}')
+    slow_logger.warning('\n'.join(lines))
+
+
+def _percentile(histogram, total, fraction):
+    """Upper bound (ms) of the bucket holding the given fraction of requests"""
+    seen = 0
+    for bound in LATENCY_BUCKETS_MS:
+        seen += histogram[f'le_{bound}']
+        if seen >= total * fraction:
+            return bound
+    return None
+
+
+def get_stats():
+    """Per-view request counts, latency histogram and percentiles, query and size averages"""
+    with _lock:
+        views = set(_views)
+        pending = dict(_pending)
+    views.update(cache.get(VIEWS_KEY) or [])
+
+    keys = {
+        STATS_KEY.format(view=view, field=field): (view, field)
+        for view in views for field in FIELDS
+    }
+    values = cache.get_many(list(keys))
+
+    stats = {}
+    for key, (view, field) in keys.items():
+        view_stats = stats.setdefault(view, dict.fromkeys(FIELDS, 0))
+        view_stats[field] += values.get(key, 0) + pending.get((view, field), 0)
+
+    result = {}
+    for view, counts in sorted(stats.items()):
+        requests = counts['requests']
+        if not requests:
+            continue
+        sampled = counts['sampled']
+        histogram = {f'le_{bound}': counts[f'le_{bound}'] for bound in LATENCY_BUCKETS_MS}
+        result[view] = {
+            'requests': requests,
+            'errors': counts['errors'],
+            'sampled': sampled,
+            'avg_ms': round(counts['time_us'] / requests / 1000, 1),
+            'p50_ms': _percentile(histogram, requests, 0.5),
+            'p95_ms': _percentile(histogram, requests, 0.95),
+            'p99_ms': _percentile(histogram, requests, 0.99),
+            'avg_queries': round(counts['queries'] / sampled, 1) if sampled else None,
+            'avg_db_ms': round(counts['db_us'] / sampled / 1000, 1) if sampled else None,
+            'avg_bytes': round(counts['bytes'] / requests),
+            'histogram_ms': {**{str(bound): count for bound, count in zip(LATENCY_BUCKETS_MS, histogram.values())},
+                             '+Inf': counts['le_inf']},
+        }
+    return result
@@ -0,0 +1,41 @@
+"""
+MeshCore middleware
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Request timing, query counts and the slow request log (see metrics.py)
+
+    Sync and async capable, so it adds no thread switch under ASGI. Place
+    it after WhiteNoise so static files are not measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = metrics.start(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            metrics.abandon(state)
+            raise
+        return metrics.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = metrics.start(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            metrics.abandon(state)
+            raise
+        return metrics.finish(request, response, state)
@@ -0,0 +1,23 @@
+# Fields written back by the bridge's ACK correlation
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0004_update_bridge_configuration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='acked_at',
+            field=models.DateTimeField(blank=True, help_text='When the ACK was received', null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='ack_latency_ms',
+            field=models.IntegerField(blank=True, help_text='Time from message to ACK in milliseconds', null=True),
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Convert meshcore_packet and meshcore_nodestats into range-partitioned tables
+#
+# PostgreSQL only. Django's model state is unchanged: the tables keep their
+# columns, indexes and foreign keys; only the physical layout changes. The
+# primary key becomes (id, <partition key>) because PostgreSQL requires the
+# partition key in every unique constraint, and the identity column becomes
+# a plain sequence default because PostgreSQL 15 does not support identity
+# columns on partitioned tables.
+
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations
+
+
+TABLES = [
+    # table, partition key, partition size in days
+    ('meshcore_packet', 'received_at', 1),
+    ('meshcore_nodestats', 'collected_at', 7),
+]
+
+DAYS_AHEAD = 14
+
+
+def partition_start(value, days):
+    start = value.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if days == 7:
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def convert_table(cursor, table, column, days):
+    old = f'{table}_old'
+
+    # Remember indexes and foreign keys so they can be recreated with the same names
+    cursor.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname <> %s
+    """, [table, f'{table}_pkey'])
+    indexes = cursor.fetchall()
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+    """, [table])
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f'SELECT min({column}), max(id) FROM "{table}"')
+    oldest, max_id = cursor.fetchone()
+
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    cursor.execute(
+        f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE ({column})'
+    )
+
+    # Partitions from the oldest row up to DAYS_AHEAD in the future
+    now = datetime.now(timezone.utc)
+    start = partition_start(oldest or now, days)
+    while start <= now + timedelta(days=DAYS_AHEAD):
+        end = start + timedelta(days=days)
+        cursor.execute(
+            f'CREATE TABLE "{table}_p{start:%Y%m%d}" PARTITION OF "{table}" '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+        start = end
+
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+    cursor.execute(f'DROP TABLE "{old}"')
+
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, {column})')
+    # Definitions were read before the rename, so they already target the new table
+    for name, definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+    cursor.execute(f'CREATE SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+    cursor.execute(f"SELECT setval('{table}_id_seq', %s, %s)", [max_id or 1, max_id is not None])
+    cursor.execute(f"ALTER TABLE \"{table}\" ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for table, column, days in TABLES:
+            cursor.execute("""
+                SELECT 1 FROM pg_partitioned_table p
+                JOIN pg_class c ON c.oid = p.partrelid
+                WHERE c.relname = %s
+            """, [table])
+            if cursor.fetchone() is None:
+                convert_table(cursor, table, column, days)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0005_message_ack_tracking'),
+    ]
+
+    operations = [
+        # Not reversible in place; the partitioned tables behave identically for Django
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0006_partition_packet_nodestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0, help_text='Highest source row id already rolled up')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Rollup Watermark',
+                'verbose_name_plural': 'Rollup Watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='NodeStatsHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket')),
+                ('sample_count', models.IntegerField(default=0)),
+                ('battery_min_mv', models.IntegerField(blank=True, null=True)),
+                ('battery_max_mv', models.IntegerField(blank=True, null=True)),
+                ('battery_sum_mv', models.BigIntegerField(default=0)),
+                ('battery_samples', models.IntegerField(default=0)),
+                ('last_rssi', models.IntegerField(blank=True, null=True)),
+                ('last_snr', models.FloatField(blank=True, null=True)),
+                ('last_collected_at', models.DateTimeField(blank=True, null=True)),
+                ('packets_received', models.BigIntegerField(default=0)),
+                ('packets_sent', models.BigIntegerField(default=0)),
+                ('packets_flood_sent', models.BigIntegerField(default=0)),
+                ('packets_direct_sent', models.BigIntegerField(default=0)),
+                ('packets_flood_received', models.BigIntegerField(default=0)),
+                ('packets_direct_received', models.BigIntegerField(default=0)),
+                ('duplicate_packets', models.BigIntegerField(default=0)),
+                ('airtime_seconds', models.BigIntegerField(default=0)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='meshcore.node')),
+            ],
+            options={
+                'verbose_name': 'Node Statistics (Hourly)',
+                'verbose_name_plural': 'Node Statistics (Hourly)',
+                'ordering': ['-bucket'],
+                'abstract': False,
+                'unique_together': {('node', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='NodeStatsDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket')),
+                ('sample_count', models.IntegerField(default=0)),
+                ('battery_min_mv', models.IntegerField(blank=True, null=True)),
+                ('battery_max_mv', models.IntegerField(blank=True, null=True)),
+                ('battery_sum_mv', models.BigIntegerField(default=0)),
+                ('battery_samples', models.IntegerField(default=0)),
+                ('last_rssi', models.IntegerField(blank=True, null=True)),
+                ('last_snr', models.FloatField(blank=True, null=True)),
+                ('last_collected_at', models.DateTimeField(blank=True, null=True)),
+                ('packets_received', models.BigIntegerField(default=0)),
+                ('packets_sent', models.BigIntegerField(default=0)),
+                ('packets_flood_sent', models.BigIntegerField(default=0)),
+                ('packets_direct_sent', models.BigIntegerField(default=0)),
+                ('packets_flood_received', models.BigIntegerField(default=0)),
+                ('packets_direct_received', models.BigIntegerField(default=0)),
+                ('duplicate_packets', models.BigIntegerField(default=0)),
+                ('airtime_seconds', models.BigIntegerField(default=0)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='meshcore.node')),
+            ],
+            options={
+                'verbose_name': 'Node Statistics (Daily)',
+                'verbose_name_plural': 'Node Statistics (Daily)',
+                'ordering': ['-bucket'],
+                'abstract': False,
+                'unique_together': {('node', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,155 @@
+# Compact Packet storage
+#
+# - path: JSON list of hex strings -> raw bytes, one byte per hop
+# - payload_data: moved into the content-addressed PacketPayload table so
+#   flood copies of a packet share one payload row
+# - hop_count: derived from the path; a stored generated column on PostgreSQL
+#
+# Existing rows are converted in id-range batches, each in its own
+# transaction, so a large table is never locked for the whole conversion.
+
+import hashlib
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+
+BATCH_SIZE = 20000
+
+
+def convert_batch_postgresql(cursor, low, high):
+    cursor.execute("""
+        INSERT INTO meshcore_packetpayload (digest, data, size, first_seen_at)
+        SELECT DISTINCT ON (digest) digest, payload_data, length(payload_data), received_at
+        FROM (
+            SELECT substring(sha256(payload_data) FROM 1 FOR 16) AS digest, payload_data, received_at
+            FROM meshcore_packet
+            WHERE id >= %s AND id < %s
+        ) AS p
+        ORDER BY digest, received_at
+        ON CONFLICT (digest) DO NOTHING
+    """, [low, high])
+    cursor.execute("""
+        UPDATE meshcore_packet SET
+            payload_id = substring(sha256(payload_data) FROM 1 FOR 16),
+            path_bytes = COALESCE((
+                SELECT decode(string_agg(hop, '' ORDER BY position), 'hex')
+                FROM jsonb_array_elements_text(path) WITH ORDINALITY AS h(hop, position)
+            ), '\\x'::bytea)
+        WHERE id >= %s AND id < %s
+    """, [low, high])
+
+
+def convert_rows(apps, schema_editor):
+    connection = schema_editor.connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT min(id), max(id) FROM meshcore_packet')
+        first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+
+    Packet = apps.get_model('meshcore', 'Packet')
+    PacketPayload = apps.get_model('meshcore', 'PacketPayload')
+
+    for low in range(first_id, last_id + 1, BATCH_SIZE):
+        high = low + BATCH_SIZE
+        with transaction.atomic(using=connection.alias):
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    convert_batch_postgresql(cursor, low, high)
+                continue
+
+            for packet in Packet.objects.filter(id__gte=low, id__lt=high):
+                data = bytes(packet.payload_data)
+                digest = hashlib.sha256(data).digest()[:16]
+                PacketPayload.objects.get_or_create(
+                    digest=digest,
+                    defaults={'data': data, 'size': len(data)}
+                )
+                packet.payload_id = digest
+                packet.path_bytes = bytes.fromhex(''.join(packet.path or []))
+                packet.save(update_fields=['payload', 'path_bytes'])
+
+
+def add_generated_hop_count(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE meshcore_packet DROP COLUMN hop_count')
+        schema_editor.execute(
+            'ALTER TABLE meshcore_packet '
+            'ADD COLUMN hop_count integer GENERATED ALWAYS AS (length(path)) STORED'
+        )
+    else:
+        Packet = apps.get_model('meshcore', 'Packet')
+        schema_editor.remove_field(Packet, Packet._meta.get_field('hop_count'))
+
+
+class Migration(migrations.Migration):
+
+    # Batches commit individually
+    atomic = False
+
+    dependencies = [
+        ('meshcore', '0007_nodestats_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PacketPayload',
+            fields=[
+                ('digest', models.BinaryField(help_text='Truncated SHA-256 of the payload', max_length=16, primary_key=True, serialize=False)),
+                ('data', models.BinaryField(help_text='Raw payload bytes')),
+                ('size', models.IntegerField(default=0)),
+                ('first_seen_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Packet Payload',
+                'verbose_name_plural': 'Packet Payloads',
+            },
+        ),
+        migrations.AddField(
+            model_name='packet',
+            name='payload',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='packets', to='meshcore.packetpayload'),
+        ),
+        migrations.AddField(
+            model_name='packet',
+            name='path_bytes',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(convert_rows, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='packet',
+            name='path',
+        ),
+        migrations.RemoveField(
+            model_name='packet',
+            name='payload_data',
+        ),
+        migrations.RenameField(
+            model_name='packet',
+            old_name='path_bytes',
+            new_name='path',
+        ),
+        migrations.AlterField(
+            model_name='packet',
+            name='path',
+            field=models.BinaryField(default=bytes, help_text='Node hashes in path, one byte per hop'),
+        ),
+        migrations.AlterField(
+            model_name='packet',
+            name='payload',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='packets', to='meshcore.packetpayload'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='packet',
+                    name='hop_count',
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_generated_hop_count, migrations.RunPython.noop),
+            ],
+        ),
+    ]
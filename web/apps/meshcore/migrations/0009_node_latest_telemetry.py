@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:29
+
+from django.db import migrations, models
+
+
+def backfill_latest_telemetry(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("""
+            UPDATE meshcore_node AS n SET
+                latest_battery_mv = s.battery_mv,
+                latest_rssi = s.rssi,
+                latest_snr = s.snr,
+                latest_stats_at = s.collected_at
+            FROM (
+                SELECT DISTINCT ON (node_id) node_id, battery_mv, rssi, snr, collected_at
+                FROM meshcore_nodestats
+                ORDER BY node_id, collected_at DESC
+            ) AS s
+            WHERE n.id = s.node_id
+        """)
+        return
+
+    Node = apps.get_model('meshcore', 'Node')
+    NodeStats = apps.get_model('meshcore', 'NodeStats')
+    for node in Node.objects.all():
+        stats = NodeStats.objects.filter(node=node).order_by('-collected_at').first()
+        if stats:
+            Node.objects.filter(pk=node.pk).update(
+                latest_battery_mv=stats.battery_mv,
+                latest_rssi=stats.rssi,
+                latest_snr=stats.snr,
+                latest_stats_at=stats.collected_at,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0008_packet_compact_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='latest_battery_mv',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='latest_rssi',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='latest_snr',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='latest_stats_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_latest_telemetry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:30
+
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def backfill_counters(apps, schema_editor):
+    """Seed totals and the last 48 hourly buckets from the existing rows"""
+    TrafficCounter = apps.get_model('meshcore', 'TrafficCounter')
+    CounterTotal = apps.get_model('meshcore', 'CounterTotal')
+    sources = [
+        ('message', apps.get_model('meshcore', 'Message'), 'timestamp', 'message_type', 'messages'),
+        ('packet', apps.get_model('meshcore', 'Packet'), 'received_at', 'payload_type', 'packets'),
+    ]
+
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    since = now - timedelta(hours=47)
+    for kind, model, time_field, type_field, total_name in sources:
+        rows = model.objects.filter(**{f'{time_field}__gte': since}).annotate(
+            bucket=TruncHour(time_field, tzinfo=timezone.utc)
+        ).values('bucket', type_field).annotate(count=Count('id'))
+        TrafficCounter.objects.bulk_create([
+            TrafficCounter(hour=row['bucket'], kind=kind, type=row[type_field], count=row['count'])
+            for row in rows
+        ])
+        CounterTotal.objects.create(name=total_name, value=model.objects.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0009_node_latest_telemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Counter Total',
+                'verbose_name_plural': 'Counter Totals',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrafficCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='Start of the hour')),
+                ('kind', models.CharField(choices=[('message', 'Message'), ('packet', 'Packet')], max_length=10)),
+                ('type', models.CharField(help_text='Message or payload type', max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Traffic Counter',
+                'verbose_name_plural': 'Traffic Counters',
+                'ordering': ['-hour'],
+                'indexes': [models.Index(fields=['kind', 'hour'], name='meshcore_tr_kind_7a25e1_idx')],
+                'unique_together': {('hour', 'kind', 'type')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:40
+
+from django.db import migrations, models
+from apps.meshcore import geo
+
+
+def backfill_geohash(apps, schema_editor):
+    Node = apps.get_model('meshcore', 'Node')
+    nodes = list(Node.objects.filter(latitude__isnull=False, longitude__isnull=False).only('latitude', 'longitude'))
+    for node in nodes:
+        node.geohash = geo.encode(node.latitude, node.longitude)
+    Node.objects.bulk_update(nodes, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0010_traffic_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='geohash',
+            field=models.CharField(blank=True, help_text='Geohash of the location (map clustering, see geo.py)', max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['geohash'], name='meshcore_node_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Message full-text search (PostgreSQL only, see apps/meshcore/search.py)
+#
+# - search_vector: stored generated tsvector of the content with a GIN index
+# - a trigram GIN index on upper(content), which serves icontains lookups
+#   (substring search) once the term has 3+ chars; skipped when the server
+#   does not ship the pg_trgm extension (contrib)
+#
+# Adding the generated column rewrites the table once. Afterwards both
+# indexes are maintained by PostgreSQL on insert; GIN's fast-update pending
+# list keeps that cheap for ingestion batches.
+
+from django.db import migrations
+
+
+# The column expression as applied, kept here so changes to search.py never alter this migration
+SEARCH_VECTOR_SQL = "to_tsvector('simple'::regconfig, coalesce(content, ''))"
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE meshcore_message '
+        f'ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED'
+    )
+    schema_editor.execute(
+        'CREATE INDEX meshcore_message_search_idx ON meshcore_message USING gin (search_vector)'
+    )
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        has_trigram = cursor.fetchone() is not None
+    if has_trigram:
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX meshcore_message_content_trgm_idx ON meshcore_message '
+            'USING gin (upper(content) gin_trgm_ops)'
+        )
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS meshcore_message_content_trgm_idx')
+    schema_editor.execute('ALTER TABLE meshcore_message DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0011_node_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0012_message_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender_hash', 'timestamp'], include=('rssi', 'snr'), name='meshcore_msg_sender_rx_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='meshcore_me_sender__644f62_idx',
+        ),
+    ]
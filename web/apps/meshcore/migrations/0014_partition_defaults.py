@@ -0,0 +1,46 @@
+# Add a DEFAULT partition to meshcore_packet and meshcore_nodestats
+#
+# Without one, a row outside every partition (beat stopped for longer than
+# the partitions created ahead, or a clock far off) fails the insert and
+# with it the bridge's whole batch. Rows that land here are moved into
+# their range partition when partitions.ensure_partitions() creates it.
+
+from django.db import migrations
+
+
+TABLES = ['meshcore_packet', 'meshcore_nodestats']
+
+
+def add_default_partitions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute("""
+                SELECT 1 FROM pg_partitioned_table p
+                JOIN pg_class c ON c.oid = p.partrelid
+                WHERE c.relname = %s
+            """, [table])
+            if cursor.fetchone() is not None:
+                cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+
+def remove_default_partitions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f'DROP TABLE IF EXISTS "{table}_default"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0013_message_sender_reception_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_default_partitions, remove_default_partitions),
+    ]
@@ -0,0 +1,55 @@
+# Change counter for meshcore_message, behind the message APIs' ETags
+#
+# The 'messages' total only moves on insert, so deletes (admin, cascades
+# from Node, clear_demo_data) and the bridge's ACK updates left cached
+# message pages looking current. A statement-level trigger bumps
+# 'messages_version' once per INSERT, UPDATE, DELETE or TRUNCATE, whoever
+# runs it. It also fires for statements that change no rows; such a bump
+# only costs clients one full response.
+
+from django.db import migrations
+
+
+CREATE_TRIGGER = """
+    CREATE OR REPLACE FUNCTION meshcore_bump_messages_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO meshcore_countertotal (name, value, updated_at)
+        VALUES ('messages_version', 1, now())
+        ON CONFLICT (name) DO UPDATE
+        SET value = meshcore_countertotal.value + 1, updated_at = now();
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER meshcore_message_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON meshcore_message
+    FOR EACH STATEMENT EXECUTE FUNCTION meshcore_bump_messages_version();
+"""
+
+DROP_TRIGGER = """
+    DROP TRIGGER IF EXISTS meshcore_message_version ON meshcore_message;
+    DROP FUNCTION IF EXISTS meshcore_bump_messages_version();
+"""
+
+
+def add_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_TRIGGER)
+
+
+def remove_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meshcore', '0014_partition_defaults'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_trigger, remove_trigger),
+    ]
@@ -0,0 +1,136 @@
+# Store packet payloads in the packet row again
+#
+# Deduplicating payloads (0008) did not pay off: a payload is heard about
+# 2.6 times on average and is only ~90 bytes, so the 16-byte reference
+# plus the payload table and its key cost as much as the copies saved, and
+# an index on payload_id (needed for a constraint and for purging orphans)
+# made the packets larger than inline storage. payload_data goes back into
+# meshcore_packet and PacketPayload is dropped.
+#
+# Rows are converted in id-range batches, each in its own transaction, as
+# in 0008.
+
+import hashlib
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+
+BATCH_SIZE = 20000
+
+
+def copy_batch_postgresql(cursor, low, high):
+    # Rows pointing at a purged payload keep an empty one
+    cursor.execute("""
+        UPDATE meshcore_packet AS k SET payload_data = COALESCE((
+            SELECT p.data FROM meshcore_packetpayload p WHERE p.digest = k.payload_id
+        ), '\\x'::bytea)
+        WHERE id >= %s AND id < %s
+    """, [low, high])
+
+
+def restore_batch_postgresql(cursor, low, high):
+    cursor.execute("""
+        INSERT INTO meshcore_packetpayload (digest, data, size, first_seen_at)
+        SELECT DISTINCT ON (digest) digest, payload_data, length(payload_data), received_at
+        FROM (
+            SELECT substring(sha256(payload_data) FROM 1 FOR 16) AS digest, payload_data, received_at
+            FROM meshcore_packet
+            WHERE id >= %s AND id < %s
+        ) AS p
+        ORDER BY digest, received_at
+        ON CONFLICT (digest) DO NOTHING
+    """, [low, high])
+    cursor.execute("""
+        UPDATE meshcore_packet SET payload_id = substring(sha256(payload_data) FROM 1 FOR 16)
+        WHERE id >= %s AND id < %s
+    """, [low, high])
+
+
+def copy_batch(apps, low, high):
+    Packet = apps.get_model('meshcore', 'Packet')
+    PacketPayload = apps.get_model('meshcore', 'PacketPayload')
+
+    for packet in Packet.objects.filter(id__gte=low, id__lt=high):
+        data = PacketPayload.objects.filter(digest=packet.payload_id).values_list('data', flat=True).first()
+        packet.payload_data = bytes(data or b'')
+        packet.save(update_fields=['payload_data'])
+
+
+def restore_batch(apps, low, high):
+    Packet = apps.get_model('meshcore', 'Packet')
+    PacketPayload = apps.get_model('meshcore', 'PacketPayload')
+
+    for packet in Packet.objects.filter(id__gte=low, id__lt=high):
+        data = bytes(packet.payload_data)
+        digest = hashlib.sha256(data).digest()[:16]
+        PacketPayload.objects.get_or_create(
+            digest=digest,
+            defaults={'data': data, 'size': len(data)}
+        )
+        packet.payload_id = digest
+        packet.save(update_fields=['payload'])
+
+
+def convert_in_batches(apps, schema_editor, postgresql_batch, batch):
+    connection = schema_editor.connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT min(id), max(id) FROM meshcore_packet')
+        first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+
+    for low in range(first_id, last_id + 1, BATCH_SIZE):
+        high = low + BATCH_SIZE
+        with transaction.atomic(using=connection.alias):
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    postgresql_batch(cursor, low, high)
+            else:
+                batch(apps, low, high)
+
+
+def copy_payloads(apps, schema_editor):
+    convert_in_batches(apps, schema_editor, copy_batch_postgresql, copy_batch)
+
+
+def restore_payloads(apps, schema_editor):
+    convert_in_batches(apps, schema_editor, restore_batch_postgresql, restore_batch)
+
+
+class Migration(migrations.Migration):
+
+    # Batches commit individually
+    atomic = False
+
+    dependencies = [
+        ('meshcore', '0015_message_version_trigger'),
+    ]
+
+    operations = [
+        # Nullable first so that reversing can add the column back before filling it
+        migrations.AlterField(
+            model_name='packet',
+            name='payload',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='packets', to='meshcore.packetpayload'),
+        ),
+        migrations.AddField(
+            model_name='packet',
+            name='payload_data',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(copy_payloads, restore_payloads),
+        migrations.AlterField(
+            model_name='packet',
+            name='payload_data',
+            field=models.BinaryField(help_text='Raw payload bytes'),
+        ),
+        migrations.RemoveField(
+            model_name='packet',
+            name='payload',
+        ),
+        migrations.DeleteModel(
+            name='PacketPayload',
+        ),
+    ]
@@ -6,6 +6,16 @@ from django.db import models
 from django.utils import timezone
 from datetime import timedelta
 import json
+from . import geo
+
+
+def battery_percentage(battery_mv):
+    """Estimate battery percentage from voltage"""
+    if not battery_mv:
+        return None
+    # Rough LiPo estimation: 4200mV = 100%, 3000mV = 0%
+    percentage = ((battery_mv - 3000) / 1200) * 100
+    return max(0, min(100, percentage))
 
 
 class Node(models.Model):
@@ -20,6 +30,9 @@ class Node(models.Model):
         ('companion', 'Companion'),
     ]
     
+    # Nodes not heard from for this long are considered offline
+    ONLINE_WINDOW = timedelta(minutes=15)
+    
     # Identity (Ed25519)
     public_key = models.BinaryField(max_length=32, unique=True, db_index=True, help_text='Ed25519 public key')
     node_hash = models.CharField(max_length=2, db_index=True, help_text='First byte of public key (hex)')
@@ -33,12 +46,19 @@ class Node(models.Model):
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     altitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, help_text='Geohash of the location (map clustering, see geo.py)')
     
     # Status
     is_online = models.BooleanField(default=False)
     last_seen = models.DateTimeField(null=True, blank=True)
     last_advertisement = models.DateTimeField(null=True, blank=True)
     
+    # Latest telemetry (copied from the newest NodeStats row, see ingest.update_latest_telemetry)
+    latest_battery_mv = models.IntegerField(null=True, blank=True)
+    latest_rssi = models.IntegerField(null=True, blank=True)
+    latest_snr = models.FloatField(null=True, blank=True)
+    latest_stats_at = models.DateTimeField(null=True, blank=True)
+    
     # Metadata
     is_favorite = models.BooleanField(default=False)
     is_ignored = models.BooleanField(default=False)
@@ -53,10 +73,7 @@ class Node(models.Model):
     @property
     def battery_level(self):
         """Get battery level from latest stats"""
-        latest_stats = self.stats.first()
-        if latest_stats:
-            return latest_stats.battery_percentage
-        return None
+        return battery_percentage(self.latest_battery_mv)
     
     class Meta:
         ordering = ['-last_seen']
@@ -65,16 +82,28 @@ class Node(models.Model):
         indexes = [
             models.Index(fields=['node_hash', 'is_online']),
             models.Index(fields=['node_type', 'is_online']),
+            # Prefix (LIKE 'abc%') scans for map bounding boxes
+            models.Index(fields=['geohash'], name='meshcore_node_geohash_idx', opclasses=['varchar_pattern_ops']),
         ]
     
     def __str__(self):
         return f"{self.name or self.short_name or self.node_hash} ({self.get_node_type_display()})"
     
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+    
     def update_status(self):
         """Update online status based on last_seen"""
         if self.last_seen:
             time_since = timezone.now() - self.last_seen
-            self.is_online = time_since < timedelta(minutes=15)
+            self.is_online = time_since < self.ONLINE_WINDOW
             self.save(update_fields=['is_online'])
     
     @property
@@ -152,6 +181,8 @@ class Message(models.Model):
     attempt_number = models.IntegerField(default=0)
     is_encrypted = models.BooleanField(default=True)
     is_acknowledged = models.BooleanField(default=False)
+    acked_at = models.DateTimeField(null=True, blank=True, help_text='When the ACK was received')
+    ack_latency_ms = models.IntegerField(null=True, blank=True, help_text='Time from message to ACK in milliseconds')
     published_to_mqtt = models.BooleanField(default=False)
     
     # Reception info
@@ -180,7 +211,8 @@ class Message(models.Model):
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         indexes = [
-            models.Index(fields=['sender_hash', 'timestamp']),
+            # Covers the per-node reception series (series.py) with index-only scans
+            models.Index(fields=['sender_hash', 'timestamp'], include=['rssi', 'snr'], name='meshcore_msg_sender_rx_idx'),
             models.Index(fields=['recipient_hash', 'timestamp']),
             models.Index(fields=['message_type', 'timestamp']),
         ]
@@ -225,9 +257,8 @@ class Packet(models.Model):
     transport_code_1 = models.IntegerField(null=True, blank=True)
     transport_code_2 = models.IntegerField(null=True, blank=True)
     
-    # Path
-    path = models.JSONField(default=list, help_text='List of node hashes in path')
-    hop_count = models.IntegerField(default=0)
+    # Path (one byte per hop; hop_count is a generated column on PostgreSQL)
+    path = models.BinaryField(default=bytes, help_text='Node hashes in path, one byte per hop')
     
     # Payload
     payload_data = models.BinaryField(help_text='Raw payload bytes')
@@ -251,6 +282,16 @@ class Packet(models.Model):
     
     def __str__(self):
         return f"{self.get_payload_type_display()} via {self.get_route_type_display()} ({self.hop_count} hops)"
+    
+    @property
+    def hop_count(self):
+        """Number of hops in the path"""
+        return len(self.path or b'')
+    
+    @property
+    def path_hashes(self):
+        """Path as a list of hex node hashes"""
+        return [f'{byte:02x}' for byte in bytes(self.path or b'')]
 
 
 class NodeStats(models.Model):
@@ -303,11 +344,7 @@ class NodeStats(models.Model):
     @property
     def battery_percentage(self):
         """Estimate battery percentage from voltage"""
-        if not self.battery_mv:
-            return None
-        # Rough LiPo estimation: 4200mV = 100%, 3000mV = 0%
-        percentage = ((self.battery_mv - 3000) / 1200) * 100
-        return max(0, min(100, percentage))
+        return battery_percentage(self.battery_mv)
 
 
 class BridgeConfiguration(models.Model):
@@ -477,3 +514,11 @@ class DeviceConnection(models.Model):
         if self.is_primary:
             DeviceConnection.objects.filter(is_primary=True).exclude(pk=self.pk).update(is_primary=False)
         super().save(*args, **kwargs)
+
+
+# Import telemetry rollup models
+from .models_rollups import NodeStatsHourly, NodeStatsDaily, RollupWatermark
+
+
+# Import dashboard counter models
+from .models_counters import TrafficCounter, CounterTotal
@@ -0,0 +1,48 @@
+"""
+MeshCore Traffic Counter Models
+Incrementally maintained counts so the dashboard never counts large tables
+"""
+from django.db import models
+
+
+class TrafficCounter(models.Model):
+    """
+    Number of messages or packets of one type received in one hour
+    """
+    KIND_CHOICES = [
+        ('message', 'Message'),
+        ('packet', 'Packet'),
+    ]
+
+    hour = models.DateTimeField(help_text='Start of the hour')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    type = models.CharField(max_length=20, help_text='Message or payload type')
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-hour']
+        verbose_name = 'Traffic Counter'
+        verbose_name_plural = 'Traffic Counters'
+        unique_together = [['hour', 'kind', 'type']]
+        indexes = [
+            models.Index(fields=['kind', 'hour']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.type} @ {self.hour}: {self.count}"
+
+
+class CounterTotal(models.Model):
+    """
+    Running all-time total (e.g. total messages)
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Counter Total'
+        verbose_name_plural = 'Counter Totals'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
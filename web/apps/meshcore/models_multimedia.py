@@ -97,6 +97,10 @@ class MediaFile(models.Model):
 class MultiPartPacket(models.Model):
     """
     Tracks individual packets in a multi-part transfer
+
+    Transfers keep their chunks in a multipart.ChunkStore file rather than
+    in these rows, and are sent windowed with selective NACKs (see
+    transfer.py) rather than acknowledged chunk by chunk.
     """
     media_file = models.ForeignKey(MediaFile, on_delete=models.CASCADE, related_name='packets')
     packet_index = models.IntegerField(help_text='Packet sequence number')
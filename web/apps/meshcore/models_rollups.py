@@ -0,0 +1,104 @@
+"""
+MeshCore Telemetry Rollup Models
+Hourly and daily aggregates of NodeStats for long time-range charts
+"""
+from django.db import models
+from .models import Node, battery_percentage
+
+
+# Cumulative NodeStats counters that are rolled up as deltas
+COUNTER_FIELDS = [
+    'packets_received',
+    'packets_sent',
+    'packets_flood_sent',
+    'packets_direct_sent',
+    'packets_flood_received',
+    'packets_direct_received',
+    'duplicate_packets',
+    'airtime_seconds',
+]
+
+
+class NodeStatsRollup(models.Model):
+    """
+    Aggregated NodeStats for one node over one time bucket
+    """
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='+')
+    bucket = models.DateTimeField(help_text='Start of the time bucket')
+    sample_count = models.IntegerField(default=0)
+
+    # Battery (average is kept as sum/count so buckets can be merged incrementally)
+    battery_min_mv = models.IntegerField(null=True, blank=True)
+    battery_max_mv = models.IntegerField(null=True, blank=True)
+    battery_sum_mv = models.BigIntegerField(default=0)
+    battery_samples = models.IntegerField(default=0)
+
+    # Radio metrics from the latest sample in the bucket
+    last_rssi = models.IntegerField(null=True, blank=True)
+    last_snr = models.FloatField(null=True, blank=True)
+    last_collected_at = models.DateTimeField(null=True, blank=True)
+
+    # Counter deltas (counter resets are handled when rolling up)
+    packets_received = models.BigIntegerField(default=0)
+    packets_sent = models.BigIntegerField(default=0)
+    packets_flood_sent = models.BigIntegerField(default=0)
+    packets_direct_sent = models.BigIntegerField(default=0)
+    packets_flood_received = models.BigIntegerField(default=0)
+    packets_direct_received = models.BigIntegerField(default=0)
+    duplicate_packets = models.BigIntegerField(default=0)
+    airtime_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['-bucket']
+
+    def __str__(self):
+        return f"{self.node_id} stats for {self.bucket}"
+
+    @property
+    def battery_avg_mv(self):
+        """Average battery voltage over the bucket"""
+        if not self.battery_samples:
+            return None
+        return self.battery_sum_mv / self.battery_samples
+
+    @property
+    def battery_percentage(self):
+        """Estimate battery percentage from the average voltage"""
+        return battery_percentage(self.battery_avg_mv)
+
+
+class NodeStatsHourly(NodeStatsRollup):
+    """
+    Hourly NodeStats rollup
+    """
+    class Meta(NodeStatsRollup.Meta):
+        verbose_name = 'Node Statistics (Hourly)'
+        verbose_name_plural = 'Node Statistics (Hourly)'
+        unique_together = [['node', 'bucket']]
+
+
+class NodeStatsDaily(NodeStatsRollup):
+    """
+    Daily NodeStats rollup
+    """
+    class Meta(NodeStatsRollup.Meta):
+        verbose_name = 'Node Statistics (Daily)'
+        verbose_name_plural = 'Node Statistics (Daily)'
+        unique_together = [['node', 'bucket']]
+
+
+class RollupWatermark(models.Model):
+    """
+    Tracks how far a rollup has processed its source table
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0, help_text='Highest source row id already rolled up')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Rollup Watermark'
+        verbose_name_plural = 'Rollup Watermarks'
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
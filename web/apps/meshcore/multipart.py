@@ -0,0 +1,562 @@
+"""
+Multipart media transfers
+
+A media file is sent as MULTIPART packets, each carrying an 8-byte header
+(session ID, chunk index and chunk count, little endian) and up to
+CHUNK_SIZE bytes of the file, so a chunk fills the largest payload a
+MeshCore packet can carry (MeshCoreParser.MAX_PACKET_PAYLOAD in the bridge).
+
+Outgoing chunks are read straight from the (compressed) file by offset.
+Incoming chunks are stored by the bridge like any other packet and picked
+up incrementally (id watermark) by ingest_packets(), which files them under
+the MediaFile with the chunk's session ID. Chunks may arrive in any order
+and more than once (flood copies, retransmissions).
+
+Receiving needs a MediaFile for the session (status pending) set up
+beforehand: a chunk's header carries no sender, and a MediaFile can't be
+created without one. Nothing creates these incoming MediaFiles yet, so
+until a setup step exists (e.g. an announcement message naming session,
+sender and file), chunks of unknown sessions are counted and dropped.
+
+Received chunks are not stored as rows: a ChunkStore writes each chunk at
+its offset into a preallocated sparse file and keeps a bitmap of the chunks
+received in a small memory-mapped side file, which turns duplicates into
+no-ops. The database only gets transfer-level state (received count,
+progress, status), in one UPDATE per ingested batch. When the last missing chunk
+arrives the data file is trimmed to size and renamed into place as the
+media file's original_file, so reassembly copies nothing.
+"""
+import logging
+import mmap
+import os
+import struct
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from .models import Packet
+from .models_multimedia import MediaFile
+from .models_rollups import RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+MAX_PACKET_PAYLOAD = 184  # MeshCoreParser.MAX_PACKET_PAYLOAD
+HEADER = struct.Struct('<IHH')  # session_id, index, total
+CHUNK_SIZE = MAX_PACKET_PAYLOAD - HEADER.size
+MAX_CHUNKS = 0xFFFF
+MAX_FILE_SIZE = CHUNK_SIZE * MAX_CHUNKS
+
+# Bitmap side file: magic, chunk count and size of the last chunk, then one bit per chunk
+MAP_HEADER = struct.Struct('<4sHH')
+MAP_MAGIC = b'MCT1'
+
+WATERMARK_NAME = 'multipart'
+
+# Transfers that still accept chunks
+RECEIVING_STATUSES = ('pending', 'receiving')
+
+
+def encode_chunk(session_id, index, total, data):
+    """Payload of one MULTIPART packet"""
+    if len(data) > CHUNK_SIZE:
+        raise ValueError(f'Chunk of {len(data)} bytes exceeds {CHUNK_SIZE}')
+    return HEADER.pack(session_id, index, total) + data
+
+
+def decode_chunk(payload):
+    """(session_id, index, total, data) of a MULTIPART payload"""
+    if len(payload) < HEADER.size:
+        raise ValueError('Multipart chunk too short')
+    session_id, index, total = HEADER.unpack_from(payload)
+    if total == 0 or index >= total:
+        raise ValueError(f'Invalid chunk {index} of {total}')
+    return session_id, index, total, bytes(payload[HEADER.size:])
+
+
+def encode_nack(session_id, base, missing):
+    """
+    Payload of a selective NACK for a transfer
+
+    A chunk count of 0 marks a NACK: `base` is the first chunk the receiver
+    lacks (every chunk below it has arrived) and bit i of `missing` is set
+    if chunk base + i is missing. Padding bits after the highest chunk
+    received are set, and chunks past the bitmap are not reported.
+    A NACK whose base is the chunk count acknowledges the whole transfer.
+    """
+    if len(missing) > CHUNK_SIZE:
+        raise ValueError(f'NACK bitmap of {len(missing)} bytes exceeds {CHUNK_SIZE}')
+    return HEADER.pack(session_id, base, 0) + bytes(missing)
+
+
+def is_nack(payload):
+    return len(payload) >= HEADER.size and HEADER.unpack_from(payload)[2] == 0
+
+
+def decode_nack(payload):
+    """(session_id, base, missing bitmap) of a NACK payload"""
+    if not is_nack(payload):
+        raise ValueError('Not a multipart NACK')
+    session_id, base, _ = HEADER.unpack_from(payload)
+    return session_id, base, bytes(payload[HEADER.size:])
+
+
+def chunk_fits(index, total, data):
+    """Whether a chunk has the index and size a transfer of `total` chunks expects"""
+    if not 0 <= index < total:
+        return False
+    if index == total - 1:
+        return len(data) <= CHUNK_SIZE
+    return len(data) == CHUNK_SIZE
+
+
+def split(data, chunk_size=CHUNK_SIZE):
+    """Split a file into chunks; an empty file is a single empty chunk"""
+    if len(data) > chunk_size * MAX_CHUNKS:
+        raise ValueError(f'File of {len(data)} bytes needs more than {MAX_CHUNKS} chunks')
+    if not data:
+        return [b'']
+    return [bytes(data[offset:offset + chunk_size]) for offset in range(0, len(data), chunk_size)]
+
+
+class ChunkBitmap:
+    """
+    Which chunks of a transfer have been received, one bit per chunk
+
+    The bits live in a bytearray, or in `bits` when given (e.g. a view of a
+    memory-mapped file).
+    """
+
+    def __init__(self, total, indexes=(), bits=None):
+        self.total = total
+        if bits is None:
+            self.bits = bytearray((total + 7) // 8)
+            self.count = 0
+        else:
+            self.bits = bits
+            self.count = int.from_bytes(bits, 'little').bit_count()
+        for index in indexes:
+            self.add(index)
+
+    def __contains__(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def add(self, index):
+        """Set a chunk's bit; returns False if it was already set"""
+        if not 0 <= index < self.total:
+            raise ValueError(f'Chunk {index} out of range for {self.total} chunks')
+        mask = 1 << (index & 7)
+        if self.bits[index >> 3] & mask:
+            return False
+        self.bits[index >> 3] |= mask
+        self.count += 1
+        return True
+
+    @property
+    def complete(self):
+        return self.count == self.total
+
+    def missing(self):
+        """Indexes of the chunks not received yet"""
+        return [index for index in range(self.total) if index not in self]
+
+    def nack(self, max_bytes=CHUNK_SIZE):
+        """
+        (base, missing bitmap) for encode_nack()
+
+        The bitmap runs from the first missing chunk to the highest chunk
+        received, so it only names chunks that were overtaken by a later one.
+        """
+        full = next((offset for offset, byte in enumerate(self.bits) if byte != 0xFF), len(self.bits))
+        base = full * 8
+        while base < self.total and base in self:
+            base += 1
+        if base >= self.total:
+            return self.total, b''
+
+        last = next((offset for offset in range(len(self.bits) - 1, -1, -1) if self.bits[offset]), 0)
+        end = min(last * 8 + 8, self.total, base + max_bytes * 8)
+        while end > base and end - 1 not in self:
+            end -= 1
+
+        missing = bytearray((end - base + 7) // 8)
+        for index in range(base, base + len(missing) * 8):
+            if index >= end or index not in self:
+                offset = index - base
+                missing[offset >> 3] |= 1 << (offset & 7)
+        return base, bytes(missing)
+
+
+class ChunkStore:
+    """
+    Received chunks of one transfer, written in place into a sparse file
+
+    `{name}.part` is preallocated to the full chunk count (without writing
+    it, so unreceived chunks take no disk space) and written through a
+    memory map, falling back to pwrite() where the file can't be mapped.
+    `{name}.map` holds the chunk count, the size of the last chunk and the
+    received-chunk bitmap. A chunk's bit is set only after its data is
+    written, so the bitmap never claims data that isn't there. Writes are
+    left to the page cache (they survive a crashed worker) and only synced
+    when the transfer is finished.
+    """
+
+    def __init__(self, directory, name, total):
+        if not 0 < total <= MAX_CHUNKS:
+            raise ValueError(f'Invalid chunk count {total}')
+        os.makedirs(directory, exist_ok=True)
+        self.total = total
+        self.data_path = os.path.join(directory, f'{name}.part')
+        self.map_path = os.path.join(directory, f'{name}.map')
+        self._data = self._bits = None
+
+        self._map_fd = os.open(self.map_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._data_fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            map_size = MAP_HEADER.size + (total + 7) // 8
+            if os.fstat(self._map_fd).st_size == 0:
+                os.ftruncate(self._data_fd, total * CHUNK_SIZE)
+                os.ftruncate(self._map_fd, map_size)
+                os.pwrite(self._map_fd, MAP_HEADER.pack(MAP_MAGIC, total, 0), 0)
+            self._map = mmap.mmap(self._map_fd, map_size)
+            magic, stored_total, _ = MAP_HEADER.unpack_from(self._map)
+            if magic != MAP_MAGIC or stored_total != total:
+                raise ValueError(f'{self.map_path} does not belong to a transfer of {total} chunks')
+            try:
+                self._data = mmap.mmap(self._data_fd, total * CHUNK_SIZE)
+            except (OSError, ValueError):
+                self._data = None
+        except BaseException:
+            self.close()
+            raise
+
+        self._bits = memoryview(self._map)[MAP_HEADER.size:]
+        self.bitmap = ChunkBitmap(total, bits=self._bits)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def complete(self):
+        return self.bitmap.complete
+
+    @property
+    def size(self):
+        """Size of the complete file"""
+        last_size = MAP_HEADER.unpack_from(self._map)[2]
+        return (self.total - 1) * CHUNK_SIZE + last_size
+
+    def write(self, index, data):
+        """Store a chunk at its offset; returns False for a duplicate"""
+        if not chunk_fits(index, self.total, data):
+            raise ValueError(f'Chunk {index} of {self.total} has {len(data)} bytes')
+        if index in self.bitmap:
+            return False
+
+        offset = index * CHUNK_SIZE
+        if self._data is not None:
+            self._data[offset:offset + len(data)] = data
+        else:
+            os.pwrite(self._data_fd, data, offset)
+        if index == self.total - 1:
+            MAP_HEADER.pack_into(self._map, 0, MAP_MAGIC, self.total, len(data))
+        return self.bitmap.add(index)
+
+    def flush(self):
+        if self._data is not None:
+            self._data.flush()
+        self._map.flush()
+
+    def finish(self, destination):
+        """Move the complete file to `destination` (trimmed to size, not copied)"""
+        if not self.complete:
+            raise ValueError(f'{len(self.bitmap.missing())} chunks missing')
+        size = self.size
+        self.flush()
+        self.close()
+        os.truncate(self.data_path, size)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(self.data_path, destination)
+        os.remove(self.map_path)
+        return size
+
+    def close(self):
+        if self._bits is not None:
+            self._bits.release()
+            self._bits = None
+        for name in ('_data', '_map'):
+            mapped = getattr(self, name, None)
+            if mapped is not None:
+                mapped.close()
+                setattr(self, name, None)
+        for name in ('_data_fd', '_map_fd'):
+            fd = getattr(self, name, None)
+            if fd is not None:
+                os.close(fd)
+                setattr(self, name, None)
+
+    @classmethod
+    def read_bitmap(cls, directory, name):
+        """Copy of a transfer's bitmap, or None if it has no stored chunks"""
+        try:
+            with open(os.path.join(directory, f'{name}.map'), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        magic, total, _ = MAP_HEADER.unpack_from(data)
+        if magic != MAP_MAGIC:
+            return None
+        return ChunkBitmap(total, bits=bytearray(data[MAP_HEADER.size:]))
+
+    @classmethod
+    def discard(cls, directory, name):
+        for suffix in ('.part', '.map'):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class Reassembler:
+    """
+    In-memory reassembly of one transfer
+
+    Accepts chunks in any order, ignores duplicates and rejects chunks that
+    disagree with the transfer's chunk count.
+    """
+
+    def __init__(self, session_id, total):
+        self.session_id = session_id
+        self.bitmap = ChunkBitmap(total)
+        self.chunks = [None] * total
+        self.duplicates = 0
+
+    @property
+    def complete(self):
+        return self.bitmap.complete
+
+    def add(self, index, total, data):
+        """Store a chunk; returns False for a duplicate"""
+        if total != self.bitmap.total:
+            raise ValueError(f'Chunk count {total} does not match {self.bitmap.total}')
+        if not self.bitmap.add(index):
+            self.duplicates += 1
+            return False
+        self.chunks[index] = data
+        return True
+
+    def missing(self):
+        return self.bitmap.missing()
+
+    def assemble(self):
+        if not self.complete:
+            raise ValueError(f'{len(self.missing())} chunks missing')
+        return b''.join(self.chunks)
+
+
+def prepare_transfer(media_file):
+    """
+    Set up a media file for sending; returns the chunk count
+
+    Sends the compressed file when there is one.
+    """
+    source = media_file.compressed_file or media_file.original_file
+    if not source:
+        raise ValueError('Media file has no content')
+    size = source.size
+    if size > MAX_FILE_SIZE:
+        raise ValueError(f'File of {size} bytes needs more than {MAX_CHUNKS} chunks')
+
+    media_file.total_packets = max(1, -(-size // CHUNK_SIZE))
+    media_file.received_packets = 0
+    media_file.progress = 0
+    media_file.save(update_fields=['total_packets', 'received_packets', 'progress'])
+    return media_file.total_packets
+
+
+def outgoing_payloads(media_file, indexes=None):
+    """(index, payload) of a prepared transfer's MULTIPART packets, optionally only some chunks"""
+    source = media_file.compressed_file or media_file.original_file
+    total = media_file.total_packets
+    with source.open('rb') as f:
+        for index in (range(total) if indexes is None else indexes):
+            f.seek(index * CHUNK_SIZE)
+            yield index, encode_chunk(media_file.session_id, index, total, f.read(CHUNK_SIZE))
+
+
+def _open_store(media_file, total):
+    """
+    ChunkStore of an incoming transfer
+
+    Stored chunks of another chunk count are discarded while the transfer
+    has no chunk count recorded yet (none of them were counted); after
+    that a mismatch raises ValueError.
+    """
+    try:
+        return ChunkStore(settings.MESHCORE_TRANSFER_DIR, media_file.file_id, total)
+    except ValueError:
+        if media_file.total_packets:
+            raise
+        discard_transfer(media_file)
+        return ChunkStore(settings.MESHCORE_TRANSFER_DIR, media_file.file_id, total)
+
+
+def received_bitmap(media_file):
+    """Chunks of an incoming transfer received so far (None before the first chunk)"""
+    if media_file.status == 'received' and media_file.total_packets:
+        return ChunkBitmap(media_file.total_packets, range(media_file.total_packets))
+    return ChunkStore.read_bitmap(settings.MESHCORE_TRANSFER_DIR, media_file.file_id)
+
+
+def discard_transfer(media_file):
+    """Remove the partial data of an incoming transfer"""
+    ChunkStore.discard(settings.MESHCORE_TRANSFER_DIR, media_file.file_id)
+
+
+def receive_chunks(chunks):
+    """
+    File decoded chunks under their transfers
+
+    `chunks` is an iterable of (session_id, index, total, data). Chunks of
+    unknown sessions, of transfers no longer receiving and duplicates are
+    skipped. A transfer takes its chunk count from its first valid chunk;
+    chunks that don't fit it are counted invalid without touching the
+    transfer's files. A transfer whose files can't be written is logged and
+    its chunks counted invalid, leaving the other transfers of the call
+    unaffected. The state of all touched transfers is written in one
+    transaction per call. Returns counts of what happened to the chunks.
+    """
+    stats = {'stored': 0, 'duplicate': 0, 'unknown_session': 0, 'invalid': 0, 'completed': 0}
+    by_session = {}
+    for session_id, index, total, data in chunks:
+        by_session.setdefault(session_id, []).append((index, total, data))
+    if not by_session:
+        return stats
+
+    with transaction.atomic():
+        # Newest receiving transfer per session, locked against concurrent ingests
+        media_files = {}
+        for media_file in (
+            MediaFile.objects.select_for_update()
+            .filter(session_id__in=list(by_session), status__in=RECEIVING_STATUSES)
+            .order_by('session_id', '-created_at')
+        ):
+            media_files.setdefault(media_file.session_id, media_file)
+
+        updated = []
+        completed = []
+        unknown = []
+        for session_id, session_chunks in by_session.items():
+            media_file = media_files.get(session_id)
+            if media_file is None:
+                stats['unknown_session'] += len(session_chunks)
+                unknown.append(session_id)
+                continue
+
+            total = media_file.total_packets or next(
+                (chunk_total for index, chunk_total, data in session_chunks if chunk_fits(index, chunk_total, data)),
+                None
+            )
+            valid = [
+                (index, data) for index, chunk_total, data in session_chunks
+                if chunk_total == total and chunk_fits(index, total, data)
+            ]
+            stats['invalid'] += len(session_chunks) - len(valid)
+            if not valid:
+                continue
+
+            try:
+                with _open_store(media_file, total) as store:
+                    stored = 0
+                    for index, data in valid:
+                        if store.write(index, data):
+                            stored += 1
+                        else:
+                            stats['duplicate'] += 1
+
+                    if not stored:
+                        continue
+                    stats['stored'] += stored
+
+                    media_file.status = 'receiving'
+                    media_file.total_packets = total
+                    media_file.received_packets = store.bitmap.count
+                    media_file.progress = int(store.bitmap.count / total * 100)
+                    if store.complete:
+                        _finish(media_file, store)
+                        completed.append(media_file)
+                    updated.append(media_file)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not store chunks of media file {media_file.file_id}: {e}")
+                stats['invalid'] += len(valid)
+
+        MediaFile.objects.bulk_update(updated, [
+            'status', 'total_packets', 'received_packets', 'progress', 'original_file', 'original_size',
+        ])
+        for media_file in completed:
+            media_file.mark_complete()
+            logger.info(
+                f"Received {media_file.filename} ({media_file.original_size} bytes in {media_file.total_packets} chunks)"
+            )
+        stats['completed'] = len(completed)
+    if unknown:
+        logger.warning(
+            f"Dropped {stats['unknown_session']} chunks of {len(unknown)} sessions without a receiving media file: "
+            f"{', '.join(str(session_id) for session_id in unknown[:10])}"
+        )
+    return stats
+
+
+def _finish(media_file, store):
+    """Move a fully received transfer into place as the media file's original_file"""
+    upload_to = MediaFile._meta.get_field('original_file').upload_to
+    name = default_storage.get_available_name(upload_to + (media_file.filename or f'{media_file.file_id}.bin'))
+    media_file.original_size = store.finish(default_storage.path(name))
+    media_file.original_file.name = name
+
+
+def ingest_packets(batch_size=5000):
+    """
+    Reassemble MULTIPART packets stored since the last run
+
+    The bridge is the only writer of meshcore_packet and writes each batch
+    in one transaction, so ids become visible in order and a watermark
+    never skips a row. Returns the counts from receive_chunks(), or an
+    empty dict when there was nothing new.
+    """
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+        watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+
+        # Read the head first so packets committed during the scan are left for the next run
+        head = Packet.objects.filter(id__gt=watermark.last_id).aggregate(head=Max('id'))['head']
+        if head is None:
+            return {}
+        rows = list(
+            Packet.objects.filter(id__gt=watermark.last_id, id__lte=head, payload_type='multipart')
+            .order_by('id')
+            .values_list('id', 'payload_data')[:batch_size]
+        )
+
+        chunks = []
+        invalid = nacks = 0
+        for _, payload in rows:
+            payload = bytes(payload or b'')
+            if is_nack(payload):
+                # Answers to transfers sent from here, for the sender (see transfer.WindowedSender)
+                nacks += 1
+                continue
+            try:
+                chunks.append(decode_chunk(payload))
+            except ValueError:
+                invalid += 1
+
+        stats = receive_chunks(chunks)
+        stats['invalid'] += invalid
+        stats['nacks'] = nacks
+        # A full batch may stop short of the head; otherwise skip over the other packet types
+        watermark.last_id = rows[-1][0] if len(rows) == batch_size else head
+        watermark.save(update_fields=['last_id', 'updated_at'])
+    return stats
@@ -0,0 +1,92 @@
+"""
+Keyset (cursor) pagination for the JSON API
+
+Pages are ordered by (<time field> DESC, id DESC) and the cursor carries
+the last row's key, so fetching page N costs the same as page 1 instead of
+growing with an OFFSET scan. Cursors are opaque URL-safe tokens.
+"""
+import base64
+import json
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    """Opaque token for the row with key (value, pk)"""
+    raw = json.dumps([value.isoformat() if value is not None else None, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor(); raises InvalidCursor for malformed tokens"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk = json.loads(raw)
+        if not isinstance(pk, int):
+            raise ValueError
+        if value is not None:
+            value = parse_datetime(value)
+            if value is None:
+                raise ValueError
+        return value, pk
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def get_page_size(request):
+    """Page size from ?limit=, bounded by settings"""
+    default = settings.MESHCORE_API_PAGE_SIZE
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, settings.MESHCORE_API_MAX_PAGE_SIZE))
+
+
+def after_cursor(queryset, field, cursor):
+    """Restrict `queryset` to rows after `cursor` in (`field` DESC, id DESC) order"""
+    if not cursor:
+        return queryset
+
+    value, pk = decode_cursor(cursor)
+    if value is None:
+        # Already in the NULL tail
+        return queryset.filter(**{f'{field}__isnull': True, 'pk__lt': pk})
+
+    # The redundant <= bound lets the index scan start at the cursor
+    after = Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(pk__lt=pk))
+    if queryset.model._meta.get_field(field).null:
+        after |= Q(**{f'{field}__isnull': True})
+    return queryset.filter(after)
+
+
+def keyset_order(queryset, field):
+    """Order by `field` DESC, id DESC with NULLs last"""
+    # NULLS LAST only where needed; on NOT NULL columns it would stop a backward index scan
+    if queryset.model._meta.get_field(field).null:
+        return queryset.order_by(F(field).desc(nulls_last=True), '-pk')
+    return queryset.order_by(f'-{field}', '-pk')
+
+
+def paginate(queryset, field, cursor=None, page_size=50):
+    """
+    Return (rows, next_cursor) for one page of `queryset` ordered by `field` DESC, id DESC
+
+    Works on model and values() querysets (values() must include 'id').
+    Rows with a NULL `field` sort last. next_cursor is None on the last page.
+    """
+    queryset = keyset_order(after_cursor(queryset, field, cursor), field)
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last[field], last['id'])
+    return rows, encode_cursor(getattr(last, field), last.pk)
@@ -0,0 +1,243 @@
+"""
+Time-based partition maintenance for append-only tables
+
+meshcore_packet and meshcore_nodestats are native PostgreSQL range
+partitions (see migration 0006). Upcoming partitions are created ahead of
+time and retention is enforced by dropping whole expired partitions, which
+avoids the bloat and long vacuums of DELETE-based cleanup.
+
+Each table also has a DEFAULT partition (migration 0014) so inserts never
+fail when maintenance falls behind. Rows that land there are moved into
+their range partition when it is created.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# table -> partition key column and partition size
+PARTITIONED_TABLES = {
+    'meshcore_packet': {
+        'column': 'received_at',
+        'interval': 'day',
+    },
+    'meshcore_nodestats': {
+        'column': 'collected_at',
+        'interval': 'week',
+    },
+}
+
+
+def get_retention_days(table):
+    """Retention for a partitioned table, from settings"""
+    return settings.MESHCORE_PARTITION_RETENTION_DAYS.get(table)
+
+
+def partition_start(value, interval):
+    """Start of the partition containing `value` (UTC midnight, weeks start on Monday)"""
+    start = value.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def partition_step(interval):
+    return timedelta(days=7) if interval == 'week' else timedelta(days=1)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def parse_partition_start(table, name):
+    """Recover a partition's start date from its name"""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], '%Y%m%d').replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        return None
+
+
+def is_partitioned(table):
+    """Whether `table` is a partitioned table on this database"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = %s
+        """, [table])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table):
+    """Names of the partitions attached to `table`, oldest first"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+        """, [table])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_partition(cursor, table, start, interval):
+    """
+    Create the partition starting at `start` if it does not exist yet
+
+    PostgreSQL refuses to attach a range while the DEFAULT partition holds
+    rows in it, so those rows are moved out first and re-inserted through
+    the parent once the partition exists. Must run inside a transaction.
+    Returns the number of rows moved.
+    """
+    end = start + partition_step(interval)
+    column = PARTITIONED_TABLES[table]['column']
+    default = default_partition_name(table)
+
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [default])
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE {column} >= %s AND {column} < %s)',
+            [start, end]
+        )
+        stranded = cursor.fetchone()[0]
+    else:
+        stranded = False
+
+    moved = 0
+    if stranded:
+        # Generated columns (meshcore_packet.hop_count) are recomputed on insert
+        cursor.execute("""
+            SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+            FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        """, [table])
+        columns = cursor.fetchone()[0]
+        cursor.execute(
+            f'CREATE TEMP TABLE partition_move AS '
+            f'WITH moved AS (DELETE FROM "{default}" WHERE {column} >= %s AND {column} < %s RETURNING {columns}) '
+            f'SELECT * FROM moved',
+            [start, end]
+        )
+        moved = cursor.rowcount
+
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table, start)}" '
+        f'PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)',
+        [start, end]
+    )
+
+    if stranded:
+        cursor.execute(f'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM partition_move')
+        cursor.execute('DROP TABLE partition_move')
+    return moved
+
+
+def default_partition_range(table):
+    """(oldest, newest) partition key of the rows in the DEFAULT partition, or None"""
+    column = PARTITIONED_TABLES[table]['column']
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [default_partition_name(table)])
+        if not cursor.fetchone()[0]:
+            return None
+        cursor.execute(f'SELECT min({column}), max({column}) FROM "{default_partition_name(table)}"')
+        oldest, newest = cursor.fetchone()
+    return (oldest, newest) if oldest is not None else None
+
+
+def ensure_partitions(table, days_ahead=None, now=None):
+    """Create partitions from the current one up to `days_ahead` days in the future"""
+    if not is_partitioned(table):
+        return []
+
+    interval = PARTITIONED_TABLES[table]['interval']
+    days_ahead = settings.MESHCORE_PARTITION_DAYS_AHEAD if days_ahead is None else days_ahead
+    now = now or datetime.now(dt_timezone.utc)
+
+    existing = set(list_partitions(table))
+    created = []
+    moved = 0
+
+    start = partition_start(now, interval)
+    until = now + timedelta(days=days_ahead)
+    # Rows that fell into the DEFAULT partition (maintenance stopped, clocks off) get theirs too
+    stranded = default_partition_range(table)
+    if stranded:
+        start = min(start, partition_start(stranded[0], interval))
+        until = max(until, stranded[1])
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        while start <= until:
+            name = partition_name(table, start)
+            if name not in existing:
+                moved += create_partition(cursor, table, start, interval)
+                created.append(name)
+            start += partition_step(interval)
+
+    if created:
+        logger.info(f"Created partitions for {table}: {', '.join(created)}")
+    if moved:
+        logger.warning(f"Moved {moved} rows of {table} out of the default partition")
+    return created
+
+
+def drop_expired_partitions(table, retention_days=None, now=None):
+    """Drop partitions whose whole range is older than the retention period"""
+    if not is_partitioned(table):
+        return []
+
+    retention_days = get_retention_days(table) if retention_days is None else retention_days
+    if not retention_days:
+        return []
+
+    interval = PARTITIONED_TABLES[table]['interval']
+    cutoff = (now or datetime.now(dt_timezone.utc)) - timedelta(days=retention_days)
+
+    dropped = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name in list_partitions(table):
+            start = parse_partition_start(table, name)
+            if start is None or start + partition_step(interval) > cutoff:
+                continue
+            cursor.execute(f'DROP TABLE "{name}"')
+            dropped.append(name)
+
+    if dropped:
+        logger.info(f"Dropped expired partitions for {table}: {', '.join(dropped)}")
+    return dropped
+
+
+def maintain_partitions():
+    """Pre-create upcoming partitions and drop expired ones for every partitioned table"""
+    result = {}
+    for table in PARTITIONED_TABLES:
+        result[table] = {
+            'created': ensure_partitions(table),
+            'dropped': drop_expired_partitions(table),
+        }
+    return result
+
+
+def explain_partitions_scanned(queryset, table):
+    """
+    Return (partitions scanned, partitions total) for a queryset
+
+    Used to verify that time-window queries are pruned to the partitions
+    they need instead of scanning the whole table.
+    """
+    plan = queryset.explain()
+    partitions = list_partitions(table)
+    scanned = [name for name in partitions if name in plan]
+    return len(scanned), len(partitions)
@@ -0,0 +1,260 @@
+"""
+NodeStats downsampling
+
+Raw NodeStats rows are rolled into hourly buckets incrementally, driven by
+an id watermark so every raw row is processed exactly once. Daily buckets
+are rebuilt from the hourly buckets they cover. get_stats_series() picks
+the cheapest resolution for a requested time range.
+"""
+import logging
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import NodeStats
+from .models_rollups import COUNTER_FIELDS, NodeStatsHourly, NodeStatsDaily, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'nodestats'
+
+# Rows newer than this may still have lower-id rows in flight, so wait before rolling them up
+SETTLE_TIME = timedelta(minutes=1)
+
+# Resolution thresholds for get_stats_series()
+RAW_MAX_RANGE = timedelta(days=2)
+HOURLY_MAX_RANGE = timedelta(days=60)
+
+RAW_FIELDS = ['id', 'node_id', 'collected_at', 'battery_mv', 'rssi', 'snr', 'uptime_seconds'] + COUNTER_FIELDS
+
+
+def _truncate_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _truncate_day(value):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _previous_samples(node_ids, before_id):
+    """Latest already-processed raw row per node, used as the baseline for counter deltas"""
+    if not node_ids or not before_id:
+        return {}
+
+    fields = ['node_id', 'uptime_seconds'] + COUNTER_FIELDS
+    rows = NodeStats.objects.filter(node_id__in=node_ids, id__lte=before_id)
+
+    if connection.vendor == 'postgresql':
+        rows = rows.order_by('node_id', '-id').distinct('node_id').values(*fields)
+        return {row['node_id']: row for row in rows}
+
+    previous = {}
+    for node_id in node_ids:
+        row = rows.filter(node_id=node_id).order_by('-id').values(*fields).first()
+        if row:
+            previous[node_id] = row
+    return previous
+
+
+def _counter_deltas(row, prev):
+    """Counter increases since the previous sample, treating decreases as counter resets"""
+    if prev is None:
+        # No baseline yet: the first sample only establishes one
+        return {field: 0 for field in COUNTER_FIELDS}
+
+    rebooted = row['uptime_seconds'] < prev['uptime_seconds']
+    deltas = {}
+    for field in COUNTER_FIELDS:
+        current = row[field] or 0
+        previous = prev[field] or 0
+        deltas[field] = current if rebooted or current < previous else current - previous
+    return deltas
+
+
+def _merge_sample(bucket, row, deltas):
+    """Fold one raw sample into a rollup bucket"""
+    bucket.sample_count += 1
+
+    battery = row['battery_mv']
+    if battery:
+        bucket.battery_min_mv = battery if bucket.battery_min_mv is None else min(bucket.battery_min_mv, battery)
+        bucket.battery_max_mv = battery if bucket.battery_max_mv is None else max(bucket.battery_max_mv, battery)
+        bucket.battery_sum_mv += battery
+        bucket.battery_samples += 1
+
+    if bucket.last_collected_at is None or row['collected_at'] >= bucket.last_collected_at:
+        bucket.last_collected_at = row['collected_at']
+        bucket.last_rssi = row['rssi']
+        bucket.last_snr = row['snr']
+
+    for field, delta in deltas.items():
+        setattr(bucket, field, getattr(bucket, field) + delta)
+
+
+def _merge_bucket(target, source):
+    """Fold one rollup bucket into another (hourly into daily)"""
+    target.sample_count += source.sample_count
+    for field, pick in (('battery_min_mv', min), ('battery_max_mv', max)):
+        value = getattr(source, field)
+        if value is not None:
+            current = getattr(target, field)
+            setattr(target, field, value if current is None else pick(current, value))
+    target.battery_sum_mv += source.battery_sum_mv
+    target.battery_samples += source.battery_samples
+
+    if source.last_collected_at and (target.last_collected_at is None or source.last_collected_at >= target.last_collected_at):
+        target.last_collected_at = source.last_collected_at
+        target.last_rssi = source.last_rssi
+        target.last_snr = source.last_snr
+
+    for field in COUNTER_FIELDS:
+        setattr(target, field, getattr(target, field) + getattr(source, field))
+
+
+def _reset_bucket(bucket):
+    """Clear a bucket's aggregates before rebuilding it"""
+    bucket.sample_count = 0
+    bucket.battery_min_mv = None
+    bucket.battery_max_mv = None
+    bucket.battery_sum_mv = 0
+    bucket.battery_samples = 0
+    bucket.last_rssi = None
+    bucket.last_snr = None
+    bucket.last_collected_at = None
+    for field in COUNTER_FIELDS:
+        setattr(bucket, field, 0)
+
+
+def _save_buckets(model, buckets):
+    """Insert new buckets and update existing ones"""
+    new = [bucket for bucket in buckets if bucket.pk is None]
+    existing = [bucket for bucket in buckets if bucket.pk is not None]
+    fields = [
+        'sample_count', 'battery_min_mv', 'battery_max_mv', 'battery_sum_mv', 'battery_samples',
+        'last_rssi', 'last_snr', 'last_collected_at',
+    ] + COUNTER_FIELDS
+
+    if new:
+        model.objects.bulk_create(new)
+    if existing:
+        model.objects.bulk_update(existing, fields)
+
+
+def rollup_node_stats(batch_size=5000):
+    """
+    Roll the next batch of raw NodeStats rows into hourly and daily buckets
+
+    Returns the number of raw rows processed.
+    """
+    with transaction.atomic():
+        # Row lock serialises concurrent runs of the task
+        watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+        watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+
+        rows = list(
+            NodeStats.objects.filter(id__gt=watermark.last_id)
+            .order_by('id')
+            .values(*RAW_FIELDS)[:batch_size]
+        )
+
+        # Stop at the first row that is too fresh so the watermark never skips a row
+        settle_cutoff = timezone.now() - SETTLE_TIME
+        for index, row in enumerate(rows):
+            if row['collected_at'] >= settle_cutoff:
+                rows = rows[:index]
+                break
+
+        if not rows:
+            return 0
+
+        node_ids = sorted({row['node_id'] for row in rows})
+        previous = _previous_samples(node_ids, watermark.last_id)
+
+        # Hourly buckets touched by this batch, loaded so they can be merged into
+        hours = {(row['node_id'], _truncate_hour(row['collected_at'])) for row in rows}
+        hourly = {
+            (bucket.node_id, bucket.bucket): bucket
+            for bucket in NodeStatsHourly.objects.select_for_update().filter(
+                node_id__in=node_ids,
+                bucket__gte=min(hour for _, hour in hours),
+                bucket__lte=max(hour for _, hour in hours),
+            )
+        }
+
+        for row in rows:
+            key = (row['node_id'], _truncate_hour(row['collected_at']))
+            bucket = hourly.get(key)
+            if bucket is None:
+                bucket = hourly[key] = NodeStatsHourly(node_id=key[0], bucket=key[1])
+            _merge_sample(bucket, row, _counter_deltas(row, previous.get(row['node_id'])))
+            previous[row['node_id']] = row
+
+        _save_buckets(NodeStatsHourly, [hourly[key] for key in hours])
+
+        # Rebuild the affected days from their hourly buckets
+        days = {(node_id, _truncate_day(hour)) for node_id, hour in hours}
+        daily = {
+            (bucket.node_id, bucket.bucket): bucket
+            for bucket in NodeStatsDaily.objects.select_for_update().filter(
+                node_id__in=node_ids,
+                bucket__gte=min(day for _, day in days),
+                bucket__lte=max(day for _, day in days),
+            )
+        }
+        rebuilt = {}
+        for node_id, day in days:
+            bucket = daily.get((node_id, day)) or NodeStatsDaily(node_id=node_id, bucket=day)
+            _reset_bucket(bucket)
+            rebuilt[(node_id, day)] = bucket
+
+        for hour_bucket in NodeStatsHourly.objects.filter(
+            node_id__in=node_ids,
+            bucket__gte=min(day for _, day in days),
+            bucket__lt=max(day for _, day in days) + timedelta(days=1),
+        ):
+            day_bucket = rebuilt.get((hour_bucket.node_id, _truncate_day(hour_bucket.bucket)))
+            if day_bucket is not None:
+                _merge_bucket(day_bucket, hour_bucket)
+
+        _save_buckets(NodeStatsDaily, list(rebuilt.values()))
+
+        watermark.last_id = rows[-1]['id']
+        watermark.save(update_fields=['last_id', 'updated_at'])
+
+    logger.info(f"Rolled up {len(rows)} node stats rows into {len(hours)} hourly buckets")
+    return len(rows)
+
+
+def stats_resolution(start, end):
+    """Resolution get_stats_series() uses for a time range: 'raw', 'hourly' or 'daily'"""
+    span = end - start
+    if span <= RAW_MAX_RANGE:
+        return 'raw'
+    if span <= HOURLY_MAX_RANGE:
+        return 'hourly'
+    return 'daily'
+
+
+def get_stats_series(node, start, end=None, resolution=None):
+    """
+    NodeStats for a node over a time range at an appropriate resolution
+
+    Returns (resolution, queryset) where resolution is 'raw', 'hourly' or
+    'daily' (chosen from the range unless given). Raw rows have
+    `collected_at`; rollups have `bucket`.
+    """
+    end = end or timezone.now()
+    resolution = resolution or stats_resolution(start, end)
+
+    if resolution == 'raw':
+        return 'raw', NodeStats.objects.filter(
+            node=node, collected_at__gte=start, collected_at__lt=end
+        ).order_by('collected_at')
+
+    if resolution == 'hourly':
+        return 'hourly', NodeStatsHourly.objects.filter(
+            node=node, bucket__gte=_truncate_hour(start), bucket__lt=end
+        ).order_by('bucket')
+
+    return 'daily', NodeStatsDaily.objects.filter(
+        node=node, bucket__gte=_truncate_day(start), bucket__lt=end
+    ).order_by('bucket')
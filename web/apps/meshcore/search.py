@@ -0,0 +1,153 @@
+"""
+Message full-text search
+
+On PostgreSQL meshcore_message has a stored generated tsvector column,
+search_vector, with a GIN index, plus a trigram GIN index on upper(content)
+(migration 0012). Both are maintained by PostgreSQL on every insert, so
+ingestion needs no extra work. Word searches match the tsvector and are
+ranked with ts_rank; substring searches (partial words, identifiers) use
+the trigram index through Django's icontains (a scan where pg_trgm is not
+installed). Other databases fall back to icontains scans.
+
+search_vector is not a model field (Django would try to write it), like
+Packet.hop_count; queries reach it through _VectorSQL.
+"""
+import base64
+import json
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import Expression
+from .pagination import InvalidCursor, paginate
+
+# Text search configuration of the generated column. 'simple' lowercases
+# without stemming or stop words: mesh chat is short, multilingual and full
+# of callsigns and node names. Changing it needs a migration that
+# regenerates the column (defined in migration 0012).
+SEARCH_CONFIG = 'simple'
+
+# Shortest substring the trigram index can serve
+MIN_SUBSTRING_LENGTH = 3
+
+MATCH_MODES = ('words', 'substring')
+ORDERS = ('rank', 'recent')
+
+_TSQUERY = f"websearch_to_tsquery('{SEARCH_CONFIG}'::regconfig, %s)"
+
+
+def full_text_available():
+    return connection.vendor == 'postgresql'
+
+
+class _VectorSQL(Expression):
+    """
+    SQL over the search_vector column of the query's base table
+
+    The column is not a model field, so it is qualified here with the
+    table's alias in the query (which differs inside subqueries).
+    """
+
+    def __init__(self, template, params, output_field, alias=None):
+        super().__init__(output_field=output_field)
+        self.template = template
+        self.params = params
+        self.alias = alias
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None, summarize=False, for_save=False):
+        clone = self.copy()
+        clone.alias = query.get_initial_alias()
+        return clone
+
+    def relabeled_clone(self, change_map):
+        clone = self.copy()
+        clone.alias = change_map.get(self.alias, self.alias)
+        return clone
+
+    def as_sql(self, compiler, connection):
+        column = f'{compiler.quote_name_unless_alias(self.alias)}."search_vector"'
+        return self.template.format(vector=column), list(self.params)
+
+
+def text_match(text, mode='words'):
+    """
+    Condition for messages whose content matches `text`
+
+    'words' takes web search syntax ("quoted phrase", or, -excluded);
+    'substring' matches anywhere in the content, case-insensitively.
+    """
+    if mode == 'substring' or not full_text_available():
+        return Q(content__icontains=text)
+    return _VectorSQL(f'{{vector}} @@ {_TSQUERY}', [text], BooleanField())
+
+
+def text_rank(text):
+    """ts_rank of each message for a 'words' search"""
+    # float8 so the value round-trips exactly through the page cursor
+    return _VectorSQL(f'ts_rank({{vector}}, {_TSQUERY})::double precision', [text], FloatField())
+
+
+def encode_rank_cursor(rank, pk):
+    raw = json.dumps([rank, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_rank_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, pk = json.loads(raw)
+        if not isinstance(rank, (int, float)) or not isinstance(pk, int):
+            raise ValueError
+        return rank, pk
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def search_messages(queryset, text, mode='words', order='rank', cursor=None, page_size=50):
+    """
+    Return (rows, next_cursor, order) for one page of messages matching `text`
+
+    `queryset` may be a values() queryset (it must include 'id'). 'rank'
+    order (word searches on PostgreSQL only) pages by (rank DESC, id DESC)
+    and adds a 'rank' value to each row; 'recent' pages by timestamp with
+    the regular API cursor. The order actually used is returned: a search
+    matching more than MESHCORE_SEARCH_RANK_WINDOW messages is returned
+    newest first. Raises ValueError for unusable input.
+    """
+    text = text.strip()
+    if not text:
+        raise ValueError('q is required')
+    if mode not in MATCH_MODES:
+        raise ValueError(f"match must be one of {', '.join(MATCH_MODES)}")
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of {', '.join(ORDERS)}")
+    if mode == 'substring' and len(text) < MIN_SUBSTRING_LENGTH:
+        raise ValueError(f'Substring searches need at least {MIN_SUBSTRING_LENGTH} characters')
+
+    queryset = queryset.filter(text_match(text, mode))
+    if order == 'rank' and (mode == 'substring' or not full_text_available()):
+        order = 'recent'
+
+    if order == 'rank':
+        # Every match gets ranked, which is slow for a word found in a large
+        # part of the table, and ranks of such a word barely differ anyway
+        window = settings.MESHCORE_SEARCH_RANK_WINDOW
+        if queryset.order_by()[:window + 1].count() > window:
+            order = 'recent'
+
+    if order == 'recent':
+        return (*paginate(queryset, 'timestamp', cursor, page_size), order)
+
+    queryset = queryset.annotate(rank=text_rank(text))
+    if cursor:
+        rank, pk = decode_rank_cursor(cursor)
+        queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, pk__lt=pk))
+
+    rows = list(queryset.order_by('-rank', '-pk')[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None, order
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_rank_cursor(last['rank'], last['id']), order
+    return rows, encode_rank_cursor(last.rank, last.pk), order
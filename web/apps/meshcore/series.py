@@ -0,0 +1,229 @@
+"""
+Downsampled per-node time series for charts
+
+Telemetry (battery, RSSI, SNR, packet rate) is read from NodeStats or its
+hourly/daily rollups, whichever get_stats_series() picks for the range;
+reception quality of the node's messages (rx_rssi, rx_snr) from Message,
+averaged per bucket by the database for long ranges.
+Series longer than the requested point count are reduced with
+Largest-Triangle-Three-Buckets, which keeps the visual shape (peaks, dips)
+that plain averaging flattens. Results are cached per node, metrics, point
+count and range, with the range rounded to the resolution's step.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Avg, F, FloatField, Func
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from .models import Message
+from .rollups import get_stats_series, stats_resolution
+
+# metric -> unit
+METRICS = {
+    'battery': 'mV',
+    'rssi': 'dBm',
+    'snr': 'dB',
+    'packet_rate': 'packets/h',
+    'rx_rssi': 'dBm',
+    'rx_snr': 'dB',
+}
+TELEMETRY_METRICS = ('battery', 'rssi', 'snr', 'packet_rate')
+DEFAULT_METRICS = TELEMETRY_METRICS
+
+# Range rounding per resolution (also the cache lifetime granularity)
+RESOLUTION_STEP = {
+    'raw': timedelta(minutes=1),
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+}
+CACHE_KEY = 'meshcore:series:{digest}'
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the `threshold` points of (x, y) chosen by Largest-Triangle-Three-Buckets
+
+    x must be sorted. The first and last points are always kept; every
+    bucket in between contributes the point forming the largest triangle
+    with the previously chosen point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Buckets 0..threshold-3 split the points between the first and the last
+    edges = np.floor(np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # Bucket averages in one pass from cumulative sums
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    counts = edges[1:] - edges[:-1]
+    avg_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    avg_y = (cy[edges[1:]] - cy[edges[:-1]]) / counts
+    # The bucket after the last one is the final point
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - avg_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(x, y, points):
+    """(x, y) arrays reduced to at most `points` points, NaNs dropped"""
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    indices = lttb(x, y, points)
+    return x[indices], y[indices]
+
+
+def _epoch_seconds(values):
+    return np.array([value.timestamp() for value in values], dtype=np.float64)
+
+
+def _column(rows, key):
+    return np.array([row[key] if row[key] is not None else np.nan for row in rows], dtype=np.float64)
+
+
+def _telemetry(node, metrics, start, end, resolution):
+    """Arrays for the telemetry metrics"""
+    _, queryset = get_stats_series(node, start, end, resolution)
+    if resolution == 'raw':
+        rows = list(queryset.values('collected_at', 'battery_mv', 'rssi', 'snr', 'packets_received'))
+        x = _epoch_seconds(row['collected_at'] for row in rows)
+        columns = {
+            'battery': _column(rows, 'battery_mv'),
+            'rssi': _column(rows, 'rssi'),
+            'snr': _column(rows, 'snr'),
+        }
+        if 'packet_rate' in metrics:
+            # Cumulative counter -> per-hour rate between samples; resets are skipped
+            counter = _column(rows, 'packets_received')
+            rate = np.full(len(rows), np.nan)
+            if len(rows) > 1:
+                elapsed = np.diff(x)
+                delta = np.diff(counter)
+                valid = (elapsed > 0) & (delta >= 0)
+                rate[1:][valid] = delta[valid] / elapsed[valid] * 3600
+            columns['packet_rate'] = rate
+    else:
+        rows = list(queryset.values(
+            'bucket', 'battery_sum_mv', 'battery_samples', 'last_rssi', 'last_snr', 'packets_received'
+        ))
+        x = _epoch_seconds(row['bucket'] for row in rows)
+        battery_samples = _column(rows, 'battery_samples')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            battery = np.where(battery_samples > 0, _column(rows, 'battery_sum_mv') / battery_samples, np.nan)
+        bucket_hours = 1 if resolution == 'hourly' else 24
+        columns = {
+            'battery': battery,
+            'rssi': _column(rows, 'last_rssi'),
+            'snr': _column(rows, 'last_snr'),
+            'packet_rate': _column(rows, 'packets_received') / bucket_hours,
+        }
+    return {metric: (x, columns[metric]) for metric in metrics}
+
+
+def _reception(node, field, start, end, resolution):
+    """
+    Arrays of one reception metric (rssi/snr) of the messages the node sent
+
+    Messages have no rollups, so for hourly/daily ranges the database
+    averages them per bucket instead.
+    """
+    queryset = Message.objects.filter(
+        sender_hash=node.node_hash, timestamp__gte=start, timestamp__lt=end, **{f'{field}__isnull': False}
+    )
+
+    if resolution != 'raw':
+        trunc = TruncHour if resolution == 'hourly' else TruncDay
+        rows = list(
+            queryset.annotate(bucket=trunc('timestamp', tzinfo=dt_timezone.utc))
+            .values('bucket').annotate(value=Avg(field)).order_by('bucket')
+            .values_list('bucket', 'value')
+        )
+    elif connection.vendor == 'postgresql':
+        # Epoch seconds computed by the database: far cheaper than datetimes
+        epoch = Func(F('timestamp'), template='EXTRACT(EPOCH FROM %(expressions)s)::double precision',
+                     output_field=FloatField())
+        rows = queryset.order_by('timestamp').annotate(epoch=epoch).values_list('epoch', field)
+        data = np.array(list(rows.iterator(chunk_size=10000)), dtype=np.float64).reshape(-1, 2)
+        return data[:, 0], data[:, 1]
+    else:
+        rows = list(queryset.order_by('timestamp').values_list('timestamp', field))
+
+    return _epoch_seconds(row[0] for row in rows), np.array([row[1] for row in rows], dtype=np.float64)
+
+
+def _round_range(start, end):
+    """Resolution for the range and the range widened to whole steps of it"""
+    resolution = stats_resolution(start, end)
+    step = RESOLUTION_STEP[resolution].total_seconds()
+    low = int(start.timestamp() // step * step)
+    high = int(-(-end.timestamp() // step) * step)
+    return (
+        resolution,
+        datetime.fromtimestamp(low, dt_timezone.utc),
+        datetime.fromtimestamp(high, dt_timezone.utc),
+    )
+
+
+def node_series(node, metrics, start, end, points):
+    """
+    Downsampled series of `metrics` for `node` between `start` and `end`
+
+    Returns {'resolution', 'start', 'end', 'series': {metric: {'unit',
+    'points': [[epoch_ms, value], ...], 'source_points'}}}.
+    """
+    resolution, start, end = _round_range(start, end)
+    key = CACHE_KEY.format(digest=hashlib.md5(
+        f'{node.pk}|{",".join(metrics)}|{points}|{start.timestamp()}|{end.timestamp()}'.encode()
+    ).hexdigest())
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    arrays = {}
+    telemetry = [metric for metric in metrics if metric in TELEMETRY_METRICS]
+    if telemetry:
+        arrays = _telemetry(node, telemetry, start, end, resolution)
+    for metric in metrics:
+        if metric in ('rx_rssi', 'rx_snr'):
+            arrays[metric] = _reception(node, metric[3:], start, end, resolution)
+
+    series = {}
+    for metric in metrics:
+        x, y = arrays[metric]
+        source_points = int(np.count_nonzero(~np.isnan(y)))
+        x, y = downsample(x, y, points)
+        series[metric] = {
+            'unit': METRICS[metric],
+            'points': [[int(t * 1000), round(float(v), 2)] for t, v in zip(x, y)],
+            'source_points': source_points,
+        }
+
+    result = {
+        'resolution': resolution,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': series,
+    }
+    # Ranges reaching the present are still filling in
+    live = end > timezone.now() - RESOLUTION_STEP[resolution]
+    cache.set(key, result, settings.MESHCORE_SERIES_CACHE_SECONDS if live else 24 * 3600)
+    return result
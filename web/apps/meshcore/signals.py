@@ -1,14 +1,52 @@
 """
 Signals for MeshCore app
 """
-from django.db.models.signals import post_save
+import logging
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import Message, Node
+from .models import BridgeConfiguration, Message, Node
+from . import counters
+
+logger = logging.getLogger(__name__)
+
+# Channel the bridge LISTENs on for configuration changes
+BRIDGE_CONFIG_CHANNEL = 'meshcore_config'
+
+
+def notify_bridge_config_changed(config_id=None):
+    """
+    Tell the bridge to reload its configuration now
+
+    Uses PostgreSQL NOTIFY, which is delivered when the current transaction
+    commits. On other databases this is a no-op and the bridge's fallback
+    polling picks the change up instead.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [BRIDGE_CONFIG_CHANNEL, str(config_id or '')])
+    except Exception as e:
+        logger.error(f'Error notifying bridge of configuration change: {e}')
+
+
+@receiver(post_save, sender=BridgeConfiguration)
+def bridge_configuration_saved(sender, instance, **kwargs):
+    """Push configuration changes to the bridge"""
+    notify_bridge_config_changed(instance.pk)
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+def node_changed(sender, instance, **kwargs):
+    """Invalidate cached node API responses (see conditional.py)"""
+    counters.bump_version(counters.NODES_VERSION)
 
 
 @receiver(post_save, sender=Message)
-def update_node_last_seen(sender, instance, created, **kwargs):
-    """Update sender node's last_seen when a message is received"""
-    if created and instance.sender:
-        instance.sender.last_seen = instance.timestamp
-        instance.sender.update_status()
+@receiver(post_delete, sender=Message)
+def message_changed(sender, instance, **kwargs):
+    """Invalidate cached message API responses (a trigger does this on PostgreSQL)"""
+    counters.messages_changed()
@@ -0,0 +1,47 @@
+"""
+Streaming JSON responses for large API results
+
+Rows are read with QuerySet.iterator() (a server-side cursor on PostgreSQL)
+and serialized in chunks straight into a StreamingHttpResponse, so worker
+memory stays flat no matter how many rows the result has.
+"""
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+def wants_stream(request):
+    """Whether the client asked for the full result as a stream (?stream=1)"""
+    return request.GET.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def iter_json(key, rows, serialize, chunk_size):
+    """Yield `{"<key>": [...], "next_cursor": null}` piece by piece"""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    yield f'{{"{key}":['
+
+    separator = ''
+    chunk = []
+    for row in rows:
+        chunk.append(encoder.encode(serialize(row)))
+        if len(chunk) >= chunk_size:
+            yield separator + ','.join(chunk)
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + ','.join(chunk)
+
+    yield '],"next_cursor":null}'
+
+
+def stream_json(key, queryset, serialize, chunk_size=None):
+    """
+    StreamingHttpResponse with every row of `queryset` under `key`
+
+    Pass a values() queryset selecting only the columns `serialize` needs.
+    """
+    chunk_size = chunk_size or settings.MESHCORE_API_STREAM_CHUNK_SIZE
+    rows = queryset.iterator(chunk_size=chunk_size)
+    response = StreamingHttpResponse(iter_json(key, rows, serialize, chunk_size), content_type='application/json')
+    response['X-Accel-Buffering'] = 'no'
+    return response
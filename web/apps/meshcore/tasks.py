@@ -0,0 +1,66 @@
+"""
+Celery tasks for MeshCore app
+"""
+import logging
+from celery import shared_task
+from django.conf import settings
+from . import counters, ingest, media, multipart, partitions, rollups
+from .models_multimedia import MediaFile
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def maintain_partitions():
+    """Pre-create upcoming partitions and drop expired ones"""
+    return partitions.maintain_partitions()
+
+
+@shared_task
+def rollup_node_stats(max_batches=20):
+    """Roll new raw NodeStats rows into hourly and daily buckets"""
+    processed = 0
+    for _ in range(max_batches):
+        count = rollups.rollup_node_stats()
+        processed += count
+        if count == 0:
+            break
+    return processed
+
+
+@shared_task
+def mark_stale_nodes_offline():
+    """Mark nodes that have not been heard recently as offline"""
+    return ingest.mark_stale_nodes_offline()
+
+
+@shared_task
+def reconcile_counters():
+    """Recount dashboard counters from the source tables to correct drift"""
+    return counters.reconcile()
+
+
+@shared_task
+def reassemble_multipart(max_batches=20):
+    """File newly received MULTIPART chunks under their media transfers"""
+    stored = 0
+    for _ in range(max_batches):
+        stats = multipart.ingest_packets()
+        if not stats:
+            break
+        stored += stats['stored']
+    return stored
+
+
+@shared_task(
+    acks_late=True,
+    soft_time_limit=settings.MESHCORE_MEDIA_TIMEOUT + 30,
+    time_limit=settings.MESHCORE_MEDIA_TIMEOUT + 60,
+)
+def process_media(media_file_id):
+    """Compress an uploaded image or voice message for sending over the mesh"""
+    media_file = MediaFile.objects.filter(pk=media_file_id, status='uploading').first()
+    if media_file is None:
+        return None
+    media_file = media.process_media(media_file)
+    return media_file.compressed_size if media_file else None
@@ -0,0 +1,531 @@
+import asyncio
+import os
+import random
+import threading
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import counters, export, ingest, multipart
+from .models import Message, Node, NodeStats, Packet
+from .models_counters import CounterTotal, TrafficCounter
+from .models_multimedia import MediaFile
+
+
+def lossy_link(payloads, rng, loss=0.3, duplicate=0.1):
+    """Payloads as a lossy radio link delivers them: some dropped, some twice, out of order"""
+    delivered = []
+    for payload in payloads:
+        if rng.random() < loss:
+            continue
+        delivered.append(payload)
+        if rng.random() < duplicate:
+            delivered.append(payload)
+    rng.shuffle(delivered)
+    return delivered
+
+
+class MultipartCodecTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        for size in (0, 1, multipart.CHUNK_SIZE, multipart.CHUNK_SIZE * 3, multipart.CHUNK_SIZE * 3 + 1):
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                chunks = multipart.split(data)
+                self.assertEqual(len(chunks), max(1, -(-size // multipart.CHUNK_SIZE)))
+
+                decoded = [
+                    multipart.decode_chunk(multipart.encode_chunk(7, index, len(chunks), chunk))
+                    for index, chunk in enumerate(chunks)
+                ]
+                self.assertEqual(
+                    [header for *header, _ in decoded],
+                    [[7, index, len(chunks)] for index in range(len(chunks))]
+                )
+                self.assertEqual(b''.join(chunk for _, _, _, chunk in decoded), data)
+
+    def test_payload_fits_packet(self):
+        payload = multipart.encode_chunk(1, 0, 1, bytes(multipart.CHUNK_SIZE))
+        self.assertEqual(len(payload), multipart.MAX_PACKET_PAYLOAD)
+        with self.assertRaises(ValueError):
+            multipart.encode_chunk(1, 0, 1, bytes(multipart.CHUNK_SIZE + 1))
+
+    def test_decode_rejects_invalid_chunks(self):
+        for payload in (b'', b'1234567', multipart.encode_chunk(1, 3, 3, b'x'), multipart.encode_nack(1, 0, b'')):
+            with self.subTest(payload=payload), self.assertRaises(ValueError):
+                multipart.decode_chunk(payload)
+
+    def test_nack_round_trip(self):
+        payload = multipart.encode_nack(9, 16, b'\x05')
+        self.assertTrue(multipart.is_nack(payload))
+        self.assertFalse(multipart.is_nack(multipart.encode_chunk(9, 0, 1, b'')))
+        self.assertEqual(multipart.decode_nack(payload), (9, 16, b'\x05'))
+
+
+class ChunkBitmapTests(SimpleTestCase):
+
+    def test_duplicates(self):
+        bitmap = multipart.ChunkBitmap(10)
+        self.assertTrue(bitmap.add(3))
+        self.assertFalse(bitmap.add(3))
+        self.assertEqual(bitmap.count, 1)
+        self.assertIn(3, bitmap)
+        self.assertNotIn(4, bitmap)
+
+    def test_out_of_range(self):
+        bitmap = multipart.ChunkBitmap(10)
+        for index in (-1, 10, 11):
+            with self.subTest(index=index), self.assertRaises(ValueError):
+                bitmap.add(index)
+        self.assertEqual(bitmap.count, 0)
+
+    def test_missing_and_complete(self):
+        bitmap = multipart.ChunkBitmap(10, indexes=[0, 1, 2, 5, 9])
+        self.assertEqual(bitmap.missing(), [3, 4, 6, 7, 8])
+        self.assertFalse(bitmap.complete)
+        for index in bitmap.missing():
+            bitmap.add(index)
+        self.assertTrue(bitmap.complete)
+        self.assertEqual(bitmap.nack(), (10, b''))
+
+    def test_count_from_existing_bits(self):
+        bitmap = multipart.ChunkBitmap(12, bits=bytearray(b'\x0f\x08'))
+        self.assertEqual(bitmap.count, 5)
+        self.assertEqual(bitmap.missing(), [4, 5, 6, 7, 8, 9, 10])
+
+
+class ReassemblerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.data = os.urandom(multipart.CHUNK_SIZE * 5 + 20)
+        self.chunks = multipart.split(self.data)
+
+    def test_out_of_order(self):
+        reassembler = multipart.Reassembler(1, len(self.chunks))
+        order = list(range(len(self.chunks)))
+        random.Random(1).shuffle(order)
+        for index in order:
+            self.assertFalse(reassembler.complete)
+            self.assertTrue(reassembler.add(index, len(self.chunks), self.chunks[index]))
+        self.assertTrue(reassembler.complete)
+        self.assertEqual(reassembler.assemble(), self.data)
+
+    def test_duplicates(self):
+        reassembler = multipart.Reassembler(1, len(self.chunks))
+        reassembler.add(2, len(self.chunks), self.chunks[2])
+        self.assertFalse(reassembler.add(2, len(self.chunks), b'other data'))
+        self.assertEqual(reassembler.duplicates, 1)
+        self.assertEqual(reassembler.missing(), [0, 1, 3, 4, 5])
+        with self.assertRaises(ValueError):
+            reassembler.assemble()
+
+        for index, chunk in enumerate(self.chunks):
+            reassembler.add(index, len(self.chunks), chunk)
+        self.assertEqual(reassembler.assemble(), self.data)
+
+    def test_mismatched_chunk_count(self):
+        reassembler = multipart.Reassembler(1, len(self.chunks))
+        with self.assertRaises(ValueError):
+            reassembler.add(0, len(self.chunks) + 1, self.chunks[0])
+        self.assertEqual(reassembler.missing(), list(range(len(self.chunks))))
+
+
+class MediaTestCase(TestCase):
+    """Media and transfer files go to a temporary directory"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.transfer_dir = os.path.join(self.media_root, 'transfers')
+        settings = override_settings(MEDIA_ROOT=self.media_root, MESHCORE_TRANSFER_DIR=self.transfer_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def create_node(self, key=1):
+        public_key = bytes([key]) * 32
+        node, _ = Node.objects.get_or_create(public_key=public_key, defaults={'node_hash': public_key[:1].hex()})
+        return node
+
+    def create_incoming(self, session_id, status='pending', **kwargs):
+        """A transfer waiting for its chunks"""
+        return MediaFile.objects.create(
+            file_id=f'incoming{session_id}',
+            session_id=session_id,
+            media_type='file',
+            filename=f'{session_id}.bin',
+            original_size=0,
+            sender=self.create_node(1),
+            recipient=self.create_node(2),
+            status=status,
+            **kwargs
+        )
+
+
+class ReceiveChunksTests(MediaTestCase):
+
+    def test_lossy_delivery_completes_transfer(self):
+        rng = random.Random(47)
+        media_file = self.create_incoming(4700)
+        data = rng.randbytes(multipart.CHUNK_SIZE * 40 + 99)
+        chunks = multipart.split(data)
+        payloads = [multipart.encode_chunk(4700, index, len(chunks), chunk) for index, chunk in enumerate(chunks)]
+
+        # Each round the sender repeats the chunks the receiver still lacks
+        missing = list(range(len(chunks)))
+        for _ in range(30):
+            arrivals = lossy_link([payloads[index] for index in missing], rng)
+            multipart.receive_chunks(multipart.decode_chunk(payload) for payload in arrivals)
+            media_file.refresh_from_db()
+            if media_file.status == 'received':
+                break
+            bitmap = multipart.received_bitmap(media_file)
+            missing = bitmap.missing() if bitmap else missing
+            self.assertEqual(media_file.received_packets, len(chunks) - len(missing))
+
+        self.assertEqual(media_file.status, 'received')
+        self.assertEqual(media_file.progress, 100)
+        self.assertIsNotNone(media_file.received_at)
+        self.assertEqual(media_file.original_size, len(data))
+        with media_file.original_file.open('rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertFalse(os.listdir(self.transfer_dir))
+
+    def test_unknown_session_and_finished_transfers(self):
+        self.create_incoming(4701, status='received')
+        stats = multipart.receive_chunks([(4701, 0, 1, b'x'), (4799, 0, 1, b'x')])
+        self.assertEqual(stats['unknown_session'], 2)
+        self.assertEqual(stats['stored'], 0)
+
+    def test_duplicates_are_counted_once(self):
+        media_file = self.create_incoming(4702)
+        chunk = (4702, 0, 2, bytes(multipart.CHUNK_SIZE))
+        stats = multipart.receive_chunks([chunk, chunk, chunk])
+        self.assertEqual((stats['stored'], stats['duplicate']), (1, 2))
+        media_file.refresh_from_db()
+        self.assertEqual((media_file.status, media_file.received_packets, media_file.progress), ('receiving', 1, 50))
+
+
+class MultipartIngestTests(MediaTestCase):
+
+    def store_packets(self, payloads):
+        for payload in payloads:
+            Packet.objects.create(
+                route_type='flood',
+                payload_type='multipart',
+                payload_data=payload,
+            )
+
+    def test_malformed_first_chunk_does_not_block_transfer(self):
+        media_file = self.create_incoming(4242)
+        data = os.urandom(multipart.CHUNK_SIZE * 2 + 10)
+        chunks = multipart.split(data)
+
+        self.store_packets([multipart.encode_chunk(4242, 0, 7, b'short')])
+        stats = multipart.ingest_packets()
+        self.assertEqual(stats['invalid'], 1)
+        self.assertEqual(stats['stored'], 0)
+        self.assertIsNone(multipart.received_bitmap(media_file))
+
+        self.store_packets([
+            multipart.encode_chunk(4242, index, len(chunks), chunk) for index, chunk in enumerate(chunks)
+        ])
+        stats = multipart.ingest_packets()
+        self.assertEqual(stats['stored'], 3)
+        self.assertEqual(stats['completed'], 1)
+
+        media_file.refresh_from_db()
+        self.assertEqual(media_file.status, 'received')
+        with media_file.original_file.open('rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_stale_chunk_map_is_replaced(self):
+        media_file = self.create_incoming(4243)
+        # Left over from chunks of another count that were never recorded
+        multipart._open_store(media_file, 7).close()
+
+        stats = multipart.receive_chunks([(4243, 0, 1, b'payload')])
+        self.assertEqual(stats['stored'], 1)
+        self.assertEqual(stats['completed'], 1)
+
+    def test_broken_transfer_does_not_abort_batch(self):
+        broken = self.create_incoming(4244, total_packets=3)
+        other = self.create_incoming(4245)
+        multipart._open_store(broken, 7).close()
+
+        stats = multipart.receive_chunks([
+            (4244, 0, 3, bytes(multipart.CHUNK_SIZE)),
+            (4245, 0, 1, b'payload'),
+        ])
+        self.assertEqual(stats['invalid'], 1)
+        self.assertEqual(stats['completed'], 1)
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'received')
+
+
+class NodeViewQueryTests(TestCase):
+    """The node views run the same number of queries however many nodes there are"""
+
+    def create_nodes(self, start, count):
+        nodes = [
+            Node.objects.create(
+                public_key=key.to_bytes(32, 'big'),
+                node_hash=f'{key:02x}',
+                name=f'Node {key}',
+                is_online=True,
+                last_seen=timezone.now(),
+                latitude=52.0 + key / 1000,
+                longitude=4.0 + key / 1000,
+            )
+            for key in range(start, start + count)
+        ]
+        ingest.ingest_node_stats([
+            NodeStats(node=node, battery_mv=3900, rssi=-80, snr=5.5, uptime_seconds=3600) for node in nodes
+        ])
+
+    def assertQueriesPerView(self, url, queries):
+        self.create_nodes(1, 3)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.create_nodes(4, 30)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_nodes_list(self):
+        response = self.assertQueriesPerView(reverse('meshcore:nodes_list'), 1)
+        self.assertContains(response, 'Node 33')
+
+    def test_telemetry(self):
+        response = self.assertQueriesPerView(reverse('meshcore:telemetry'), 2)
+        self.assertEqual(len(response.context['telemetry_data']), 33)
+
+    def test_map(self):
+        self.assertQueriesPerView(reverse('meshcore:map'), 1)
+
+    def test_map_clusters(self):
+        url = reverse('meshcore:api_map_nodes') + '?bbox=3.9,51.9,4.1,52.1&zoom=5'
+        response = self.assertQueriesPerView(url, 2)
+        features = response.json()['features']
+        self.assertEqual(sum(feature['properties'].get('count', 1) for feature in features), 33)
+
+    def test_map_nodes(self):
+        # Fingerprint, cells, and one query for the details of the cells holding a single node
+        url = reverse('meshcore:api_map_nodes') + '?bbox=3.9,51.9,4.1,52.1&zoom=18'
+        response = self.assertQueriesPerView(url, 3)
+        self.assertEqual(len(response.json()['features']), 33)
+
+
+class UpdateLastSeenTests(TestCase):
+    """The PostgreSQL UPDATE ... FROM (VALUES ...) and the per-node fallback agree"""
+
+    def run_update(self, vendor, now):
+        recent = now - Node.ONLINE_WINDOW / 2
+        old = now - Node.ONLINE_WINDOW * 2
+        cases = {
+            # name: (last_seen, is_online, seen)
+            'never_seen': (None, False, recent),
+            'advanced': (old, False, recent),
+            'older_offline': (recent, False, old),
+            'stale_offline': (old, False, old - timedelta(hours=1)),
+            'older_online': (recent, True, old),
+        }
+        nodes = {
+            name: Node.objects.create(
+                public_key=bytes([index + 1]) * 32, node_hash=f'{index + 1:02x}',
+                last_seen=last_seen, is_online=is_online,
+            )
+            for index, (name, (last_seen, is_online, _)) in enumerate(cases.items())
+        }
+        with mock.patch.object(connection, 'vendor', vendor):
+            updated = ingest.update_last_seen({nodes[name].pk: seen for name, (_, _, seen) in cases.items()})
+
+        state = {}
+        for name, node in nodes.items():
+            node.refresh_from_db()
+            state[name] = (node.last_seen, node.is_online)
+        Node.objects.all().delete()
+        return updated, state
+
+    def test_branches_agree(self):
+        now = timezone.now()
+        recent = now - Node.ONLINE_WINDOW / 2
+        old = now - Node.ONLINE_WINDOW * 2
+        updated, state = self.run_update('postgresql', now)
+        self.assertEqual(state['never_seen'], (recent, True))
+        self.assertEqual(state['advanced'], (recent, True))
+        self.assertEqual(state['older_offline'], (recent, True))
+        self.assertEqual(state['stale_offline'], (old, False))
+        self.assertEqual(state['older_online'], (recent, True))
+
+        self.assertEqual(self.run_update('sqlite', now), (updated, state))
+
+
+class NodeSeriesTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        # Two nodes whose public keys start with the same byte
+        self.older = Node.objects.create(
+            public_key=b'\xab' + bytes(31), node_hash='ab', last_seen=now - timedelta(days=1)
+        )
+        self.newer = Node.objects.create(public_key=b'\xab' + bytes([1]) * 31, node_hash='ab', last_seen=now)
+
+    def get(self, identifier):
+        return self.client.get(reverse('meshcore:api_node_series', args=[identifier]))
+
+    def test_shared_hash_resolves_to_most_recently_seen(self):
+        response = self.get('AB')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['public_key'], bytes(self.newer.public_key).hex())
+
+    def test_public_key(self):
+        response = self.get(bytes(self.older.public_key).hex())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['public_key'], bytes(self.older.public_key).hex())
+
+    def test_unknown_node(self):
+        self.assertEqual(self.get('cd').status_code, 404)
+        self.assertEqual(self.get('zz' * 32).status_code, 404)
+        self.assertEqual(self.get('cd' * 32).status_code, 404)
+
+
+class ExportStreamTests(SimpleTestCase):
+
+    def test_cancelled_async_export_frees_executor_thread(self):
+        stream = export.ExportStream('messages', None, 'csv')
+        # A worker still running its query: nothing reaches the queue
+        started = threading.Event()
+        stream.worker = threading.Thread(target=started.wait, daemon=True)
+
+        async def abort_while_waiting():
+            loop = asyncio.get_running_loop()
+            executor = ThreadPoolExecutor(max_workers=1)
+            loop.set_default_executor(executor)
+            chunks = stream.__aiter__()
+            task = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertTrue(stream.cancelled.is_set())
+            # The only executor thread is free again once its poll times out
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(None, lambda: 'free'), timeout=5)
+            finally:
+                # Release a thread stuck in get() so the loop can shut down
+                stream.chunks.put_nowait(stream._DONE)
+
+        try:
+            self.assertEqual(asyncio.run(abort_while_waiting()), 'free')
+        finally:
+            started.set()
+
+
+class MessageETagTests(TestCase):
+    """Any change to meshcore_message invalidates the message APIs' ETags"""
+
+    def setUp(self):
+        self.sender = Node.objects.create(public_key=bytes([7]) * 32, node_hash='07')
+        self.messages = ingest.ingest_messages([
+            Message(
+                message_id=f'm{index}', checksum=f'{index:08x}', sender=self.sender, sender_hash='07',
+                message_type='txt_msg', content=f'hello {index}', timestamp=timezone.now(),
+            )
+            for index in range(3)
+        ])
+
+    def assertChangeInvalidates(self, url, change):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_delete(self):
+        self.assertChangeInvalidates(reverse('meshcore:api_messages'), self.messages[0].delete)
+
+    def test_bulk_delete_and_cascade(self):
+        url = reverse('meshcore:api_message_search') + '?q=hello'
+        self.assertChangeInvalidates(url, Message.objects.filter(message_id='m1').delete)
+        self.assertChangeInvalidates(url, self.sender.delete)
+
+    def test_acknowledgement(self):
+        self.assertChangeInvalidates(
+            reverse('meshcore:api_messages'),
+            lambda: Message.objects.filter(message_id='m2').update(is_acknowledged=True)
+        )
+
+    def test_without_trigger(self):
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                cursor.execute('ALTER TABLE meshcore_message DISABLE TRIGGER meshcore_message_version')
+            self.assertChangeInvalidates(reverse('meshcore:api_messages'), self.messages[0].delete)
+
+
+def make_messages(prefix, count, **kwargs):
+    return [
+        Message(
+            message_id=f'{prefix}{index}', checksum=f'{index:08x}', sender_hash='07',
+            message_type='txt_msg', content=f'{prefix} {index}', timestamp=timezone.now(), **kwargs
+        )
+        for index in range(count)
+    ]
+
+
+class ReconcileTests(TestCase):
+
+    def test_corrects_buckets_and_totals(self):
+        ingest.ingest_messages(make_messages('m', 4))
+        hour = counters.truncate_hour(timezone.now())
+        TrafficCounter.objects.filter(kind='message').update(count=9)
+        TrafficCounter.objects.create(hour=hour, kind='message', type='grp_txt', count=2)
+        CounterTotal.objects.filter(name='messages').update(value=1)
+
+        self.assertEqual(counters.reconcile(), {'message': 3, 'packet': 0})
+        self.assertEqual(counters.get_total('message'), 4)
+        self.assertEqual(list(counters.window_counts('message')), [{'type': 'txt_msg', 'count': 4}])
+        self.assertEqual(counters.reconcile(), {'message': 0, 'packet': 0})
+
+
+class ReconcileConcurrencyTests(TransactionTestCase):
+
+    def test_does_not_block_or_miscount_running_ingest(self):
+        ingest.ingest_messages(make_messages('m', 2))
+        inserted = threading.Event()
+        release = threading.Event()
+
+        def ingest_in_flight():
+            try:
+                with transaction.atomic():
+                    ingest.ingest_messages(make_messages('flight', 3))
+                    inserted.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=ingest_in_flight)
+        thread.start()
+        try:
+            self.assertTrue(inserted.wait(10))
+            with connection.cursor() as cursor:
+                cursor.execute("SET lock_timeout = '3s'")
+            # The uncommitted ingest is in neither the snapshot's rows nor its counters
+            self.assertEqual(counters.reconcile(), {'message': 0, 'packet': 0})
+        finally:
+            release.set()
+            thread.join()
+            with connection.cursor() as cursor:
+                cursor.execute('RESET lock_timeout')
+
+        self.assertEqual(counters.reconcile(), {'message': 0, 'packet': 0})
+        self.assertEqual(counters.get_total('message'), 5)
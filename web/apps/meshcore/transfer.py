@@ -0,0 +1,329 @@
+"""
+Windowed multipart sending with selective NACKs
+
+Waiting for an ACK after every chunk costs a full multi-hop round trip
+per 176 bytes. Instead the sender keeps a window of chunks in flight and
+the receiver periodically answers with a selective NACK (see
+multipart.encode_nack): the first chunk it lacks plus a bitmap of the gaps
+up to the highest chunk received. Only chunks a NACK reports missing, or
+that stay unanswered for a retransmission timeout, are sent again.
+
+On a radio link loss is mostly noise and collisions rather than queues
+overflowing, and pacing already keeps the sender from flooding the
+channel, so the window is sized to keep the path busy rather than cut on
+every loss: enough chunks for the receiver to collect a NACK batch while
+the previous NACK travels back, scaled up by the loss rate NACKs report.
+A smaller window would stall until the receiver's idle NACK. Hop count
+sets the pacing (relays forwarding one chunk are done before the next goes
+out), the starting window and the timeout; timeouts halve the window.
+Every transmission draws on an AirtimeBudget (regional duty cycle limit),
+computed with the LoRa time on air formula.
+
+The classes here are I/O free and take the current time as an argument,
+so the same code runs against the radio or a simulated link (see the
+benchmark_transfer management command).
+"""
+import math
+from collections import deque
+from django.conf import settings
+from .multipart import HEADER, MAX_PACKET_PAYLOAD, ChunkBitmap
+
+MAX_WINDOW = 64
+MAX_LOSS = 0.75  # Cap on the loss rate used to size the window
+MIN_RTO = 2.0  # Seconds
+MAX_RTO = 600.0
+
+
+def airtime(payload_size, spreading_factor=None, bandwidth=None, coding_rate=None, preamble=8):
+    """
+    LoRa time on air of a packet of `payload_size` bytes in seconds (Semtech AN1200.13)
+
+    `coding_rate` is the denominator of 4/CR (5-8). Explicit header and
+    CRC are assumed; low data rate optimisation is used where required.
+    """
+    sf = spreading_factor or settings.MESHCORE_LORA_SPREADING_FACTOR
+    bw = bandwidth or settings.MESHCORE_LORA_BANDWIDTH
+    cr = (coding_rate or settings.MESHCORE_LORA_CODING_RATE) - 4
+    symbol_time = (2 ** sf) / bw
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    payload_symbols = 8 + max(
+        math.ceil((8 * payload_size - 4 * sf + 28 + 16) / (4 * (sf - 2 * low_data_rate))) * (cr + 4), 0
+    )
+    return (preamble + 4.25 + payload_symbols) * symbol_time
+
+
+class AirtimeBudget:
+    """
+    Duty cycle limit as a token bucket of transmit seconds
+
+    Refills at `duty_cycle` seconds of airtime per second and holds at most
+    duty_cycle * period seconds, so the average over any period stays
+    within the limit.
+    """
+
+    def __init__(self, duty_cycle=None, period=None, now=0.0):
+        self.duty_cycle = duty_cycle or settings.MESHCORE_LORA_DUTY_CYCLE
+        self.capacity = self.duty_cycle * (period or settings.MESHCORE_LORA_DUTY_CYCLE_PERIOD)
+        self.tokens = self.capacity
+        self.updated = now
+        self.used = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.duty_cycle)
+            self.updated = now
+
+    def delay(self, cost, now):
+        """Seconds until `cost` seconds of airtime may be spent"""
+        self._refill(now)
+        return max(0.0, (cost - self.tokens) / self.duty_cycle)
+
+    def consume(self, cost, now):
+        self._refill(now)
+        self.tokens -= cost
+        self.used += cost
+
+
+class WindowedSender:
+    """
+    Sender side of a windowed transfer
+
+    Call next_send() for the next chunk and when to send it, sent() once it
+    is on air, on_nack() for every NACK and check_timeout() periodically.
+    """
+
+    def __init__(self, total, hops=1, budget=None, now=0.0, max_window=MAX_WINDOW):
+        self.total = total
+        self.hops = max(1, hops)
+        self.budget = budget or AirtimeBudget(now=now)
+        self.chunk_airtime = packet_airtime(MAX_PACKET_PAYLOAD, self.hops)
+        # Relays repeat every chunk on the same channel, so leave them room before the next one
+        self.pacing = self.chunk_airtime * self.hops
+
+        self.confirmed = ChunkBitmap(total)
+        self.confirmed_base = 0  # Every chunk below this is confirmed
+        self.in_flight = {}  # index -> time sent, for chunks not yet confirmed or reported missing
+        self.last_sent = [None] * total
+        self.retransmit = deque()
+        self.queued = set()
+        self.next_new = 0
+
+        # Until measured, assume a round trip is a chunk out and a NACK back over every hop
+        round_trip = 2 * self.hops * (self.chunk_airtime + settings.MESHCORE_LORA_HOP_DELAY)
+        self.nack_every = settings.MESHCORE_TRANSFER_NACK_EVERY
+        # RTT here is from sending a chunk to the NACK that covers it, which includes the
+        # receiver collecting a batch of chunks first; the quickest answers approximate the path
+        self.srtt = round_trip + max(self.nack_every * self.pacing, settings.MESHCORE_TRANSFER_NACK_IDLE)
+        self.rttvar = self.srtt / 2
+        self.rto = max(MIN_RTO, self.srtt + 4 * self.rttvar)
+        self.min_rtt = round_trip
+        self.last_nack = now
+        # Average time between NACKs, which is long when the duty cycle slows the chunks down
+        self.nack_interval = self.srtt
+
+        self.loss = 0.0  # Average share of the chunks NACKs report that were lost
+        self.max_window = max_window
+        self.min_window = min(max_window, self.nack_every)
+        self.window = self._target_window()
+        self.channel_free_at = now
+
+        self.stats = {'sent': 0, 'retransmitted': 0, 'nacks': 0, 'timeouts': 0, 'lost': 0}
+
+    @property
+    def done(self):
+        return self.confirmed.complete
+
+    def next_send(self, now):
+        """(index, time) of the next chunk to send, or None while the window is full"""
+        while self.retransmit and self.retransmit[0] in self.confirmed:
+            self.queued.discard(self.retransmit.popleft())
+        if self.retransmit:
+            index = self.retransmit[0]
+        elif self.next_new < self.total and len(self.in_flight) < int(self.window):
+            index = self.next_new
+        else:
+            return None
+        at = max(now, self.channel_free_at)
+        return index, at + self.budget.delay(self.chunk_airtime, at)
+
+    def sent(self, index, now):
+        """Record that a chunk went on air"""
+        if self.retransmit and self.retransmit[0] == index:
+            self.retransmit.popleft()
+            self.queued.discard(index)
+            self.stats['retransmitted'] += 1
+        elif index == self.next_new:
+            self.next_new += 1
+        self.in_flight[index] = self.last_sent[index] = now
+        self.budget.consume(self.chunk_airtime, now)
+        self.channel_free_at = now + self.pacing
+        self.stats['sent'] += 1
+
+    def on_nack(self, base, missing, now):
+        """Apply a NACK: confirm what arrived, queue what was overtaken and lost, adapt the window"""
+        self.stats['nacks'] += 1
+        self.nack_interval = 0.875 * self.nack_interval + 0.125 * (now - self.last_nack)
+        self.last_nack = now
+        newly_confirmed = 0
+        newly_lost = []
+
+        def confirm(index):
+            nonlocal newly_confirmed
+            if self.confirmed.add(index):
+                newly_confirmed += 1
+            self.in_flight.pop(index, None)
+
+        # The highest chunk the receiver has; nothing above it has arrived
+        end = min(self.total, base + len(missing) * 8)
+        high = end - 1
+        while high >= base and missing[(high - base) >> 3] & (1 << ((high - base) & 7)):
+            high -= 1
+        high_sent_at = self.last_sent[high] if high >= 0 else float('-inf')
+        rtt_sample = now - high_sent_at if high in self.in_flight else None
+
+        def lost(index):
+            # Overtaken by the highest chunk, or sent so long ago it should have arrived before
+            # this NACK left (a repeated NACK after a lost retransmission)
+            sent_at = self.in_flight.get(index)
+            return sent_at is not None and (sent_at <= high_sent_at or now - sent_at > 2 * self.min_rtt)
+
+        for index in range(self.confirmed_base, min(base, self.total)):
+            confirm(index)
+        self.confirmed_base = max(self.confirmed_base, min(base, self.total))
+        if high >= base:
+            confirm(high)
+
+        for index in range(base, high):
+            offset = index - base
+            if not missing[offset >> 3] & (1 << (offset & 7)):
+                confirm(index)
+                continue
+            if lost(index):
+                newly_lost.append(index)
+        newly_lost += [index for index in self.in_flight if index > high and lost(index)]
+
+        for index in newly_lost:
+            del self.in_flight[index]
+            if index not in self.queued:
+                self.queued.add(index)
+                self.retransmit.append(index)
+        self.stats['lost'] += len(newly_lost)
+
+        if rtt_sample is not None:
+            self.min_rtt = min(self.min_rtt, rtt_sample)
+            # Jacobson/Karels, as in TCP
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt_sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt_sample
+            self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+        reported = newly_confirmed + len(newly_lost)
+        if reported:
+            self.loss = 0.75 * self.loss + 0.25 * len(newly_lost) / reported
+            self.window = self._target_window()
+
+    def _target_window(self):
+        """A NACK batch plus what is sent during a round trip, allowing for loss"""
+        window = (self.nack_every + math.ceil(self.min_rtt / self.pacing)) / (1 - min(self.loss, MAX_LOSS))
+        return float(min(self.max_window, max(self.min_window, window)))
+
+    def check_timeout(self, now):
+        """
+        Resend the oldest unanswered chunk if no NACK has come for a timeout
+
+        NACKs report losses themselves, so this only covers the receiver
+        going quiet (lost NACKs, a broken path). Returns True if it timed out.
+        """
+        if not self.in_flight:
+            return False
+        oldest = min(self.in_flight, key=self.in_flight.get)
+        if now - max(self.in_flight[oldest], self.last_nack) < max(self.rto, 2 * self.nack_interval):
+            return False
+        del self.in_flight[oldest]
+        if oldest not in self.queued:
+            self.queued.add(oldest)
+            self.retransmit.appendleft(oldest)
+        self.window = max(self.min_window, self.window / 2)
+        self.rto = min(MAX_RTO, self.rto * 2)
+        self.stats['timeouts'] += 1
+        return True
+
+
+class NackScheduler:
+    """
+    Receiver side of a windowed transfer: when to send a NACK and what it says
+
+    A NACK goes out after every `every` chunks, as soon as the last chunk
+    or every retransmission asked for has arrived, once arrivals pause for
+    `idle` seconds (or three times the usual spacing), when the transfer
+    completes, and again whenever a chunk arrives after completion (the
+    final ACK was lost). If an incomplete transfer goes quiet after a NACK,
+    the NACK is repeated with exponential backoff, so a lost NACK or
+    retransmission costs an idle period rather than the sender's timeout.
+    """
+
+    def __init__(self, total, every=None, idle=None, now=0.0):
+        self.bitmap = ChunkBitmap(total)
+        self.every = every or settings.MESHCORE_TRANSFER_NACK_EVERY
+        self.idle = idle or settings.MESHCORE_TRANSFER_NACK_IDLE
+        self.gap = 0.0  # Average time between arrivals
+        self.pending = 0
+        self.urgent = False
+        self.highest = -1
+        self.requested = set()  # Reported missing in the last NACK and still missing
+        self.last_arrival = None
+        self.last_heard = now  # Last chunk or NACK
+        self.repeats = 0
+        self.duplicates = 0
+
+    def on_chunk(self, index, now):
+        """Record an arriving chunk; returns False for a duplicate"""
+        if self.last_arrival is not None:
+            gap = now - self.last_arrival
+            # Clipped, so pauses while the sender waits for a NACK barely move it but a
+            # steady duty cycle limited pace is still learnt
+            self.gap = 0.875 * self.gap + 0.125 * min(gap, 2 * self.gap) if self.gap else gap
+        self.last_arrival = self.last_heard = now
+        self.pending += 1
+        self.repeats = 0
+        if not self.bitmap.add(index):
+            self.duplicates += 1
+            return False
+        self.highest = max(self.highest, index)
+        if index in self.requested:
+            self.requested.discard(index)
+            self.urgent = self.urgent or not self.requested
+        if index == self.bitmap.total - 1:
+            self.urgent = True
+        return True
+
+    def due(self, now):
+        # A pause only counts as idle if it is well beyond the usual spacing (duty cycle, pacing)
+        idle = max(self.idle, 3 * self.gap)
+        if not self.pending:
+            quiet = now - self.last_heard >= idle * 2 ** (self.repeats + 1)
+            return 0 < self.bitmap.count < self.bitmap.total and quiet
+        return (
+            self.pending >= self.every or self.urgent or self.bitmap.complete
+            or now - self.last_heard >= idle
+        )
+
+    def nack(self, now):
+        """(base, missing bitmap) to send; resets the schedule"""
+        if not self.pending:
+            self.repeats += 1
+        self.pending = 0
+        self.urgent = False
+        self.last_heard = now
+        base, missing = self.bitmap.nack()
+        self.requested = {index for index in range(base, self.highest) if index not in self.bitmap}
+        return base, missing
+
+
+def packet_airtime(payload_size, hops=1):
+    """Time on air of a MeshCore packet: header and path length bytes, one path byte per hop, payload"""
+    return airtime(2 + hops + payload_size)
+
+
+def nack_airtime(missing, hops=1):
+    """Time on air of a NACK with the given bitmap"""
+    return packet_airtime(HEADER.size + len(missing), hops)
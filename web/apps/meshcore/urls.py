@@ -8,7 +8,7 @@ from .views_device import (scan_serial_ports, scan_bluetooth_devices,
                             disconnect_device, delete_device, test_device_connection)
 from .views_config import (test_mqtt_connection, test_serial_connection,
                            save_configuration, get_configuration, reload_bridge_config,
-                           get_bridge_logs)
+                           get_bridge_logs, stream_bridge_logs)
 
 app_name = 'meshcore'
 
@@ -30,7 +30,15 @@ urlpatterns = [
     # API endpoints
     path('api/status/', views.api_status, name='api_status'),
     path('api/nodes/', views.api_nodes, name='api_nodes'),
+    path('api/nodes/<str:node_hash>/series/', views.api_node_series, name='api_node_series'),
     path('api/messages/', views.api_messages, name='api_messages'),
+    path('api/messages/search/', views.api_message_search, name='api_message_search'),
+    path('api/packets/', views.api_packets, name='api_packets'),
+    path('api/export/<str:dataset>/', views.api_export, name='api_export'),
+    path('api/events/', views.live_events, name='live_events'),
+    path('api/map/nodes/', views.api_map_nodes, name='api_map_nodes'),
+    path('api/stats/conditional/', views.api_conditional_stats, name='api_conditional_stats'),
+    path('api/metrics/', views.api_metrics, name='api_metrics'),
     
     # Device connection APIs
     path('api/scan/serial/', scan_serial_ports, name='api_scan_serial'),
@@ -51,6 +59,7 @@ urlpatterns = [
     path('api/config/get/', get_configuration, name='api_get_config'),
     path('api/config/reload/', reload_bridge_config, name='api_reload_config'),
     path('api/bridge/logs/', get_bridge_logs, name='api_bridge_logs'),
+    path('api/bridge/logs/stream/', stream_bridge_logs, name='api_bridge_logs_stream'),
     
     # Multimedia
     path('media/', media_gallery, name='media_gallery'),
@@ -1,20 +1,31 @@
 """
 MeshCore Views
 """
+import json
+import hashlib
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.db import connection
+from django.db.models import Avg, Count, F, Max, Min, Q
+from django.db.models.functions import Substr
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
-    Node, Channel, Message, Packet, NodeStats,
+    battery_percentage, Node, Channel, Message, Packet, NodeStats,
     BridgeConfiguration, BridgeStatus
 )
+from . import counters, export, geo, live, metrics, search, series
+from .conditional import conditional, get_stats as get_conditional_stats
+from .pagination import InvalidCursor, after_cursor, get_page_size, keyset_order, paginate
+from .streaming import stream_json, wants_stream
 
 
 def dashboard(request):
     """Main dashboard view"""
-    from django.db.models import Count
-    
     # Get or create bridge status
     bridge_status = BridgeStatus.objects.first()
     if not bridge_status:
@@ -22,20 +33,21 @@ def dashboard(request):
     
     # Get node counts
     total_nodes = Node.objects.count()
-    online_nodes = Node.objects.filter(is_online=True).count()
-    
-    # Get message counts (last 24 hours)
-    from datetime import datetime, timedelta
-    twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
-    total_messages = Message.objects.count()
-    messages_24h = Message.objects.filter(timestamp__gte=twenty_four_hours_ago).count()
+    # Keys rather than a count, so the live feed can keep the count exact
+    online_node_keys = [
+        bytes(key).hex() for key in Node.objects.filter(is_online=True).values_list('public_key', flat=True)
+    ]
+    online_nodes = len(online_node_keys)
+    
+    # Get message counts (maintained incrementally, see counters.py)
+    total_messages = counters.get_total('message')
+    message_types = [
+        {'message_type': row['type'], 'count': row['count']}
+        for row in counters.window_counts('message', hours=24)
+    ]
+    messages_24h = sum(row['count'] for row in message_types)
     recent_messages = Message.objects.select_related('sender', 'recipient').order_by('-timestamp')[:10]
     
-    # Get message type breakdown (last 24 hours)
-    message_types = Message.objects.filter(
-        timestamp__gte=twenty_four_hours_ago
-    ).values('message_type').annotate(count=Count('id')).order_by('-count')
-    
     # Add status for bridge connection
     status = bridge_status
     if hasattr(bridge_status, 'status'):
@@ -46,6 +58,7 @@ def dashboard(request):
         'status': status,
         'total_nodes': total_nodes,
         'online_nodes': online_nodes,
+        'online_node_keys': json.dumps(online_node_keys),
         'total_messages': total_messages,
         'messages_24h': messages_24h,
         'recent_messages': recent_messages,
@@ -132,55 +145,153 @@ def channels_list(request):
 
 
 def map_view(request):
-    """Map view showing node locations"""
-    import json
+    """Map view; nodes are loaded per tile from api_map_nodes"""
     from django.core.serializers.json import DjangoJSONEncoder
     
-    nodes_with_location = Node.objects.filter(
-        latitude__isnull=False,
-        longitude__isnull=False
+    bounds = Node.objects.exclude(geohash='').aggregate(
+        south=Min('latitude'), west=Min('longitude'), north=Max('latitude'), east=Max('longitude')
     )
     
-    # Prepare nodes data for JavaScript
-    nodes_data = []
-    for node in nodes_with_location:
-        nodes_data.append({
-            'node_hash': node.node_hash,
-            'name': node.name or node.short_name,
-            'latitude': float(node.latitude) if node.latitude else None,
-            'longitude': float(node.longitude) if node.longitude else None,
-            'is_online': node.is_online,
-            'is_favorite': node.is_favorite,
-            'hardware_model': node.node_type.title(),
-            'battery_level': None,
-            'snr': None,
-            'last_seen_ago': node.get_last_seen_display() if hasattr(node, 'get_last_seen_display') else 'N/A',
-        })
-    
     # Prepare waypoints data (empty for now)
     waypoints_data = []
     
     context = {
-        'nodes': nodes_with_location,
-        'nodes_json': json.dumps(nodes_data, cls=DjangoJSONEncoder),
+        'bounds_json': json.dumps(bounds if bounds['south'] is not None else None),
         'waypoints_json': json.dumps(waypoints_data, cls=DjangoJSONEncoder),
     }
     return render(request, 'meshcore/map.html', context)
 
 
+def _map_node_properties(node):
+    return {
+        'cluster': False,
+        'public_key': bytes(node['public_key']).hex(),
+        'node_hash': node['node_hash'],
+        'name': node['name'] or node['short_name'],
+        'node_type': node['node_type'],
+        'is_online': node['is_online'],
+        'is_favorite': node['is_favorite'],
+        'battery_level': battery_percentage(node['latest_battery_mv']),
+        'snr': node['latest_snr'],
+        'last_seen': node['last_seen'].isoformat() if node['last_seen'] else None,
+    }
+
+
+def api_map_nodes(request):
+    """
+    Nodes in a bounding box as GeoJSON, clustered by geohash cell for the zoom level
+    
+    ?bbox=west,south,east,north&zoom=N[&online=1]. Clusters carry node and
+    online counts; single nodes carry their details. Responses have an ETag
+    derived from the box's contents, so unchanged tiles revalidate with a 304.
+    """
+    try:
+        south, west, north, east = geo.parse_bbox(request.GET.get('bbox'))
+        zoom = int(request.GET.get('zoom', 0))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    precision = geo.precision_for_zoom(zoom)
+    online_only = request.GET.get('online') in ('1', 'true')
+    
+    nodes = Node.objects.filter(
+        latitude__gte=south, latitude__lte=north, longitude__gte=west, longitude__lte=east
+    )
+    cells = geo.covering_cells(south, west, north, east)
+    if cells != ['']:
+        in_cells = Q()
+        for cell in cells:
+            in_cells |= Q(geohash__startswith=cell)
+        nodes = nodes.filter(in_cells)
+    if online_only:
+        nodes = nodes.filter(is_online=True)
+    
+    # Fingerprint of the box's contents: unchanged boxes get a 304 without clustering
+    state = nodes.aggregate(
+        count=Count('id'), online=Count('id', filter=Q(is_online=True)),
+        updated=Max('updated_at'), seen=Max('last_seen'), telemetry=Max('latest_stats_at'),
+    )
+    key = [south, west, north, east, precision, online_only] + [str(value) for value in state.values()]
+    etag = '"%s"' % hashlib.md5(json.dumps(key).encode()).hexdigest()
+    
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+    
+    clusters = nodes.annotate(cell=Substr('geohash', 1, precision)).values('cell').annotate(
+        count=Count('id'),
+        online=Count('id', filter=Q(is_online=True)),
+        latitude=Avg('latitude'),
+        longitude=Avg('longitude'),
+        node_id=Min('id'),
+    ).order_by()
+    
+    clusters = list(clusters)
+    single_ids = [cluster['node_id'] for cluster in clusters if cluster['count'] == 1]
+    singles = {
+        node['id']: node for node in Node.objects.filter(pk__in=single_ids).values(
+            'id', 'public_key', 'node_hash', 'name', 'short_name', 'node_type', 'is_online', 'is_favorite',
+            'latitude', 'longitude', 'latest_battery_mv', 'latest_snr', 'last_seen',
+        )
+    }
+    
+    features = []
+    for cluster in clusters:
+        node = singles.get(cluster['node_id']) if cluster['count'] == 1 else None
+        if node:
+            coordinates = [node['longitude'], node['latitude']]
+            properties = _map_node_properties(node)
+        else:
+            coordinates = [cluster['longitude'], cluster['latitude']]
+            properties = {
+                'cluster': True,
+                'cell': cluster['cell'],
+                'count': cluster['count'],
+                'online': cluster['online'],
+            }
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': coordinates},
+            'properties': properties,
+        })
+    
+    response = JsonResponse({'type': 'FeatureCollection', 'features': features})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _latest_stats_by_node(node_ids):
+    """Newest NodeStats row for each node, in one query"""
+    stats = NodeStats.objects.filter(node_id__in=node_ids)
+    if connection.vendor == 'postgresql':
+        stats = stats.order_by('node_id', '-collected_at').distinct('node_id')
+        return {row.node_id: row for row in stats}
+    
+    latest = {}
+    for row in stats.order_by('collected_at'):
+        latest[row.node_id] = row
+    return latest
+
+
 def telemetry(request):
     """Telemetry dashboard"""
-    # Get nodes with recent stats
-    nodes = Node.objects.filter(is_online=True)
+    # Get nodes with recent stats (latest readings are denormalized onto Node)
+    nodes = list(Node.objects.filter(is_online=True, latest_stats_at__isnull=False))
+    latest_stats = _latest_stats_by_node([node.pk for node in nodes])
     telemetry_data = []
     
     for node in nodes:
-        latest_stats = NodeStats.objects.filter(node=node).first()
-        if latest_stats:
-            telemetry_data.append({
-                'node': node,
-                'stats': latest_stats,
-            })
+        stats = latest_stats.get(node.pk)
+        telemetry_data.append({
+            'node': node,
+            'stats': stats,
+            'device_metrics': {
+                'battery_level': node.battery_level,
+                'voltage': node.latest_battery_mv / 1000 if node.latest_battery_mv else None,
+                'uptime_seconds': stats.uptime_seconds if stats else None,
+            },
+        })
     
     context = {
         'telemetry_data': telemetry_data,
@@ -223,6 +334,20 @@ def configuration(request):
 
 # API Views
 
+def _bridge_status_version(request):
+    updated_at = BridgeStatus.objects.values_list('updated_at', flat=True).first()
+    return updated_at, updated_at
+
+
+def _table_version(name):
+    """Version marker from a change counter or total (see counters.py)"""
+    def version(request):
+        value, updated_at = counters.get_version(name)
+        return f'{value}@{updated_at}', updated_at
+    return version
+
+
+@conditional('api_status', _bridge_status_version)
 def api_status(request):
     """API endpoint for bridge status"""
     bridge_status = BridgeStatus.objects.first()
@@ -239,37 +364,317 @@ def api_status(request):
     })
 
 
+def _csv_param(request, name):
+    """Comma-separated query parameter as a list"""
+    return [value.strip() for value in request.GET.get(name, '').split(',') if value.strip()]
+
+
+async def live_events(request):
+    """
+    Server-Sent Events feed of bridge status, packets, node and message changes
+    
+    ?events= limits the event types (status,packet,node,message) and
+    ?packet_types= the packet payload types. Needs the ASGI server.
+    """
+    if not live.enabled():
+        return JsonResponse({'error': 'Live feed is not configured'}, status=503)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Live feed requires the ASGI server'}, status=503)
+    
+    wanted = live.event_filter(_csv_param(request, 'events'), _csv_param(request, 'packet_types'))
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    
+    response = StreamingHttpResponse(live.event_stream(wanted, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _api_time_range(request, field):
+    """Filters for ?since= / ?until= (ISO 8601); raises ValueError if malformed"""
+    filters = {}
+    for param, lookup in (('since', 'gte'), ('until', 'lt')):
+        value = request.GET.get(param)
+        if value:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError(f'Invalid {param} timestamp')
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            filters[f'{field}__{lookup}'] = parsed
+    return filters
+
+
+NODE_API_FIELDS = ['id', 'node_hash', 'name', 'node_type', 'is_online', 'latitude', 'longitude', 'last_seen']
+MESSAGE_API_FIELDS = [
+    'id', 'message_id', 'sender_hash', 'recipient_hash', 'channel_id',
+    'message_type', 'content', 'timestamp',
+]
+PACKET_API_FIELDS = [
+    'id', 'route_type', 'payload_type', 'payload_version', 'path', 'payload_data',
+    'received_at', 'rssi', 'snr', 'message_id',
+]
+
+
+def _node_json(row):
+    return {
+        'node_hash': row['node_hash'],
+        'name': row['name'],
+        'node_type': row['node_type'],
+        'is_online': row['is_online'],
+        'latitude': row['latitude'],
+        'longitude': row['longitude'],
+        'last_seen': row['last_seen'].isoformat() if row['last_seen'] else None,
+    }
+
+
+def _message_json(row):
+    return {
+        'id': row['id'],
+        'message_id': row['message_id'],
+        'sender_hash': row['sender_hash'],
+        'recipient_hash': row['recipient_hash'],
+        'channel_id': row['channel_id'],
+        'message_type': row['message_type'],
+        'content': row['content'],
+        'timestamp': row['timestamp'].isoformat(),
+    }
+
+
+def _packet_json(row):
+    path = bytes(row['path'] or b'')
+    return {
+        'id': row['id'],
+        'route_type': row['route_type'],
+        'payload_type': row['payload_type'],
+        'payload_version': row['payload_version'],
+        'path': [f'{byte:02x}' for byte in path],
+        'hop_count': len(path),
+        'payload': bytes(row['payload_data']).hex(),
+        'received_at': row['received_at'].isoformat(),
+        'rssi': row['rssi'],
+        'snr': row['snr'],
+        'message_id': row['message_id'],
+    }
+
+
+def _api_list(request, key, queryset, field, serialize):
+    """Cursor-paginated JSON list, or the whole result streamed with ?stream=1"""
+    try:
+        if wants_stream(request):
+            queryset = keyset_order(after_cursor(queryset, field, request.GET.get('cursor')), field)
+            return stream_json(key, queryset, serialize)
+        
+        rows, next_cursor = paginate(queryset, field, request.GET.get('cursor'), get_page_size(request))
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({key: [serialize(row) for row in rows], 'next_cursor': next_cursor})
+
+
+@conditional('api_nodes', _table_version(counters.NODES_VERSION))
 def api_nodes(request):
-    """API endpoint for nodes"""
-    nodes = Node.objects.all()
+    """API endpoint for nodes (newest last_seen first, cursor paginated)"""
+    nodes = Node.objects.values(*NODE_API_FIELDS)
     
-    data = [{
-        'node_hash': node.node_hash,
-        'name': node.name,
-        'node_type': node.node_type,
-        'is_online': node.is_online,
-        'latitude': node.latitude,
-        'longitude': node.longitude,
-        'last_seen': node.last_seen.isoformat() if node.last_seen else None,
-    } for node in nodes]
+    status_filter = request.GET.get('status')
+    if status_filter == 'online':
+        nodes = nodes.filter(is_online=True)
+    elif status_filter == 'offline':
+        nodes = nodes.filter(is_online=False)
+    
+    type_filter = request.GET.get('type')
+    if type_filter:
+        nodes = nodes.filter(node_type=type_filter)
+    
+    return _api_list(request, 'nodes', nodes, 'last_seen', _node_json)
+
+
+def _resolve_node(identifier):
+    """
+    Node by public key (64 hex characters) or by node hash
+    
+    A node hash is a single byte, so several nodes can share one; it
+    resolves to the most recently seen of them.
+    """
+    identifier = identifier.lower()
+    if len(identifier) == 64:
+        try:
+            public_key = bytes.fromhex(identifier)
+        except ValueError:
+            raise Http404('Invalid public key')
+        return get_object_or_404(Node, public_key=public_key)
+    
+    node = Node.objects.filter(node_hash=identifier).order_by(F('last_seen').desc(nulls_last=True), 'pk').first()
+    if node is None:
+        raise Http404('No node with this hash')
+    return node
+
+
+def api_node_series(request, node_hash):
+    """
+    Downsampled chart series for a node
+    
+    The node is given by public key, or by node hash (the most recently
+    seen node if the hash is shared). ?metrics= (battery, rssi, snr,
+    packet_rate, rx_rssi, rx_snr; default the telemetry ones), ?since= /
+    ?until= (ISO 8601, default the last 24 hours) and ?points= (target
+    points per series).
+    """
+    node = _resolve_node(node_hash)
+    
+    metrics = _csv_param(request, 'metrics') or list(series.DEFAULT_METRICS)
+    unknown = [metric for metric in metrics if metric not in series.METRICS]
+    if unknown:
+        return JsonResponse({'error': f"Unknown metrics: {', '.join(unknown)}"}, status=400)
+    
+    try:
+        time_range = _api_time_range(request, 'time')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        points = int(request.GET.get('points', settings.MESHCORE_SERIES_POINTS))
+    except ValueError:
+        return JsonResponse({'error': 'points must be an integer'}, status=400)
+    
+    end = time_range.get('time__lt') or timezone.now()
+    start = time_range.get('time__gte') or end - timedelta(hours=24)
+    if start >= end:
+        return JsonResponse({'error': 'since must be before until'}, status=400)
+    points = max(3, min(points, settings.MESHCORE_SERIES_MAX_POINTS))
+    
+    return JsonResponse({
+        'node': node.node_hash,
+        'public_key': bytes(node.public_key).hex(),
+        **series.node_series(node, metrics, start, end, points),
+    })
+
+
+def _filter_messages(request, messages):
+    """Apply the message API filters; raises ValueError for a malformed time range"""
+    type_filter = request.GET.get('type')
+    if type_filter:
+        messages = messages.filter(message_type=type_filter)
+    
+    sender_hash = request.GET.get('sender_hash')
+    if sender_hash:
+        messages = messages.filter(sender_hash=sender_hash.lower())
     
-    return JsonResponse({'nodes': data})
+    recipient_hash = request.GET.get('recipient_hash')
+    if recipient_hash:
+        messages = messages.filter(recipient_hash=recipient_hash.lower())
+    
+    channel_id = request.GET.get('channel')
+    if channel_id:
+        messages = messages.filter(channel_id=channel_id)
+    
+    return messages.filter(**_api_time_range(request, 'timestamp'))
 
 
+@conditional('api_messages', _table_version(counters.MESSAGES_VERSION))
 def api_messages(request):
-    """API endpoint for messages"""
-    messages = Message.objects.select_related('sender', 'recipient').order_by('-timestamp')[:50]
-    
-    data = [{
-        'message_id': msg.message_id,
-        'sender_hash': msg.sender_hash,
-        'recipient_hash': msg.recipient_hash,
-        'message_type': msg.message_type,
-        'content': msg.content,
-        'timestamp': msg.timestamp.isoformat(),
-    } for msg in messages]
-    
-    return JsonResponse({'messages': data})
+    """API endpoint for messages (newest first, cursor paginated)"""
+    try:
+        messages = _filter_messages(request, Message.objects.values(*MESSAGE_API_FIELDS))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return _api_list(request, 'messages', messages, 'timestamp', _message_json)
+
+
+@conditional('api_message_search', _table_version(counters.MESSAGES_VERSION))
+def api_message_search(request):
+    """
+    Message search (?q=), best match first, cursor paginated
+    
+    Takes the /api/messages/ filters, ?match=words|substring and
+    ?order=rank|recent (the order used is returned: very common words come
+    back newest first). Word searches accept "phrases", or and -exclusions.
+    """
+    try:
+        messages = _filter_messages(request, Message.objects.values(*MESSAGE_API_FIELDS))
+        rows, next_cursor, order = search.search_messages(
+            messages,
+            request.GET.get('q', ''),
+            mode=request.GET.get('match', 'words'),
+            order=request.GET.get('order', 'rank'),
+            cursor=request.GET.get('cursor'),
+            page_size=get_page_size(request),
+        )
+    except ValueError as e:  # Includes InvalidCursor
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    results = []
+    for row in rows:
+        result = _message_json(row)
+        if 'rank' in row:
+            result['rank'] = round(row['rank'], 6)
+        results.append(result)
+    return JsonResponse({'messages': results, 'order': order, 'next_cursor': next_cursor})
+
+
+def api_conditional_stats(request):
+    """How often each conditional read API answered 304 Not Modified"""
+    return JsonResponse({'views': get_conditional_stats()})
+
+
+def api_metrics(request):
+    """Per-view latency histograms, query counts and response sizes (see metrics.py)"""
+    return JsonResponse({
+        'sample_rate': settings.MESHCORE_METRICS_SAMPLE_RATE,
+        'slow_request_ms': settings.MESHCORE_SLOW_REQUEST_MS,
+        'views': metrics.get_stats(),
+    })
+
+
+def api_packets(request):
+    """API endpoint for raw packets (newest first, cursor paginated)"""
+    packets = Packet.objects.values(*PACKET_API_FIELDS)
+    
+    payload_type = request.GET.get('type')
+    if payload_type:
+        packets = packets.filter(payload_type=payload_type)
+    
+    route_type = request.GET.get('route_type')
+    if route_type:
+        packets = packets.filter(route_type=route_type)
+    
+    try:
+        packets = packets.filter(**_api_time_range(request, 'received_at'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return _api_list(request, 'packets', packets, 'received_at', _packet_json)
+
+
+def api_export(request, dataset):
+    """
+    Bulk export of messages or packets, oldest first
+    
+    ?format= (ndjson, csv, parquet), ?since= / ?until= (ISO 8601) and the
+    dataset's filters (messages: type, sender_hash, recipient_hash, channel;
+    packets: type, route_type). The export is streamed as it is produced.
+    """
+    if dataset not in export.DATASETS:
+        return JsonResponse({'error': f"Unknown dataset: {dataset}"}, status=404)
+    
+    fmt = request.GET.get('format', 'ndjson')
+    filters = {name: request.GET[name] for name in export.DATASETS[dataset]['filters'] if request.GET.get(name)}
+    try:
+        time_range = _api_time_range(request, 'time')
+        queryset = export.export_queryset(
+            dataset, since=time_range.get('time__gte'), until=time_range.get('time__lt'), filters=filters
+        )
+        stream = export.ExportStream(dataset, queryset, fmt)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Async iteration under ASGI; Django would buffer a sync iterator whole
+    content = stream if isinstance(request, ASGIRequest) else iter(stream)
+    response = StreamingHttpResponse(content, content_type=export.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="meshcore-{dataset}.{fmt}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 def flasher(request):
@@ -1,22 +1,45 @@
 """
 Configuration Management Views and APIs
 """
+import asyncio
 import json
 import logging
-from django.http import JsonResponse
+from functools import wraps
+import redis
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from .models import BridgeConfiguration
+from . import bridge_logs
+from .conditional import conditional
 
 logger = logging.getLogger(__name__)
 
 
-@require_http_methods(['POST'])
-@csrf_exempt
-def test_mqtt_connection(request):
+def _async_post(view):
+    """
+    require_http_methods(['POST']) and csrf_exempt for an async view
+
+    Django 4.2's decorators only wrap sync views.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        return await view(request, *args, **kwargs)
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+@_async_post
+async def test_mqtt_connection(request):
     """
     Test MQTT broker connection
+    
+    Async, so waiting for the broker does not hold a worker thread.
     """
     try:
         data = json.loads(request.body)
@@ -50,28 +73,27 @@ def test_mqtt_connection(request):
             if username and password:
                 client.username_pw_set(username, password)
             
-            # Set timeout
-            client.connect(broker, port, keepalive=5)
+            # Set timeout (the socket connect blocks, so it runs in a thread)
+            await sync_to_async(client.connect, thread_sensitive=False)(broker, port, keepalive=5)
             client.loop_start()
             
             # Wait up to 5 seconds for connection
-            import time
             for _ in range(50):  # 5 seconds total
                 if test_result['connected'] or test_result['error']:
                     break
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
             
-            client.loop_stop()
+            await sync_to_async(client.loop_stop, thread_sensitive=False)()
             client.disconnect()
             
             if test_result['connected']:
                 # Update configuration
-                config = BridgeConfiguration.objects.first()
+                config = await BridgeConfiguration.objects.afirst()
                 if config:
                     config.mqtt_connected = True
                     config.mqtt_last_test = timezone.now()
                     config.mqtt_last_error = ''
-                    config.save()
+                    await config.asave()
                 
                 return JsonResponse({
                     'success': True,
@@ -102,11 +124,12 @@ def test_mqtt_connection(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
-@require_http_methods(['POST'])
-@csrf_exempt
-def test_serial_connection(request):
+@_async_post
+async def test_serial_connection(request):
     """
     Test serial port connection
+    
+    Async, so a slow port open does not hold a worker thread.
     """
     try:
         data = json.loads(request.body)
@@ -125,7 +148,7 @@ def test_serial_connection(request):
             import serial
             
             # Try to open the port
-            ser = serial.Serial(
+            ser = await sync_to_async(serial.Serial, thread_sensitive=False)(
                 port=port,
                 baudrate=baudrate,
                 timeout=1.0,
@@ -138,12 +161,12 @@ def test_serial_connection(request):
                 ser.close()
                 
                 # Update configuration
-                config = BridgeConfiguration.objects.first()
+                config = await BridgeConfiguration.objects.afirst()
                 if config:
                     config.serial_connected = True
                     config.serial_last_test = timezone.now()
                     config.serial_last_error = ''
-                    config.save()
+                    await config.asave()
                 
                 return JsonResponse({
                     'success': True,
@@ -164,12 +187,12 @@ def test_serial_connection(request):
             error_msg = str(e)
             
             # Update configuration with error
-            config = BridgeConfiguration.objects.first()
+            config = await BridgeConfiguration.objects.afirst()
             if config:
                 config.serial_connected = False
                 config.serial_last_test = timezone.now()
                 config.serial_last_error = error_msg
-                config.save()
+                await config.asave()
             
             return JsonResponse({
                 'success': False,
@@ -265,7 +288,16 @@ def save_configuration(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+def _configuration_version(request):
+    # The bridge updates the connection flags without touching updated_at,
+    # so they are part of the marker and Last-Modified isn't used
+    return BridgeConfiguration.objects.order_by('pk').values_list(
+        'pk', 'updated_at', 'mqtt_connected', 'serial_connected'
+    ).first(), None
+
+
 @require_http_methods(['GET'])
+@conditional('get_configuration', _configuration_version)
 def get_configuration(request):
     """
     Get current bridge configuration
@@ -315,11 +347,10 @@ def reload_bridge_config(request):
     Signal the bridge service to reload configuration from database
     """
     try:
-        # Update bridge status to trigger config reload
-        from .models import BridgeStatus
-        bridge_status = BridgeStatus.objects.first()
-        if bridge_status:
-            bridge_status.save()  # This will trigger updated_at
+        # Wake the bridge's LISTEN connection so it reloads immediately
+        from .signals import notify_bridge_config_changed
+        config = BridgeConfiguration.objects.first()
+        notify_bridge_config_changed(config.pk if config else None)
         
         return JsonResponse({
             'success': True,
@@ -335,39 +366,51 @@ def reload_bridge_config(request):
 def get_bridge_logs(request):
     """
     Get recent bridge logs
-    """
-    try:
-        import subprocess
-        
-        # Get logs from bridge container
-        result = subprocess.run(
-            ['docker', 'logs', '--tail', '50', 'meshcore-bridge'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        logs = result.stdout + result.stderr
-        
-        return JsonResponse({
-            'success': True,
-            'logs': logs
-        })
     
-    except subprocess.TimeoutExpired:
-        return JsonResponse({
-            'success': False,
-            'error': 'Timeout getting logs'
-        })
-    except FileNotFoundError:
-        return JsonResponse({
-            'success': False,
-            'error': 'Docker command not found. Logs unavailable from web interface.'
-        })
-    except Exception as e:
-        logger.error(f'Error getting bridge logs: {e}', exc_info=True)
+    Returns the last records, or with ?since=<seq> only the records after
+    that sequence number; pass back `last_seq` on the next poll.
+    """
+    if not bridge_logs.enabled():
         return JsonResponse({
             'success': False,
-            'error': str(e),
-            'logs': 'Error fetching logs. Check docker logs meshcore-bridge manually.'
-        })
+            'error': 'Bridge logs need Redis (REDIS_URL is not set)'
+        }, status=503)
+    
+    try:
+        since = request.GET.get('since')
+        since = int(since) if since not in (None, '') else None
+        limit = int(request.GET.get('limit', 0)) or None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'since and limit must be integers'}, status=400)
+    
+    try:
+        records = bridge_logs.read(since, limit)
+    except redis.RedisError as e:
+        logger.error(f'Error getting bridge logs: {e}')
+        return JsonResponse({'success': False, 'error': str(e)}, status=503)
+    
+    return JsonResponse({
+        'success': True,
+        'records': records,
+        'last_seq': records[-1]['seq'] if records else since,
+    })
+
+
+async def stream_bridge_logs(request):
+    """
+    Server-Sent Events feed of new bridge log records
+    
+    Resumes after Last-Event-ID (or ?since=). Needs the ASGI server.
+    """
+    if not bridge_logs.enabled():
+        return JsonResponse({'error': 'Bridge logs need Redis (REDIS_URL is not set)'}, status=503)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Log streaming requires the ASGI server'}, status=503)
+    
+    since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    since = int(since) if since and since.isdigit() else None
+    
+    response = StreamingHttpResponse(bridge_logs.tail(since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -6,12 +6,28 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.http import require_http_methods
 from django.core.files.base import ContentFile
+from django.db import transaction
 from .models import Node
 from .models_multimedia import MediaFile, MediaGallery, MultiPartPacket
+from . import multipart
+from .tasks import process_media
+import logging
 import uuid
 import json
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+
+def _queue_processing(media_file):
+    """Compress the upload in the background (Celery media queue) once it is committed"""
+    def enqueue():
+        try:
+            process_media.delay(media_file.pk)
+        except Exception as e:
+            logger.warning(f"Could not queue processing of media file {media_file.file_id}: {e}")
+    transaction.on_commit(enqueue)
+
 
 def media_gallery(request):
     """Media gallery view showing all images and voice messages"""
@@ -73,6 +89,7 @@ def upload_image(request):
         status='uploading',
         original_file=image_file,
     )
+    _queue_processing(media_file)
     
     return JsonResponse({
         'success': True,
@@ -124,6 +141,7 @@ def upload_voice(request):
         original_file=voice_file,
         metadata={'duration': float(duration)},
     )
+    _queue_processing(media_file)
     
     return JsonResponse({
         'success': True,
@@ -152,17 +170,30 @@ def send_media(request, file_id):
     """Trigger sending of a media file"""
     media_file = get_object_or_404(MediaFile, file_id=file_id)
     
+    # Only send once compression has finished, never the raw upload
+    if media_file.status != 'ready' and not media_file.compressed_file:
+        return JsonResponse({
+            'error': f'Media file is {media_file.status}, not ready to send',
+            'status': media_file.status,
+        }, status=409)
+    
+    # Fix the chunk count; the chunks are read from the file by offset
+    # (multipart.outgoing_payloads) when the transfer is sent. Nothing in
+    # the bridge transmits them yet.
+    try:
+        total_packets = multipart.prepare_transfer(media_file)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
     # Update status to sending
     media_file.status = 'sending'
-    media_file.save()
-    
-    # TODO: Trigger bridge to start sending packets
-    # This would be handled by the bridge application
+    media_file.save(update_fields=['status'])
     
     return JsonResponse({
         'success': True,
         'file_id': file_id,
         'status': 'sending',
+        'total_packets': total_packets,
     })
 
 
@@ -178,6 +209,7 @@ def delete_media(request, file_id):
         media_file.compressed_file.delete()
     if media_file.thumbnail:
         media_file.thumbnail.delete()
+    multipart.discard_transfer(media_file)
     
     media_file.delete()
     
@@ -195,6 +227,8 @@ def api_media_status(request, file_id):
         'progress': media_file.progress,
         'total_packets': media_file.total_packets,
         'received_packets': media_file.received_packets,
+        'original_size': media_file.original_size,
+        'compressed_size': media_file.compressed_size,
     })
 
 
@@ -13,6 +13,9 @@ echo "PostgreSQL started"
 echo "Running migrations..."
 python manage.py migrate --noinput
 
+echo "Ensuring upcoming table partitions exist..."
+python manage.py manage_partitions --no-drop || true
+
 echo "Creating superuser if not exists..."
 python manage.py shell << END
 from django.contrib.auth import get_user_model
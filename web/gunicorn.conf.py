@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for the web containers
+
+The web service serves the WSGI application with sync workers and
+persistent database connections, which is the fastest setup for the
+polling APIs and pages. The web-async service serves the ASGI application
+(WEB_APP=valentia_backend.asgi:application,
+WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker) for the long-lived and slow
+endpoints only: live feeds, exports and connection tests wait on Redis, the
+database, brokers and serial ports without tying up a worker. nginx.conf
+routes between the two; `manage.py loadtest` measures either.
+"""
+import os
+
+wsgi_app = os.environ.get('WEB_APP', 'valentia_backend.wsgi:application')
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('WEB_WORKERS', 3))
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+
+# Uvicorn workers heartbeat from their event loop, so under ASGI this only
+# catches a blocked loop, not long-lived SSE streams
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
@@ -1 +1,6 @@
-# Local demo - no Celery required
+# Load the Celery app so tasks queued from views (media processing) use the
+# configured broker and routes. Without a broker the local demo still runs;
+# those tasks just can't be queued.
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
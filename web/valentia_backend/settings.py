@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import dj_database_url
+from celery.schedules import crontab
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -78,6 +79,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'apps.meshcore.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -106,12 +108,14 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'valentia_backend.wsgi.application'
+ASGI_APPLICATION = 'valentia_backend.asgi.application'
 
 # Database
 DATABASES = {
     'default': dj_database_url.config(
         default=f'postgresql://meshtastic:meshtastic@db:5432/meshtastic',
-        conn_max_age=600
+        # Set DB_CONN_MAX_AGE=0 under ASGI, where persistent connections are per-request threads
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '600'))
     )
 }
 
@@ -138,6 +142,17 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Partially received multipart transfers (sparse data file and chunk bitmap each)
+MESHCORE_TRANSFER_DIR = MEDIA_ROOT / 'transfers'
+
+# Cache: Redis when available, so counters and cached data are shared by all workers
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -151,6 +166,95 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+# Media compression is CPU-heavy and runs on its own queue, served by the
+# celery-media worker with a small fixed pool (see docker-compose.yml)
+CELERY_TASK_ROUTES = {
+    'apps.meshcore.tasks.process_media': {'queue': 'media'},
+}
+CELERY_BEAT_SCHEDULE = {
+    'meshcore-maintain-partitions': {
+        'task': 'apps.meshcore.tasks.maintain_partitions',
+        'schedule': crontab(minute=5),  # Hourly
+    },
+    'meshcore-rollup-node-stats': {
+        'task': 'apps.meshcore.tasks.rollup_node_stats',
+        'schedule': 300.0,  # Every 5 minutes
+    },
+    'meshcore-mark-stale-nodes-offline': {
+        'task': 'apps.meshcore.tasks.mark_stale_nodes_offline',
+        'schedule': 60.0,  # Every minute
+    },
+    'meshcore-reassemble-multipart': {
+        'task': 'apps.meshcore.tasks.reassemble_multipart',
+        'schedule': 15.0,  # Every 15 seconds
+    },
+    'meshcore-reconcile-counters': {
+        'task': 'apps.meshcore.tasks.reconcile_counters',
+        'schedule': crontab(hour=3, minute=30),  # Daily
+    },
+}
+
+# JSON API cursor pagination (?limit= is capped at the maximum)
+MESHCORE_API_PAGE_SIZE = int(os.environ.get('MESHCORE_API_PAGE_SIZE', '50'))
+MESHCORE_API_MAX_PAGE_SIZE = int(os.environ.get('MESHCORE_API_MAX_PAGE_SIZE', '500'))
+# Rows fetched per server-side cursor round trip for ?stream=1 responses
+MESHCORE_API_STREAM_CHUNK_SIZE = int(os.environ.get('MESHCORE_API_STREAM_CHUNK_SIZE', '2000'))
+# Message searches with more matches than this are returned newest first instead of ranked
+MESHCORE_SEARCH_RANK_WINDOW = int(os.environ.get('MESHCORE_SEARCH_RANK_WINDOW', '10000'))
+
+# Request metrics (see apps/meshcore/metrics.py): share of requests whose SQL
+# queries are counted and timed (every request is timed), and the threshold
+# for the slow request log (logs/slow_requests.log)
+MESHCORE_METRICS_SAMPLE_RATE = float(os.environ.get('MESHCORE_METRICS_SAMPLE_RATE', '1.0' if DEBUG else '0.1'))
+MESHCORE_SLOW_REQUEST_MS = int(os.environ.get('MESHCORE_SLOW_REQUEST_MS', '1000'))
+
+# Node chart series (see apps/meshcore/series.py): default and maximum points per
+# series, and how long results for ranges reaching the present are cached
+MESHCORE_SERIES_POINTS = 500
+MESHCORE_SERIES_MAX_POINTS = 5000
+MESHCORE_SERIES_CACHE_SECONDS = 60
+
+# Media compression for mesh transfers (see apps/meshcore/media.py): byte budget
+# and maximum size of compressed images, voice bitrate (bits/s), and the ffmpeg
+# binary and time limit used for voice
+MESHCORE_MEDIA_IMAGE_BUDGET = int(os.environ.get('MESHCORE_MEDIA_IMAGE_BUDGET', '12000'))
+MESHCORE_MEDIA_IMAGE_MAX_DIMENSION = int(os.environ.get('MESHCORE_MEDIA_IMAGE_MAX_DIMENSION', '320'))
+MESHCORE_MEDIA_VOICE_BITRATE = int(os.environ.get('MESHCORE_MEDIA_VOICE_BITRATE', '6000'))
+MESHCORE_MEDIA_FFMPEG = os.environ.get('MESHCORE_MEDIA_FFMPEG', 'ffmpeg')
+MESHCORE_MEDIA_TIMEOUT = 120
+
+# Radio parameters for airtime estimates (see apps/meshcore/transfer.py): LoRa
+# spreading factor, bandwidth (Hz), coding rate (4/N), the duty cycle limit and
+# the period it is averaged over (s), and the typical forwarding delay per hop (s)
+MESHCORE_LORA_SPREADING_FACTOR = int(os.environ.get('MESHCORE_LORA_SPREADING_FACTOR', '10'))
+MESHCORE_LORA_BANDWIDTH = int(os.environ.get('MESHCORE_LORA_BANDWIDTH', '250000'))
+MESHCORE_LORA_CODING_RATE = int(os.environ.get('MESHCORE_LORA_CODING_RATE', '5'))
+MESHCORE_LORA_DUTY_CYCLE = float(os.environ.get('MESHCORE_LORA_DUTY_CYCLE', '0.1'))
+MESHCORE_LORA_DUTY_CYCLE_PERIOD = 3600
+MESHCORE_LORA_HOP_DELAY = 0.5
+# Multipart receivers send a selective NACK after this many chunks, or once
+# chunks stop arriving for this many seconds
+MESHCORE_TRANSFER_NACK_EVERY = 8
+MESHCORE_TRANSFER_NACK_IDLE = 10
+
+# Live feed (Server-Sent Events over Redis pub/sub, see apps/meshcore/live.py)
+# Served by the ASGI application; empty URL disables it
+MESHCORE_LIVE_REDIS_URL = os.environ.get('REDIS_URL', '')
+MESHCORE_LIVE_STREAM_LENGTH = 1000  # Events kept for Last-Event-ID resume
+MESHCORE_LIVE_QUEUE_SIZE = 256  # Per-client backlog before a slow client is disconnected
+MESHCORE_LIVE_HEARTBEAT_SECONDS = 15
+MESHCORE_LIVE_MAX_SECONDS = 300  # Streams are recycled; EventSource reconnects and resumes
+MESHCORE_LIVE_RETRY_MS = 3000
+# Bridge log viewer: records returned without ?since=, and the cap per request
+MESHCORE_BRIDGE_LOGS_TAIL = 50
+MESHCORE_BRIDGE_LOGS_MAX = 500
+
+# Time-partitioned tables (PostgreSQL only, see apps/meshcore/partitions.py)
+MESHCORE_PARTITION_DAYS_AHEAD = int(os.environ.get('MESHCORE_PARTITION_DAYS_AHEAD', '14'))
+MESHCORE_PARTITION_RETENTION_DAYS = {
+    'meshcore_packet': int(os.environ.get('PACKET_RETENTION_DAYS', '30')),
+    'meshcore_nodestats': int(os.environ.get('NODESTATS_RETENTION_DAYS', '90')),
+}
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = DEBUG
@@ -181,6 +285,17 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'logs' / 'django.log',
         },
+        'slow_requests': {
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'logs' / 'slow_requests.log',
+        },
+    },
+    'loggers': {
+        'apps.meshcore.slow_requests': {
+            'handlers': ['console', 'slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console', 'file'],